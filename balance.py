@@ -0,0 +1,366 @@
+"""Monte Carlo balance runs: large populations of cafes played by scripted owners.
+
+    python balance.py --cafes 100000 --hours 336
+    python balance.py --strategy expand --grid 'INTERNET_COSTS=[[60,140,260],[40,100,200]]' \\
+        --grid 'BREAK_CHANCE=[0.08,0.12]' --grid 'SHOP_ITEMS.pro_pc.cost=[260,320]' --output sweep.json
+
+Every cafe starts from ``BASE_STATE`` and lives through ``--hours`` of the
+real ``apply_hour``. In the hours its owner is online (``--online``) they
+go through their strategy's steps with the same ``PLAYER_ACTIONS`` and shop
+purchases the panel buttons run, each step only once the cash is above its
+threshold. A cafe goes bankrupt once unpaid bills keep it locked for
+``--bankrupt-hours`` in a row.
+
+Each combination of ``--grid`` values and strategy is one population. Its
+cafes are split into batches that run over a process pool, and a line of
+statistics is printed as each population finishes: bankruptcy rate, hours
+until the cafe first has ``--target-pcs`` PCs and the final cash. The
+whole report is written as JSON with ``--output``.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from copy import deepcopy
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import game
+import storage
+
+# Strategy steps are ``(action, minimum cash)``; ``shop:<item>`` buys from the shop.
+STRATEGIES: Dict[str, Tuple[Tuple[str, int], ...]] = {
+    # Keeps the doors open and the bills paid, nothing more.
+    "idle": (("pay_bills", 0), ("open_cafe", 0), ("accept_customers", 0)),
+    # Every spare coin goes into more PCs.
+    "expand": (
+        ("pay_bills", 0),
+        ("open_cafe", 0),
+        ("repair_pc", 40),
+        ("buy_pc", 0),
+        ("accept_customers", 0),
+    ),
+    # Upgrades and staff before growth, with a cushion for the bills.
+    "steady": (
+        ("pay_bills", 0),
+        ("open_cafe", 0),
+        ("repair_pc", 40),
+        ("kick_angry", 0),
+        ("ban_suspicious", 0),
+        ("bribe_staff", 200),
+        ("upgrade_internet", 300),
+        ("upgrade_electric", 300),
+        ("assign_tech", 0),
+        ("hire_staff", 600),
+        ("buy_pc", 250),
+        ("clean_cafe", 150),
+        ("accept_customers", 0),
+    ),
+    # Spends on the shop rather than the panel upgrades.
+    "shopper": (
+        ("pay_bills", 0),
+        ("open_cafe", 0),
+        ("repair_pc", 40),
+        ("shop:coffee", 250),
+        ("shop:pro_pc", 400),
+        ("shop:decor", 300),
+        ("shop:camera", 500),
+        ("accept_customers", 0),
+    ),
+}
+
+# Module constants of ``game`` a grid may change, with dotted paths into them.
+TUNABLES = (
+    "BASE_STATE",
+    "SHOP_ITEMS",
+    "INTERNET_COSTS",
+    "ELECTRICITY_COSTS",
+    "INCOME_PER_CUSTOMER",
+    "CUSTOMER_DURATION",
+    "OVERHEAT_CHANCE",
+    "BREAK_CHANCE",
+    "BREAK_CHANCE_PER_HEAT",
+    "VIRUS_CHANCE",
+    "VIRUS_OUTBREAK_LEVEL",
+    "VIRUS_BREAK_CHANCE",
+)
+DEFAULTS = {name: deepcopy(getattr(game, name)) for name in TUNABLES}
+
+# Upper bounds of the final cash histogram; percentiles are read off it.
+CASH_BUCKETS = (0, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, float("inf"))
+
+
+# --------------- PARAMETERS ---------------
+def parse_grid(specs: List[str]) -> Dict[str, list]:
+    """``NAME=[v1, v2, ...]`` per spec, values as JSON."""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name.split(".")[0] not in TUNABLES:
+            raise RuntimeError(f"{name} is not tunable; pick one of {', '.join(TUNABLES)}.")
+        try:
+            values = json.loads(values)
+        except ValueError as exc:
+            raise RuntimeError(f"Grid values for {name} are not valid JSON: {exc}") from exc
+        if not isinstance(values, list) or not values:
+            raise RuntimeError(f"Grid values for {name} must be a non-empty JSON list.")
+        lookup(DEFAULTS, name)
+        grid[name] = values
+    return grid
+
+
+def grid_points(grid: Dict[str, list]) -> List[Dict[str, object]]:
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def lookup(root: dict, path: str):
+    node = root
+    for key in path.split("."):
+        if not isinstance(node, dict) or key not in node:
+            raise RuntimeError(f"{path} does not name a value in the game constants.")
+        node = node[key]
+    return node
+
+
+def configure(overrides: Dict[str, object]) -> None:
+    """Reset the tunable game constants, then apply ``overrides`` on top."""
+    values = deepcopy(DEFAULTS)
+    for path, value in overrides.items():
+        *parents, key = path.split(".")
+        if parents:
+            lookup(values, ".".join(parents))[key] = value
+        else:
+            values[key] = value
+    for name, value in values.items():
+        setattr(game, name, value)
+    game.CUSTOMER_KINDS, game.CUSTOMER_CUM_WEIGHTS = game.customer_kinds()
+
+
+def strategy_steps(name: str) -> List[Tuple[Callable[[dict], Optional[str]], int]]:
+    steps = []
+    for action, minimum in STRATEGIES[name]:
+        if action.startswith("shop:"):
+            steps.append((partial(game.buy_shop_item, choice=action[5:]), minimum))
+        else:
+            steps.append((game.PLAYER_ACTIONS[action], minimum))
+    return steps
+
+
+# --------------- SIMULATION ---------------
+def empty_stats(hours: int) -> dict:
+    return {
+        "cafes": 0,
+        "bankrupt": 0,
+        "reached_target": 0,
+        "cash_total": 0.0,
+        "pcs_total": 0,
+        # Per hour: cafes that went bankrupt / first reached the target then.
+        "bankrupt_hours": [0] * (hours + 1),
+        "target_hours": [0] * (hours + 1),
+        "cash": [0] * len(CASH_BUCKETS),
+    }
+
+
+def merge_stats(total: dict, part: dict) -> None:
+    for key, value in part.items():
+        if isinstance(value, list):
+            total[key] = [a + b for a, b in zip(total[key], value)]
+        else:
+            total[key] += value
+
+
+def simulate_batch(task: dict) -> Tuple[int, dict]:
+    """Play ``task["cafes"]`` cafes through ``task["hours"]`` hours and return their statistics."""
+    configure(task["overrides"])
+    try:
+        return play_batch(task)
+    finally:
+        # Without a pool the batches run in this process; leave ``game`` as it was imported.
+        configure({})
+
+
+def play_batch(task: dict) -> Tuple[int, dict]:
+    random.seed(task["seed"])
+    steps = strategy_steps(task["strategy"])
+    hours, online, target = task["hours"], task["online"], task["target_pcs"]
+    bankrupt_after = task["bankrupt_hours"]
+    stats = empty_stats(hours)
+    apply_hour = game.apply_hour
+    for _ in range(task["cafes"]):
+        state = storage.snapshot(game.BASE_STATE)
+        state["last_tick"] = game.HOUR_SECONDS
+        locked = 0
+        reached = False
+        for hour in range(1, hours + 1):
+            if random.random() < online:
+                for action, minimum in steps:
+                    if state["cash"] >= minimum:
+                        action(state)
+            apply_hour(state)
+            if not reached and state["pcs"] >= target:
+                reached = True
+                stats["reached_target"] += 1
+                stats["target_hours"][hour] += 1
+            if not state["is_open"] and state["bills"] > state["cash"]:
+                locked += 1
+                if locked >= bankrupt_after:
+                    stats["bankrupt"] += 1
+                    stats["bankrupt_hours"][hour] += 1
+                    break
+            else:
+                locked = 0
+        stats["cafes"] += 1
+        stats["cash_total"] += state["cash"]
+        stats["pcs_total"] += state["pcs"]
+        stats["cash"][next(index for index, bound in enumerate(CASH_BUCKETS) if state["cash"] <= bound)] += 1
+    return task["population"], stats
+
+
+def hour_percentile(counts: List[int], q: float) -> Optional[int]:
+    """The hour by which a fraction ``q`` of the counted cafes had got there."""
+    total = sum(counts)
+    if not total:
+        return None
+    running = 0
+    for hour, count in enumerate(counts):
+        running += count
+        if running >= q * total:
+            return hour
+    return len(counts) - 1
+
+
+def cash_percentile(counts: List[int], q: float) -> float:
+    """Upper bound of the cash bucket holding the ``q`` quantile."""
+    total = sum(counts)
+    running = 0
+    for bound, count in zip(CASH_BUCKETS, counts):
+        running += count
+        if running >= q * total:
+            return bound
+    return CASH_BUCKETS[-1]
+
+
+def summarize(population: dict, stats: dict) -> dict:
+    cafes = stats["cafes"]
+    return {
+        "strategy": population["strategy"],
+        "overrides": population["overrides"],
+        "cafes": cafes,
+        "bankruptcy_rate": stats["bankrupt"] / cafes,
+        "bankrupt_hour_p50": hour_percentile(stats["bankrupt_hours"], 0.5),
+        "target_rate": stats["reached_target"] / cafes,
+        "target_hour_p10": hour_percentile(stats["target_hours"], 0.1),
+        "target_hour_p50": hour_percentile(stats["target_hours"], 0.5),
+        "target_hour_p90": hour_percentile(stats["target_hours"], 0.9),
+        "cash_mean": stats["cash_total"] / cafes,
+        "cash_p10": cash_percentile(stats["cash"], 0.1),
+        "cash_p50": cash_percentile(stats["cash"], 0.5),
+        "cash_p90": cash_percentile(stats["cash"], 0.9),
+        "pcs_mean": stats["pcs_total"] / cafes,
+        "cash_histogram": {format_bound(bound): count for bound, count in zip(CASH_BUCKETS, stats["cash"])},
+    }
+
+
+def format_bound(bound: float) -> str:
+    return "inf" if bound == float("inf") else str(int(bound))
+
+
+def describe(summary: dict) -> str:
+    overrides = " ".join(f"{name}={json.dumps(value)}" for name, value in summary["overrides"].items())
+    target = summary["target_hour_p50"]
+    return (
+        f"{summary['strategy']:8} bankrupt {summary['bankruptcy_rate']:6.1%}  "
+        f"target {summary['target_rate']:6.1%} p50 {'-' if target is None else f'{target}h':>5}  "
+        f"cash p10/p50/p90 {format_bound(summary['cash_p10'])}/{format_bound(summary['cash_p50'])}/"
+        f"{format_bound(summary['cash_p90'])}  {overrides}"
+    ).rstrip()
+
+
+# --------------- RUN ---------------
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cafes", type=int, default=20000, help="cafes per population")
+    parser.add_argument("--hours", type=int, default=7 * 24, help="hours each cafe is played")
+    parser.add_argument("--strategy", default="all", help=f"comma-separated, from {', '.join(STRATEGIES)}, or all")
+    parser.add_argument("--grid", action="append", default=[], help="NAME=[values...] to sweep, repeatable")
+    parser.add_argument("--online", type=float, default=0.5, help="chance the owner acts in a given hour")
+    parser.add_argument("--target-pcs", type=int, default=5, help="PC count the time-to-target statistic waits for")
+    parser.add_argument("--bankrupt-hours", type=int, default=24, help="hours locked by bills before bankruptcy")
+    parser.add_argument("--batch", type=int, default=1000, help="cafes per pool task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    strategies = list(STRATEGIES) if args.strategy == "all" else args.strategy.split(",")
+    unknown = [name for name in strategies if name not in STRATEGIES]
+    if unknown:
+        raise RuntimeError(f"Unknown strategies {unknown}; pick from {', '.join(STRATEGIES)}.")
+    grid = parse_grid(args.grid)
+    populations = [
+        {"strategy": strategy, "overrides": overrides}
+        for overrides in grid_points(grid)
+        for strategy in strategies
+    ]
+    tasks = []
+    for index, population in enumerate(populations):
+        for first in range(0, args.cafes, args.batch):
+            tasks.append(
+                {
+                    "population": index,
+                    "strategy": population["strategy"],
+                    "overrides": population["overrides"],
+                    "cafes": min(args.batch, args.cafes - first),
+                    "hours": args.hours,
+                    "online": args.online,
+                    "target_pcs": args.target_pcs,
+                    "bankrupt_hours": args.bankrupt_hours,
+                    "seed": f"{args.seed}:{index}:{first}",
+                }
+            )
+    print(f"{len(populations)} populations of {args.cafes} cafes, {len(tasks)} batches on {args.workers} workers")
+
+    totals = [empty_stats(args.hours) for _ in populations]
+    summaries: List[Optional[dict]] = [None] * len(populations)
+    started = time.perf_counter()
+    pool = multiprocessing.get_context("spawn").Pool(args.workers) if args.workers > 1 else None
+    try:
+        results = pool.imap_unordered(simulate_batch, tasks) if pool else map(simulate_batch, tasks)
+        for index, stats in results:
+            merge_stats(totals[index], stats)
+            if totals[index]["cafes"] == args.cafes:
+                summaries[index] = summarize(populations[index], totals[index])
+                print(describe(summaries[index]), flush=True)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    elapsed = time.perf_counter() - started
+    simulated = len(populations) * args.cafes
+    print(f"{simulated} cafes in {elapsed:.1f}s, {simulated * args.hours / elapsed:,.0f} cafe-hours/s")
+
+    if args.output:
+        report = {
+            "cafes": args.cafes,
+            "hours": args.hours,
+            "online": args.online,
+            "target_pcs": args.target_pcs,
+            "bankrupt_hours": args.bankrupt_hours,
+            "seed": args.seed,
+            "grid": grid,
+            "elapsed_sec": elapsed,
+            "populations": summaries,
+        }
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
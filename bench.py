@@ -0,0 +1,333 @@
+"""Headless benchmarks for the game core, the panel and the state backends.
+
+    python bench.py --sizes 1000,10000 --output bench.json
+    python bench.py --baseline bench.json --threshold 0.2
+
+Results are written as JSON: one number per metric, with ``higher`` telling
+which direction is better. Given a baseline from another commit, any metric
+that got worse by more than ``--threshold`` (a fraction) is reported and the
+exit status is 1.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import deepcopy
+from typing import Callable, Dict, List, Tuple
+
+import game
+import leaderboard
+import storage
+from panel_cache import PanelCache
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+DEFAULT_SIZES = "1000,10000,100000"
+# Fixed-cost operations are timed on this many cafes whatever the size.
+SAMPLE = 2000
+WRITE_BATCH = 256
+# Simulated churn for the panel cache: new players per hour, players active
+# at once, and panel lookups per hour.
+CHURN_ARRIVALS = 200
+CHURN_ACTIVE = 3000
+CHURN_LOOKUPS = 2000
+# The cache's TTL is in wall-clock seconds, unlike the game's short hours.
+CHURN_HOUR_SECONDS = 3600
+LEADERBOARD_SIZE = 1_000_000
+LEADERBOARD_QUERIES = 20000
+
+
+class FakeUser:
+    id = 1
+    mention = "<@1>"
+    display_name = "bench"
+
+
+# --------------- SYNTHETIC CAFES ---------------
+def synthetic_cafe(rng: random.Random, now: float) -> dict:
+    state = storage.snapshot(game.BASE_STATE)
+    state["pcs"] = rng.randint(1, 12)
+    state["broken_pcs"] = rng.randint(0, state["pcs"] // 3)
+    state["cash"] = rng.randint(0, 2000)
+    state["bills"] = rng.randint(0, 400)
+    state["internet_level"] = rng.randint(0, 2)
+    state["electricity_level"] = rng.randint(0, 2)
+    state["is_open"] = rng.random() < 0.7
+    state["reputation"] = round(rng.uniform(0.5, 5.0), 2)
+    for key in ("lazy", "corrupt", "skilled", "technicians"):
+        state["staff"][key] = rng.randint(0, 2)
+    state["staff"]["total"] = sum(state["staff"][key] for key in ("lazy", "corrupt", "skilled", "technicians"))
+    state["alerts"]["viruses"] = rng.randint(0, 10)
+    state["panel_message_id"] = rng.getrandbits(60)
+    state["panel_channel_id"] = rng.getrandbits(60)
+    state["last_tick"] = now - game.HOUR_SECONDS
+    state["last_active"] = now
+    if state["is_open"]:
+        game.spawn_customers(state, rng.randint(0, state["pcs"]))
+        game.add_profit(state, rng.randint(0, 50))
+    return state
+
+
+def synthetic_cafes(count: int, seed: int) -> Dict[str, dict]:
+    rng = random.Random(seed)
+    random.seed(seed)
+    now = time.time()
+    return {str(10**17 + index): synthetic_cafe(rng, now) for index in range(count)}
+
+
+def timed(fn: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# --------------- BENCHMARKS ---------------
+def bench_core(cafes: Dict[str, dict], results: Dict[str, dict]) -> None:
+    size = len(cafes)
+    states = deepcopy(list(cafes.values()))
+    elapsed = timed(lambda: [game.apply_hour(state) for state in states])
+    record(results, f"core.apply_hour.cafe_hours_per_sec@{size}", size / elapsed, higher=True)
+
+    states = deepcopy(list(cafes.values()))
+    hours = game.FAST_FORWARD_MIN_HOURS * 4
+    sample = states[:SAMPLE]
+    elapsed = timed(lambda: [game.tick_state("bench", state, hours) for state in sample])
+    record(results, f"core.tick_state_fast_forward.cafe_hours_per_sec@{size}", len(sample) * hours / elapsed, higher=True)
+
+    if np is not None:
+        import vector_engine
+
+        states = deepcopy(list(cafes.values()))
+        rng = np.random.default_rng(0)
+        elapsed = timed(lambda: vector_engine.advance(states, [6] * len(states), rng=rng))
+        record(results, f"core.vector_engine.cafe_hours_per_sec@{size}", size * 6 / elapsed, higher=True)
+
+
+def bench_fixed(cafes: Dict[str, dict], results: Dict[str, dict]) -> None:
+    import main
+
+    sample = list(cafes.values())[:SAMPLE]
+    states = deepcopy(sample)
+    for state in states:
+        state["customers"] = []
+        state["pcs"] = 12
+        state["broken_pcs"] = 0
+    elapsed = timed(lambda: [game.spawn_customers(state, 12) for state in states])
+    record(results, "core.spawn_customers.per_sec", len(states) / elapsed, higher=True)
+
+    user = FakeUser()
+    elapsed = timed(lambda: [main.build_panel_embed(user, state) for state in sample])
+    record(results, "panel.embed_builds_per_sec", len(sample) / elapsed, higher=True)
+
+    elapsed = timed(lambda: [main.button_mask(state) for state in sample])
+    record(results, "panel.button_masks_per_sec", len(sample) / elapsed, higher=True)
+
+    async def build_views() -> float:
+        masks = [main.button_mask(state) for state in sample[:200]]
+        return timed(lambda: [main.CafeView(mask) for mask in masks])
+
+    elapsed = asyncio.run(build_views())
+    record(results, "panel.view_builds_per_sec", 200 / elapsed, higher=True)
+
+
+def panel_cache_week(seed: int, cache_size: int = 4096) -> Tuple[PanelCache, List[int]]:
+    """A week of hourly lookups over a sliding window of players; returns the cache and its memory each day."""
+    rng = random.Random(seed)
+    clock = [0.0]
+    tracemalloc.start()
+    cache = PanelCache(cache_size, clock=lambda: clock[0])
+    resident = []
+    for hour in range(7 * 24):
+        clock[0] = hour * CHURN_HOUR_SECONDS
+        first = hour * CHURN_ARRIVALS
+        for _ in range(CHURN_LOOKUPS):
+            owner_id = first + rng.randrange(CHURN_ACTIVE)
+            if cache.get(owner_id) is None:
+                cache.put(owner_id, owner_id % 97, owner_id)
+        if hour % 24 == 23:
+            resident.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+    return cache, resident
+
+
+def bench_panel_cache(seed: int, results: Dict[str, dict]) -> None:
+    cache, resident = panel_cache_week(seed)
+    record(results, "panel.cache_resident_kib_after_week", resident[-1] / 1024, higher=False)
+    record(results, "panel.cache_growth_day1_to_day7", resident[-1] / resident[0], higher=False)
+    record(results, "panel.cache_hit_ratio", cache.stats()["hit_ratio"], higher=True)
+
+
+def bench_leaderboard(size: int, seed: int, results: Dict[str, dict]) -> None:
+    """Rebuild, tick-style updates and queries on a leaderboard of ``size`` cafes, per sorted list available."""
+    rng = random.Random(seed)
+    states = {
+        str(10**17 + index): {
+            "cash": rng.randint(0, 5000),
+            "reputation": rng.uniform(0.5, 5.0),
+            "pcs": rng.randint(1, 12),
+        }
+        for index in range(size)
+    }
+    elapsed = timed(lambda: sorted(states.items(), key=lambda item: -item[1]["cash"])[:10])
+    record(results, f"leaderboard.full_sort_sec@{size}", elapsed, higher=False)
+
+    kinds = [("buckets", leaderboard.BucketList)]
+    if leaderboard.SortedList is not None:
+        kinds.append(("sortedcontainers", leaderboard.SortedList))
+    user_ids = rng.sample(list(states), LEADERBOARD_QUERIES)
+    for kind, sorted_list in kinds:
+        board = leaderboard.Leaderboard()
+        board.sorted_list = sorted_list
+        elapsed = timed(lambda: board.rebuild(states.items()))
+        record(results, f"leaderboard.{kind}.rebuild_sec@{size}", elapsed, higher=False)
+
+        def tick() -> None:
+            for user_id in user_ids:
+                state = states[user_id]
+                state["cash"] += rng.randint(-30, 60)
+                board.update(int(user_id), state)
+
+        elapsed = timed(tick)
+        record(results, f"leaderboard.{kind}.updates_per_sec@{size}", len(user_ids) / elapsed, higher=True)
+        elapsed = timed(lambda: [board.top("cash", 10) for _ in range(1000)])
+        record(results, f"leaderboard.{kind}.top10_per_sec@{size}", 1000 / elapsed, higher=True)
+        elapsed = timed(lambda: [board.rank("cash", int(user_id)) for user_id in user_ids])
+        record(results, f"leaderboard.{kind}.ranks_per_sec@{size}", len(user_ids) / elapsed, higher=True)
+
+
+def bench_storage(cafes: Dict[str, dict], results: Dict[str, dict], workdir: str) -> None:
+    size = len(cafes)
+    for kind in storage.STATE_BACKENDS:
+        folder = tempfile.mkdtemp(dir=workdir)
+        paths = {
+            "data_file": os.path.join(folder, "data.json"),
+            "db_file": os.path.join(folder, "data.db"),
+            "pack_file": os.path.join(folder, "data.pack"),
+        }
+        backend = open_bench_backend(kind, paths)
+        backend.load()
+        backend.write(cafes)
+        backend.close()
+
+        backend = open_bench_backend(kind, paths)
+        loaded = {}
+        elapsed = timed(lambda: loaded.update(backend.load()))
+        record(results, f"storage.{kind}.load_sec@{size}", elapsed, higher=False)
+
+        user_ids = list(loaded)
+        latencies = []
+        for round_index in range(10):
+            batch = user_ids[round_index * WRITE_BATCH % size :][:WRITE_BATCH]
+            changes = {user_id: loaded[user_id] for user_id in batch}
+            started = time.perf_counter()
+            # Every backend's write returns once the batch is stored, SQLite's included.
+            backend.write(changes)
+            latencies.append(time.perf_counter() - started)
+        record(results, f"storage.{kind}.write_{WRITE_BATCH}_p50_sec@{size}", percentile(latencies, 0.5), higher=False)
+        record(results, f"storage.{kind}.write_{WRITE_BATCH}_p99_sec@{size}", percentile(latencies, 0.99), higher=False)
+        backend.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def open_bench_backend(kind: str, paths: Dict[str, str]):
+    return storage.open_backend(
+        kind, paths["data_file"], paths["db_file"], pack_file=paths["pack_file"], defaults=game.BASE_STATE
+    )
+
+
+def record(results: Dict[str, dict], name: str, value: float, higher: bool) -> None:
+    results[name] = {"value": value, "higher": higher}
+    print(f"{name:60} {value:14.4f}")
+
+
+# --------------- REPORT ---------------
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def regressions(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    found = []
+    for name, entry in results.items():
+        before = baseline.get(name)
+        if before is None or not before["value"]:
+            continue
+        change = (entry["value"] - before["value"]) / before["value"]
+        worse = -change if entry["higher"] else change
+        if worse > threshold:
+            found.append(f"{name}: {before['value']:.4f} -> {entry['value']:.4f} ({worse:.0%} worse)")
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated cafe counts")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown as a fraction")
+    parser.add_argument("--skip-storage", action="store_true")
+    parser.add_argument("--leaderboard-size", type=int, default=LEADERBOARD_SIZE, help="cafes ranked, 0 to skip")
+    args = parser.parse_args()
+
+    results: Dict[str, dict] = {}
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    workdir = tempfile.mkdtemp(prefix="cafe-bench-")
+    try:
+        for index, size in enumerate(sizes):
+            cafes = synthetic_cafes(size, args.seed)
+            bench_core(cafes, results)
+            if index == 0:
+                bench_fixed(cafes, results)
+                bench_panel_cache(args.seed, results)
+            if not args.skip_storage:
+                bench_storage(cafes, results, workdir)
+        if args.leaderboard_size:
+            bench_leaderboard(args.leaderboard_size, args.seed, results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "sizes": sizes,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fp:
+            baseline = json.load(fp)["results"]
+        found = regressions(results, baseline, args.threshold)
+        for line in found:
+            print(f"[WARN] Regression {line}")
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
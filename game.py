@@ -0,0 +1,731 @@
+import math
+import os
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+BASE_STATE = {
+    "cash": 25,
+    "pcs": 1,
+    "broken_pcs": 0,
+    "overheating": 1,
+    "internet_level": 0,
+    "electricity_level": 0,
+    "customers": [],
+    "staff": {"total": 0, "lazy": 0, "corrupt": 0, "skilled": 0, "technicians": 0},
+    "reputation": 1.4,
+    "latest_review": "The café smells like burnt circuits.",
+    "alerts": {"viruses": 1, "fire": 18, "police": 6},
+    "is_open": False,
+    "bills": 45,
+    "loan": 0,
+    "open_cost": 12,
+    "profit_ring": {"hour": 0, "total": 0, "buckets": [0] * 24},
+    "panel_message_id": None,
+    "panel_channel_id": None,
+    "last_tick": 0.0,
+    "last_active": 0.0,
+    "shop": {},
+}
+
+INTERNET_SPEEDS = ["Slow", "Stable", "Fast"]
+INTERNET_COSTS = [60, 140, 260]
+ELECTRICITY_COSTS = [50, 120, 220]
+INCOME_PER_CUSTOMER = {"casual": (2, 4), "hardcore": (4, 7)}
+CUSTOMER_DURATION = (2, 6)
+# Hourly odds of the random events in ``apply_hour``; the fast forward samples
+# the same events from them.
+OVERHEAT_CHANCE = 0.25
+BREAK_CHANCE = 0.12
+BREAK_CHANCE_PER_HEAT = 0.02
+VIRUS_CHANCE = 0.18
+VIRUS_OUTBREAK_LEVEL = 7
+VIRUS_BREAK_CHANCE = 0.25
+HOUR_SECONDS = 10
+FAST_FORWARD_MIN_HOURS = int(os.getenv("FAST_FORWARD_MIN_HOURS", "120"))
+FAST_FORWARD_TAIL_HOURS = 24
+# Daily profit is kept in a ring of hourly buckets covering the last day.
+PROFIT_BUCKET_SECONDS = 3600
+PROFIT_BUCKETS = 24
+
+# Customers are stored as buckets ``[flags, hours_left, rate, count]`` of
+# identical customers; ``flags`` is a mix of the bits below.
+HARDCORE, SUSPICIOUS, ANGRY = 1, 2, 4
+
+SHOP_ITEMS = {
+    "better_pc": {"name": "Refurbished PC", "cost": 130, "effect": {"pcs": 1, "overheating": 1}},
+    "pro_pc": {"name": "Enthusiast PC", "cost": 320, "effect": {"pcs": 1, "overheating": 0}},
+    "internet_plus": {"name": "Fiber Booster", "cost": 220, "effect": {"internet_level": 1}},
+    "power_saver": {"name": "Power Optimizer", "cost": 160, "effect": {"electricity_level": 1}},
+    "decor": {"name": "Comfy Decorations", "cost": 90, "effect": {"reputation": 0.2}},
+    "camera": {"name": "Security Cameras", "cost": 140, "effect": {"alerts.police": -2}},
+    "coffee": {"name": "Coffee Machine", "cost": 110, "effect": {"customers_stay": 1}},
+}
+
+# --------------- GAME HELPERS ---------------
+def working_pcs(state: dict) -> int:
+    return max(0, state["pcs"] - state["broken_pcs"])
+
+
+def electricity_load(state: dict) -> int:
+    load = 40 + (state["pcs"] * 8) - state["electricity_level"] * 6
+    return max(10, min(100, load))
+
+
+def internet_status(state: dict) -> str:
+    return INTERNET_SPEEDS[min(len(INTERNET_SPEEDS) - 1, state["internet_level"])]
+
+
+def expired_profit(ring: dict, hour: int) -> float:
+    """Profit in the buckets that fall out of the window once ``hour`` is current."""
+    gap = hour - ring["hour"]
+    if gap <= 0:
+        return 0
+    if gap >= PROFIT_BUCKETS:
+        return ring["total"]
+    buckets = ring["buckets"]
+    return sum(buckets[(ring["hour"] + step) % PROFIT_BUCKETS] for step in range(1, gap + 1))
+
+
+def add_profit(state: dict, amount: float) -> None:
+    hour = int(time.time() // PROFIT_BUCKET_SECONDS)
+    ring = state["profit_ring"]
+    gap = hour - ring["hour"]
+    if gap >= PROFIT_BUCKETS:
+        ring["buckets"] = [0] * PROFIT_BUCKETS
+        ring["total"] = 0
+    elif gap > 0:
+        buckets = ring["buckets"]
+        for step in range(1, gap + 1):
+            slot = (ring["hour"] + step) % PROFIT_BUCKETS
+            ring["total"] -= buckets[slot]
+            buckets[slot] = 0
+    if gap > 0:
+        ring["hour"] = hour
+    ring["buckets"][ring["hour"] % PROFIT_BUCKETS] += amount
+    ring["total"] += amount
+
+
+def compute_daily_profit(state: dict) -> float:
+    ring = state["profit_ring"]
+    hour = int(time.time() // PROFIT_BUCKET_SECONDS)
+    return round(ring["total"] - expired_profit(ring, hour), 2)
+
+
+def profit_ring_from_log(profit_log: list) -> dict:
+    """Fold a legacy ``[timestamp, amount]`` profit log into a ring."""
+    hour = int(time.time() // PROFIT_BUCKET_SECONDS)
+    ring = {"hour": hour, "total": 0, "buckets": [0] * PROFIT_BUCKETS}
+    for timestamp, amount in profit_log:
+        entry_hour = int(timestamp // PROFIT_BUCKET_SECONDS)
+        if hour - PROFIT_BUCKETS < entry_hour <= hour:
+            ring["buckets"][entry_hour % PROFIT_BUCKETS] += amount
+            ring["total"] += amount
+    return ring
+
+
+def add_review(state: dict, text: str, delta: float) -> None:
+    state["latest_review"] = text
+    state["reputation"] = max(0.5, min(5.0, state["reputation"] + delta))
+
+
+def customer_kinds() -> Tuple[List[Tuple[int, int, int]], List[float]]:
+    """Every (flags, base rate, duration) a new customer can have, with its cumulative odds."""
+    kinds, cum_weights, total = [], [], 0.0
+    durations = range(CUSTOMER_DURATION[0], CUSTOMER_DURATION[1] + 1)
+    for flags in range(8):
+        odds = (
+            (0.25 if flags & HARDCORE else 0.75)
+            * (0.15 if flags & SUSPICIOUS else 0.85)
+            * (0.2 if flags & ANGRY else 0.8)
+        )
+        low, high = INCOME_PER_CUSTOMER["hardcore" if flags & HARDCORE else "casual"]
+        for base_rate in range(low, high + 1):
+            for duration in durations:
+                total += odds / (high - low + 1) / len(durations)
+                kinds.append((flags, base_rate, duration))
+                cum_weights.append(total)
+    return kinds, cum_weights
+
+
+CUSTOMER_KINDS, CUSTOMER_CUM_WEIGHTS = customer_kinds()
+
+
+def customer_counts(state: dict) -> Tuple[int, int, int, int]:
+    """Total, angry, hardcore and suspicious customers, one pass over the buckets."""
+    active = angry = hardcore = suspicious = 0
+    for flags, _, _, count in state.get("customers", []):
+        active += count
+        if flags & ANGRY:
+            angry += count
+        if flags & HARDCORE:
+            hardcore += count
+        if flags & SUSPICIOUS:
+            suspicious += count
+    return active, angry, hardcore, suspicious
+
+
+def spawn_customers(state: dict, count: int) -> None:
+    customers = state.get("customers", [])
+    count = min(count, working_pcs(state) - sum(bucket[3] for bucket in customers))
+    state["customers"] = customers
+    if count <= 0:
+        return
+    drawn = Counter(random.choices(CUSTOMER_KINDS, cum_weights=CUSTOMER_CUM_WEIGHTS, k=count))
+    coffee = state["shop"].get("coffee", 0)
+    for (flags, base_rate, duration), amount in drawn.items():
+        add_customers(customers, flags, duration + coffee, base_rate + state["internet_level"], amount)
+
+
+def add_customers(customers: list, flags: int, hours_left: int, rate: int, count: int) -> None:
+    for bucket in customers:
+        if bucket[0] == flags and bucket[1] == hours_left and bucket[2] == rate:
+            bucket[3] += count
+            return
+    customers.append([flags, hours_left, rate, count])
+
+
+def remove_customer(state: dict, flag: int) -> bool:
+    """Send away the first customer with ``flag`` set; False if there is none."""
+    customers = state.get("customers", [])
+    for index, bucket in enumerate(customers):
+        if bucket[0] & flag:
+            bucket[3] -= 1
+            if bucket[3] <= 0:
+                del customers[index]
+            return True
+    return False
+
+
+def pack_customers(customers: list) -> list:
+    """Turn a legacy list of customer dicts into buckets, keeping first-seen order."""
+    buckets: list = []
+    for customer in customers:
+        flags = (
+            (HARDCORE if customer.get("hardcore") else 0)
+            | (SUSPICIOUS if customer.get("suspicious") else 0)
+            | (ANGRY if customer.get("angry") else 0)
+        )
+        add_customers(buckets, flags, customer["hours_left"], customer["rate"], 1)
+    return buckets
+
+
+def upgrade_state(state: dict) -> dict:
+    """Bring a cafe saved by an older version up to the current layout."""
+    customers = state.get("customers")
+    if customers and isinstance(customers[0], dict):
+        state["customers"] = pack_customers(customers)
+    if "profit_ring" not in state:
+        state["profit_ring"] = profit_ring_from_log(state.pop("profit_log", []))
+    return state
+
+
+def resolve_staff(state: dict) -> Tuple[int, int]:
+    technicians = state["staff"].get("technicians", 0)
+    skilled = state["staff"].get("skilled", 0)
+    lazy = state["staff"].get("lazy", 0)
+    corrupt = state["staff"].get("corrupt", 0)
+
+    fixes = max(0, technicians + skilled - lazy)
+    mischief = max(0, corrupt - skilled)
+    return fixes, mischief
+
+
+def apply_hour(state: dict) -> None:
+    if state["last_tick"] == 0:
+        state["last_tick"] = time.time()
+    pc_stress = working_pcs(state)
+    fixes, mischief = resolve_staff(state)
+
+    if state["is_open"]:
+        earnings = 0
+        remaining_customers = []
+        # Everyone in a bucket leaves in the same hour, so aging is a shift of
+        # the bucket and each departing bucket leaves one combined review.
+        for bucket in state.get("customers", []):
+            flags, hours_left, rate, count = bucket
+            earnings += rate * count
+            if hours_left > 1:
+                bucket[1] = hours_left - 1
+                remaining_customers.append(bucket)
+            elif flags & ANGRY:
+                add_review(state, "They never cleaned the PCs.", -0.1 * count)
+            elif flags & HARDCORE:
+                add_review(state, "Decent rigs for marathon gaming.", 0.05 * count)
+        state["customers"] = remaining_customers
+        state["cash"] += earnings
+        add_profit(state, earnings)
+        state["daily_profit"] = compute_daily_profit(state)
+    else:
+        state["customers"] = []
+
+    if state["customers"] and random.random() < OVERHEAT_CHANCE:
+        state["overheating"] = min(state["pcs"], state["overheating"] + 1)
+
+    if pc_stress <= 0 or random.random() < break_chance(state["overheating"], fixes):
+        if state["broken_pcs"] < state["pcs"]:
+            state["broken_pcs"] += 1
+            add_review(state, "Another station died mid-match.", -0.15)
+
+    state["broken_pcs"] = min(state["pcs"], max(0, state["broken_pcs"] - fixes))
+    if fixes > 0:
+        state["overheating"] = max(0, state["overheating"] - fixes)
+
+    if mischief > 0:
+        loss = mischief * 6
+        state["cash"] = max(0, state["cash"] - loss)
+        state["alerts"]["police"] = min(20, state["alerts"].get("police", 0) + mischief)
+        add_review(state, "Rumors of bribery float around.", -0.05)
+
+    state["bills"] += max(3, electricity_load(state) // 6)
+    salary_cost = state["staff"]["total"] * 2
+    state["bills"] += salary_cost
+
+    if state["bills"] > state["cash"] + 80:
+        state["is_open"] = False
+        state["latest_review"] = "Bills piled up. Doors locked until you pay."
+
+    if random.random() < VIRUS_CHANCE:
+        state["alerts"]["viruses"] = min(10, state["alerts"]["viruses"] + 1)
+    if state["alerts"]["viruses"] >= VIRUS_OUTBREAK_LEVEL and random.random() < VIRUS_BREAK_CHANCE:
+        state["broken_pcs"] = min(state["pcs"], state["broken_pcs"] + 1)
+
+    fire_risk = electricity_load(state) + state["overheating"] * 4
+    state["alerts"]["fire"] = min(100, max(5, fire_risk))
+    state["alerts"]["police"] = max(0, min(100, state["alerts"].get("police", 0)))
+
+    state["last_tick"] += HOUR_SECONDS
+
+
+def tick_state(user_id: str, state: dict, hours: int) -> dict:
+    if hours < FAST_FORWARD_MIN_HOURS:
+        for _ in range(hours):
+            apply_hour(state)
+        return state
+
+    # Nobody walks in on their own, so the customers present now are the last
+    # ones until the owner acts. Step exactly until they have all left.
+    while hours > 0 and state.get("customers"):
+        apply_hour(state)
+        hours -= 1
+    bulk = hours - FAST_FORWARD_TAIL_HOURS
+    if bulk > 0:
+        fast_forward(state, bulk)
+        hours -= bulk
+    # A short exact tail leaves the stochastic fields (broken PCs, the latest
+    # review) looking like they came out of a normal tick.
+    for _ in range(hours):
+        apply_hour(state)
+    return state
+
+
+# --------------- PLAYER ACTIONS ---------------
+# What the panel buttons and the shop do to a cafe. Each returns ``None``
+# once applied, or the reason it could not be done with the state untouched.
+def buy_pc(state: dict) -> Optional[str]:
+    cost = 95 + state["pcs"] * 30
+    if state["cash"] < cost:
+        return "You can't afford another junk PC yet."
+    state["cash"] -= cost
+    state["pcs"] += 1
+    state["overheating"] += 1
+    add_review(state, "More seats, same dusty floor.", 0)
+    return None
+
+
+def repair_pc(state: dict) -> Optional[str]:
+    if state["broken_pcs"] <= 0:
+        return "No broken rigs to fix."
+    cost = 40
+    if state["cash"] < cost:
+        return "Too broke for duct tape repairs."
+    state["cash"] -= cost
+    if random.random() < 0.4:
+        state["broken_pcs"] = min(state["pcs"], state["broken_pcs"] + 1)
+        add_review(state, "Repair scam ruined another station.", -0.2)
+    else:
+        state["broken_pcs"] = max(0, state["broken_pcs"] - 1)
+    return None
+
+
+def upgrade_internet(state: dict) -> Optional[str]:
+    if state["internet_level"] >= len(INTERNET_COSTS) - 1:
+        return "Connection is already maxed."
+    cost = INTERNET_COSTS[state["internet_level"]]
+    if state["cash"] < cost:
+        return "Save up for a better ISP plan."
+    state["cash"] -= cost
+    state["internet_level"] += 1
+    add_review(state, "Ping finally feels playable.", 0.1)
+    return None
+
+
+def upgrade_electric(state: dict) -> Optional[str]:
+    if state["electricity_level"] >= len(ELECTRICITY_COSTS) - 1:
+        return "Power grid already stable enough."
+    cost = ELECTRICITY_COSTS[state["electricity_level"]]
+    if state["cash"] < cost:
+        return "Can't pay the electrician yet."
+    state["cash"] -= cost
+    state["electricity_level"] += 1
+    state["overheating"] = max(0, state["overheating"] - 1)
+    return None
+
+
+def accept_customers(state: dict) -> Optional[str]:
+    if not state["is_open"]:
+        return "Open the cafe before inviting anyone."
+    spawn_customers(state, random.randint(1, 3))
+    return None
+
+
+def kick_angry(state: dict) -> Optional[str]:
+    if not remove_customer(state, ANGRY):
+        return "No angry customers to kick."
+    add_review(state, "Bouncer removed a screamer.", 0.05)
+    return None
+
+
+def ban_suspicious(state: dict) -> Optional[str]:
+    if not remove_customer(state, SUSPICIOUS):
+        return "No suspicious activity detected."
+    state["alerts"]["police"] = max(0, state["alerts"]["police"] - 3)
+    return None
+
+
+def hire_staff(state: dict) -> Optional[str]:
+    cost = 55
+    if state["cash"] < cost:
+        return "Can't afford new hires."
+    state["cash"] -= cost
+    state["staff"]["total"] += 1
+    roll = random.random()
+    if roll < 0.4:
+        state["staff"]["lazy"] += 1
+    elif roll < 0.65:
+        state["staff"]["corrupt"] += 1
+    else:
+        state["staff"]["skilled"] += 1
+    return None
+
+
+def fire_staff(state: dict) -> Optional[str]:
+    if state["staff"]["total"] <= 0:
+        return "No staff to fire."
+    state["staff"]["total"] -= 1
+    for key in ("lazy", "corrupt", "skilled", "technicians"):
+        if state["staff"].get(key, 0) > 0:
+            state["staff"][key] -= 1
+            break
+    return None
+
+
+def assign_tech(state: dict) -> Optional[str]:
+    if state["staff"]["skilled"] <= 0:
+        return "No skilled worker to assign."
+    state["staff"]["skilled"] -= 1
+    state["staff"]["technicians"] += 1
+    add_review(state, "A tech now patrols the rigs.", 0.05)
+    return None
+
+
+def bribe_staff(state: dict) -> Optional[str]:
+    if state["staff"]["corrupt"] <= 0:
+        return "No corrupt staff to bribe."
+    cost = 30
+    if state["cash"] < cost:
+        return "You can't cover the hush money."
+    state["cash"] -= cost
+    state["alerts"]["police"] = max(0, state["alerts"]["police"] - 4)
+    add_review(state, "Rumors quieted down for now.", 0)
+    return None
+
+
+def open_cafe(state: dict) -> Optional[str]:
+    if state["is_open"]:
+        return "Already open for business."
+    if state["cash"] < state["open_cost"]:
+        return "Can't afford to unlock the doors."
+    state["cash"] -= state["open_cost"]
+    state["is_open"] = True
+    add_review(state, "Doors creak open again.", 0)
+    return None
+
+
+def close_cafe(state: dict) -> Optional[str]:
+    if not state["is_open"]:
+        return "Already closed."
+    state["is_open"] = False
+    state["customers"] = []
+    return None
+
+
+def pay_bills(state: dict) -> Optional[str]:
+    if state["bills"] <= 0:
+        return "No bills pending."
+    if state["cash"] < state["bills"]:
+        return "Not enough cash to settle debts."
+    state["cash"] -= state["bills"]
+    state["bills"] = 0
+    state["is_open"] = True
+    add_review(state, "Suppliers got paid. Doors stay open.", 0.1)
+    return None
+
+
+def take_loan(state: dict) -> Optional[str]:
+    if state["loan"] > 0:
+        return "Repay your current loan first."
+    amount = 120
+    state["cash"] += amount
+    state["loan"] = amount * 1.25
+    state["alerts"]["police"] = min(100, state["alerts"]["police"] + 5)
+    return None
+
+
+def clean_cafe(state: dict) -> Optional[str]:
+    cost = 20
+    if state["cash"] < cost:
+        return "Too broke to buy cleaning supplies."
+    state["cash"] -= cost
+    add_review(state, "Floors finally got mopped.", 0.15)
+    return None
+
+
+def improve_service(state: dict) -> Optional[str]:
+    cost = 60
+    if state["cash"] < cost:
+        return "Can't afford training right now."
+    state["cash"] -= cost
+    add_review(state, "Staff learned to reboot routers politely.", 0.25)
+    spawn_customers(state, 1)
+    return None
+
+
+def fake_review(state: dict) -> Optional[str]:
+    cost = 35
+    if state["cash"] < cost:
+        return "Can't pay for bots yet."
+    state["cash"] -= cost
+    add_review(state, "Suspiciously glowing online praise.", 0.35)
+    state["alerts"]["police"] = min(100, state["alerts"]["police"] + 10)
+    return None
+
+
+PLAYER_ACTIONS: Dict[str, Callable[[dict], Optional[str]]] = {
+    action.__name__: action
+    for action in (
+        buy_pc,
+        repair_pc,
+        upgrade_internet,
+        upgrade_electric,
+        accept_customers,
+        kick_angry,
+        ban_suspicious,
+        hire_staff,
+        fire_staff,
+        assign_tech,
+        bribe_staff,
+        open_cafe,
+        close_cafe,
+        pay_bills,
+        take_loan,
+        clean_cafe,
+        improve_service,
+        fake_review,
+    )
+}
+
+
+def buy_shop_item(state: dict, choice: str) -> Optional[str]:
+    item = SHOP_ITEMS[choice]
+    if state["cash"] < item["cost"]:
+        return "Too expensive right now."
+    state["cash"] -= item["cost"]
+    state["shop"][choice] = state["shop"].get(choice, 0) + 1
+    for key, value in item["effect"].items():
+        if key == "internet_level":
+            state["internet_level"] = min(len(INTERNET_SPEEDS) - 1, state["internet_level"] + value)
+        elif key == "electricity_level":
+            state["electricity_level"] = min(len(ELECTRICITY_COSTS) - 1, state["electricity_level"] + value)
+        elif key == "pcs":
+            state["pcs"] += value
+        elif key == "overheating":
+            state["overheating"] = max(0, state["overheating"] - abs(value) if value < 0 else state["overheating"] + value)
+        elif key == "reputation":
+            add_review(state, state["latest_review"], value)
+        elif key == "alerts.police":
+            state["alerts"]["police"] = max(0, state["alerts"]["police"] + value)
+        elif key == "customers_stay":
+            state.setdefault("shop", {})
+    return None
+
+
+# --------------- FAST FORWARD ---------------
+def geometric(p: float) -> int:
+    """Number of hourly rolls until the first success with chance ``p``."""
+    if p >= 1:
+        return 1
+    return int(math.log(1.0 - random.random()) / math.log(1.0 - p)) + 1
+
+
+def binomial(n: int, p: float) -> int:
+    if n <= 0 or p <= 0:
+        return 0
+    if p >= 1:
+        return n
+    if n * p < 25:
+        count = 0
+        hour = geometric(p)
+        while hour <= n:
+            count += 1
+            hour += geometric(p)
+        return count
+    return max(0, min(n, round(random.gauss(n * p, math.sqrt(n * p * (1 - p))))))
+
+
+def break_chance(overheating: int, fixes: int) -> float:
+    return BREAK_CHANCE + max(0, overheating - fixes) * BREAK_CHANCE_PER_HEAT
+
+
+def virus_outbreak(viruses: int, hours: int) -> Tuple[int, int]:
+    """Sample the virus count after ``hours`` and the first hour it reaches the outbreak level."""
+    outbreak_hour = 1 if viruses >= VIRUS_OUTBREAK_LEVEL else hours + 1
+    hour = 0
+    while viruses < 10:
+        hour += geometric(VIRUS_CHANCE)
+        if hour > hours:
+            break
+        viruses += 1
+        if viruses == VIRUS_OUTBREAK_LEVEL:
+            outbreak_hour = hour
+    return viruses, outbreak_hour
+
+
+def unattended_breaks(state: dict, hours: int, outbreak_hour: int) -> Tuple[int, int]:
+    """Sample broken PCs and break reviews for a cafe that nobody repairs.
+
+    Without fixes ``broken_pcs`` only climbs, so it is enough to walk the
+    break events themselves until every PC is dead.
+    """
+    broken, pcs = state["broken_pcs"], state["pcs"]
+    chance = break_chance(state["overheating"], 0)
+    reviews = 0
+    next_break = geometric(chance)
+    next_virus_break = outbreak_hour - 1 + geometric(VIRUS_BREAK_CHANCE) if outbreak_hour <= hours else hours + 1
+    while broken < pcs:
+        if next_break <= hours and next_break <= next_virus_break:
+            broken += 1
+            reviews += 1
+            next_break += geometric(chance)
+        elif next_virus_break <= hours:
+            broken += 1
+            next_virus_break += geometric(VIRUS_BREAK_CHANCE)
+        else:
+            break
+    return broken, reviews
+
+
+def staffed_breaks(state: dict, hours: int, fixes: int, outbreak_hour: int) -> Tuple[int, int]:
+    """Sample broken PCs and break reviews for a cafe whose staff repairs every hour.
+
+    Repairs pull ``broken_pcs`` back down each hour, so the review count is
+    drawn per break chance on its own. The PC count is walked hour by hour
+    only while the backlog is bigger than one hour of repairs; below that a
+    break is fixed within its own hour, so the count only moves when a virus
+    knocks a PC out after the repairs and the walk jumps from one of those to
+    the next.
+    """
+    overheating, pcs = state["overheating"], state["pcs"]
+    hot_hours = min(hours, max(0, math.ceil((overheating - fixes) / fixes)))
+    reviews = sum(1 for hour in range(hot_hours) if random.random() < break_chance(overheating - hour * fixes, fixes))
+    calm_hours = hours - hot_hours
+    if pcs == 1:
+        # A single PC knocked out by a virus at the end of one hour cannot
+        # break again at the start of the next.
+        before_outbreak = max(0, min(calm_hours, outbreak_hour - hot_hours))
+        reviews += binomial(before_outbreak, BREAK_CHANCE) + binomial(
+            calm_hours - before_outbreak, BREAK_CHANCE * (1 - VIRUS_BREAK_CHANCE)
+        )
+    else:
+        reviews += binomial(calm_hours, BREAK_CHANCE)
+
+    broken, hour = state["broken_pcs"], 0
+    while hour < hours:
+        if broken < fixes:
+            if fixes > 1 or outbreak_hour > hours:
+                # Nothing carries over from one hour to the next any more; only
+                # a virus break in the very last hour is left standing.
+                broken = int(outbreak_hour <= hours and random.random() < VIRUS_BREAK_CHANCE)
+                break
+            hour = max(hour, outbreak_hour - 1) + geometric(VIRUS_BREAK_CHANCE)
+            broken = int(hour <= hours)
+            continue
+        hour += 1
+        if broken < pcs and random.random() < break_chance(overheating - (hour - 1) * fixes, fixes):
+            broken += 1
+        broken = max(0, broken - fixes)
+        if hour >= outbreak_hour and random.random() < VIRUS_BREAK_CHANCE:
+            broken = min(pcs, broken + 1)
+    return broken, reviews
+
+
+def fast_forward(state: dict, hours: int) -> None:
+    """Advance a cafe without customers by ``hours`` in one step.
+
+    Bills, theft by corrupt staff, police attention, overheating and the
+    closing point are closed forms because nothing changes the staff, the
+    PC count or the electricity level while nobody is playing. Viruses and
+    broken PCs are sampled from the same per-hour odds as ``apply_hour``,
+    jumping straight from one event to the next.
+    """
+    if state["last_tick"] == 0:
+        state["last_tick"] = time.time()
+    was_open = state["is_open"]
+    fixes, mischief = resolve_staff(state)
+    hourly_bills = max(3, electricity_load(state) // 6) + state["staff"]["total"] * 2
+    start_cash, start_bills = state["cash"], state["bills"]
+
+    viruses, outbreak_hour = virus_outbreak(state["alerts"]["viruses"], hours)
+    if fixes > 0:
+        broken, reviews = staffed_breaks(state, hours, fixes, outbreak_hour)
+        state["overheating"] = max(0, state["overheating"] - fixes * hours)
+    else:
+        broken, reviews = unattended_breaks(state, hours, outbreak_hour)
+    state["alerts"]["viruses"] = viruses
+    state["broken_pcs"] = broken
+
+    reputation_loss = reviews * 0.15
+    if reviews:
+        state["latest_review"] = "Another station died mid-match."
+    if mischief > 0:
+        state["cash"] = max(0, start_cash - mischief * 6 * hours)
+        state["alerts"]["police"] = min(20, state["alerts"].get("police", 0) + mischief * hours)
+        reputation_loss += 0.05 * hours
+        state["latest_review"] = "Rumors of bribery float around."
+    if reputation_loss:
+        state["reputation"] = max(0.5, min(5.0, state["reputation"] - reputation_loss))
+
+    state["bills"] = start_bills + hourly_bills * hours
+    # Bills only grow and cash only shrinks, so once the doors lock they stay
+    # locked. The first locking hour is where both halves of
+    # ``bills > max(0, cash) + 80`` hold.
+    close_hour = max(
+        1,
+        math.floor((start_cash + 80 - start_bills) / (hourly_bills + mischief * 6)) + 1,
+        math.floor((80 - start_bills) / hourly_bills) + 1,
+    )
+    if close_hour <= hours:
+        state["is_open"] = False
+        state["latest_review"] = "Bills piled up. Doors locked until you pay."
+
+    if was_open:
+        add_profit(state, 0)
+        state["daily_profit"] = compute_daily_profit(state)
+
+    fire_risk = electricity_load(state) + state["overheating"] * 4
+    state["alerts"]["fire"] = min(100, max(5, fire_risk))
+    state["alerts"]["police"] = max(0, min(100, state["alerts"].get("police", 0)))
+
+    state["last_tick"] += HOUR_SECONDS * hours
@@ -0,0 +1,162 @@
+from bisect import bisect_left, insort
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from sortedcontainers import SortedList
+except ImportError:  # pragma: no cover - optional dependency
+    SortedList = None
+
+LEADERBOARD_METRICS = ("cash", "reputation", "pcs")
+
+
+# --------------- SORTED KEYS ---------------
+class BucketList:
+    """Sorted keys kept as short sorted buckets, for when sortedcontainers is not installed.
+
+    An insert or removal touches one bucket of at most ``2 * load`` keys, and
+    a Fenwick tree over the bucket sizes turns a position inside a bucket
+    into a rank in logarithmic time. Only the parts of ``SortedList`` the
+    leaderboard uses are here.
+    """
+
+    def __init__(self, keys: Iterable = (), load: int = 1000):
+        self.load = load
+        ordered = sorted(keys)
+        self.size = len(ordered)
+        self.buckets = [ordered[start : start + load] for start in range(0, len(ordered), load)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self._build_tree()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, key) -> None:
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.size = 1
+            self._build_tree()
+            return
+        pos = bisect_left(self.maxes, key)
+        if pos == len(self.maxes):
+            pos -= 1
+            self.buckets[pos].append(key)
+            self.maxes[pos] = key
+        else:
+            insort(self.buckets[pos], key)
+        self.size += 1
+        bucket = self.buckets[pos]
+        if len(bucket) > 2 * self.load:
+            self.buckets[pos : pos + 1] = [bucket[: self.load], bucket[self.load :]]
+            self.maxes[pos : pos + 1] = [bucket[self.load - 1], bucket[-1]]
+            self._build_tree()
+        else:
+            self._grow(pos, 1)
+
+    def remove(self, key) -> None:
+        pos = bisect_left(self.maxes, key)
+        bucket = self.buckets[pos] if pos < len(self.buckets) else []
+        index = bisect_left(bucket, key)
+        if index == len(bucket) or bucket[index] != key:
+            raise ValueError(f"{key!r} is not in the list.")
+        del bucket[index]
+        self.size -= 1
+        if bucket:
+            self.maxes[pos] = bucket[-1]
+            self._grow(pos, -1)
+        else:
+            del self.buckets[pos]
+            del self.maxes[pos]
+            self._build_tree()
+
+    def bisect_left(self, key) -> int:
+        pos = bisect_left(self.maxes, key)
+        if pos == len(self.maxes):
+            return self.size
+        return self._before(pos) + bisect_left(self.buckets[pos], key)
+
+    def islice(self, start: int = 0, stop: Optional[int] = None) -> Iterator:
+        return islice(chain.from_iterable(self.buckets), start, stop)
+
+    def _build_tree(self) -> None:
+        tree = [0] + [len(bucket) for bucket in self.buckets]
+        for index in range(1, len(tree)):
+            parent = index + (index & -index)
+            if parent < len(tree):
+                tree[parent] += tree[index]
+        self.tree = tree
+
+    def _grow(self, pos: int, delta: int) -> None:
+        tree = self.tree
+        index = pos + 1
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    def _before(self, pos: int) -> int:
+        """Keys in the buckets before ``pos``."""
+        tree = self.tree
+        total = 0
+        while pos > 0:
+            total += tree[pos]
+            pos -= pos & -pos
+        return total
+
+
+# --------------- LEADERBOARD ---------------
+class Leaderboard:
+    """Cafes ranked by each of ``LEADERBOARD_METRICS``, kept current as their states change.
+
+    Each metric is a sorted list of ``(-value, user_id)``, so the best cafe
+    comes first and ties go to the older account. ``values`` remembers what
+    was indexed for every user, which is how an update finds the keys to
+    replace after the state itself has already changed.
+    """
+
+    def __init__(self):
+        self.sorted_list = SortedList or BucketList
+        self.values: Dict[int, Tuple[float, ...]] = {}
+        self.ranks = {metric: self.sorted_list() for metric in LEADERBOARD_METRICS}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def rebuild(self, states: Iterable[Tuple[str, dict]]) -> None:
+        """Index every state from scratch in one pass."""
+        self.values = {
+            int(user_id): tuple(state[metric] for metric in LEADERBOARD_METRICS) for user_id, state in states
+        }
+        self.ranks = {
+            metric: self.sorted_list((-values[column], user_id) for user_id, values in self.values.items())
+            for column, metric in enumerate(LEADERBOARD_METRICS)
+        }
+
+    def update(self, user_id: int, state: dict) -> None:
+        values = tuple(state[metric] for metric in LEADERBOARD_METRICS)
+        before = self.values.get(user_id)
+        if values == before:
+            return
+        for column, metric in enumerate(LEADERBOARD_METRICS):
+            if before is not None:
+                if before[column] == values[column]:
+                    continue
+                self.ranks[metric].remove((-before[column], user_id))
+            self.ranks[metric].add((-values[column], user_id))
+        self.values[user_id] = values
+
+    def value(self, metric: str, user_id: int) -> Optional[float]:
+        values = self.values.get(user_id)
+        return None if values is None else values[LEADERBOARD_METRICS.index(metric)]
+
+    def top(self, metric: str, count: int) -> List[Tuple[int, float]]:
+        return [(user_id, -negated) for negated, user_id in self.ranks[metric].islice(0, count)]
+
+    def ahead(self, metric: str, value: float, user_id: int) -> int:
+        """How many cafes rank above one with ``value``, indexed here or not."""
+        return self.ranks[metric].bisect_left((-value, user_id))
+
+    def rank(self, metric: str, user_id: int) -> Optional[int]:
+        """1-based position of ``user_id``, or None if their cafe is not indexed."""
+        value = self.value(metric, user_id)
+        return None if value is None else self.ahead(metric, value, user_id) + 1
@@ -0,0 +1,607 @@
+"""End-to-end load generator: the whole bot against a local stand-in for Discord.
+
+    python loadgen.py --cafes 2000 --duration 30 --rate 200
+    python loadgen.py --cafes 500 --record trace.jsonl
+    python loadgen.py --trace trace.jsonl --output report.json
+    python loadgen.py --processes 4 --shards 8 --cafes 2000
+
+The stand-in replaces Discord at the discord.py object boundary: channels,
+messages, interactions and their responses are local objects whose REST
+calls sleep for a configurable latency. Everything behind them is the real
+bot: ``!cafe`` creates the panels, clicks go through ``CafeView``'s routing
+and callbacks, ``ShopView.purchase`` handles shop picks, and
+``hourly_tick`` plus the edit scheduler run on their normal cadence.
+
+A trace is JSON lines of ``{"t": seconds, "user": id, "kind": "click" |
+"shop" | "cafe", "action": ...}``; ``--record`` writes the synthetic trace
+that was played so the same load can be replayed against another commit.
+
+With ``--processes`` above one the bot runs as that many worker processes
+in sharded mode (see ``sharding.py``). Channels belong to guilds, and each
+event is delivered to the process holding its guild's shard, so most of
+them are routed to the owning process exactly as in production. Workers
+share a scratch directory and line up at file barriers between phases.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import itertools
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from sharding import guild_shard
+
+BASE_USER_ID = 10**17
+BASE_GUILD_ID = 8 * 10**17
+BASE_CHANNEL_ID = 9 * 10**17
+BARRIER_TIMEOUT = 120.0
+
+
+def user_id(index: int) -> int:
+    # Real snowflakes differ in the high bits that sharding looks at.
+    return BASE_USER_ID + (index << 22)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# --------------- FAKE DISCORD ---------------
+class FakeRest:
+    """Counts REST calls and delays each by ``latency`` plus up to ``jitter`` seconds."""
+
+    def __init__(self, latency: float, jitter: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Dict[str, int] = {}
+        self.message_ids = itertools.count(BASE_CHANNEL_ID + 10**6)
+
+    async def call(self, route: str) -> None:
+        self.calls[route] = self.calls.get(route, 0) + 1
+        await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.display_name = f"user{user_id}"
+
+
+class FakeMessage:
+    def __init__(self, rest: FakeRest, channel: "FakeChannel", author: FakeUser, view=None):
+        self.rest = rest
+        self.id = next(rest.message_ids)
+        self.channel = channel
+        self.author = author
+        self.view = view
+
+    async def edit(self, embed=None, view=None, **_) -> None:
+        await self.rest.call("message.edit")
+        if view is not None:
+            self.view = view
+
+    async def fetch(self) -> "FakeMessage":
+        await self.rest.call("message.fetch")
+        return self
+
+
+class RemotePanel:
+    """A panel posted by another process, known only by the ids a click carries."""
+
+    def __init__(self, message_id: int, channel: "FakeChannel"):
+        self.id = message_id
+        self.channel = channel
+
+
+class FakeChannel:
+    def __init__(self, rest: FakeRest, channel_id: int, guild_id: int, bot_user: FakeUser):
+        self.rest = rest
+        self.id = channel_id
+        self.guild_id = guild_id
+        self.bot_user = bot_user
+        self.messages: Dict[int, FakeMessage] = {}
+
+    async def send(self, content=None, embed=None, view=None, **_) -> FakeMessage:
+        await self.rest.call("channel.send")
+        message = FakeMessage(self.rest, self, self.bot_user, view)
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self.messages[message_id]
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+
+    async def edit_message(self, embed=None, view=None, **_) -> None:
+        await self.interaction.rest.call("interaction.edit_message")
+        if view is not None and self.interaction.message is not None:
+            self.interaction.message.view = view
+        self.interaction.responded()
+
+    async def send_message(self, *_, **__) -> None:
+        await self.interaction.rest.call("interaction.send_message")
+        self.interaction.responded()
+
+    async def defer(self, **_) -> None:
+        await self.interaction.rest.call("interaction.defer")
+        self.interaction.responded()
+
+
+class FakeFollowup:
+    def __init__(self, rest: FakeRest):
+        self.rest = rest
+
+    async def send(self, *_, **__) -> None:
+        await self.rest.call("interaction.followup")
+
+
+class FakeInteraction:
+    def __init__(self, rest: FakeRest, user: FakeUser, message, latencies: List[float]):
+        self.rest = rest
+        self.user = user
+        self.message = message
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(rest)
+        self.latencies = latencies
+        self.created = time.perf_counter()
+
+    def responded(self) -> None:
+        self.latencies.append(time.perf_counter() - self.created)
+
+
+class FakeContext:
+    def __init__(self, author: FakeUser, channel: FakeChannel, command):
+        self.author = author
+        self.channel = channel
+        self.command = command
+
+    async def send(self, *args, **kwargs) -> FakeMessage:
+        return await self.channel.send(*args, **kwargs)
+
+
+class FakeDiscord:
+    """Channels, users and messages the bot would otherwise get from Discord."""
+
+    def __init__(self, rest: FakeRest, channels: int, guilds: int):
+        self.rest = rest
+        self.bot_user = FakeUser(1)
+        self.channels = {
+            BASE_CHANNEL_ID + index: FakeChannel(
+                rest, BASE_CHANNEL_ID + index, BASE_GUILD_ID + (index % guilds << 22), self.bot_user
+            )
+            for index in range(channels)
+        }
+        self.users: Dict[int, FakeUser] = {}
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    def get_user(self, user_id: int) -> FakeUser:
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = FakeUser(user_id)
+        return user
+
+    def channel_for(self, user_id: int) -> FakeChannel:
+        # Hashed so the channel, and with it the guild's shard, is independent of who owns the cafe.
+        return self.channels[BASE_CHANNEL_ID + zlib.crc32(str(user_id).encode()) % len(self.channels)]
+
+
+# --------------- TRACES ---------------
+def synthetic_trace(cafes: int, duration: float, rate: float, actions: List[str], seed: int) -> List[dict]:
+    """Poisson arrivals of clicks (85%), shop purchases (10%) and ``!cafe`` (5%) over random users."""
+    rng = random.Random(seed)
+    events, now = [], 0.0
+    while True:
+        now += rng.expovariate(rate)
+        if now >= duration:
+            return events
+        user = user_id(rng.randrange(cafes))
+        roll = rng.random()
+        if roll < 0.85:
+            events.append({"t": now, "user": user, "kind": "click", "action": rng.choice(actions)})
+        elif roll < 0.95:
+            events.append({"t": now, "user": user, "kind": "shop", "action": None})
+        else:
+            events.append({"t": now, "user": user, "kind": "cafe", "action": None})
+
+
+def read_trace(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def write_trace(path: str, events: List[dict]) -> None:
+    with open(path, "w", encoding="utf-8") as fp:
+        for event in events:
+            fp.write(json.dumps(event) + "\n")
+
+
+# --------------- DRIVER ---------------
+class LoadRun:
+    def __init__(self, bot_module, discord_fake: FakeDiscord, index: int, processes: int):
+        self.bot = bot_module
+        self.fake = discord_fake
+        self.index = index
+        self.processes = processes
+        # Panels of every process by owner, for clicks on cafes owned elsewhere.
+        self.panels: Dict[int, List[int]] = {}
+        # Discord hands clicks on any panel to the registered persistent view.
+        self.persistent = bot_module.panel_controls = bot_module.CafeView()
+        self.click_latencies: List[float] = []
+        self.command_latencies: List[float] = []
+        self.routed_latencies: List[float] = []
+        self.tick_durations: List[float] = []
+        self.errors = 0
+        self.error_kinds: Dict[str, int] = {}
+
+    def receiver(self, user: int) -> int:
+        """The process Discord delivers this user's events to: the one holding the guild's shard."""
+        if self.processes == 1:
+            return 0
+        guild_id = self.fake.channel_for(user).guild_id
+        return guild_shard(guild_id, self.bot.SHARD_COUNT) % self.processes
+
+    async def barrier(self, name: str) -> None:
+        if self.processes == 1:
+            return
+        open(f"{name}.p{self.index}", "w").close()
+        deadline = time.monotonic() + BARRIER_TIMEOUT
+        while not all(os.path.exists(f"{name}.p{index}") for index in range(self.processes)):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Timed out waiting for the other processes at the {name!r} barrier.")
+            await asyncio.sleep(0.05)
+
+    async def cafe(self, user: int) -> None:
+        ctx = FakeContext(self.fake.get_user(user), self.fake.channel_for(user), self.bot.cafe)
+        started = time.perf_counter()
+        await self.bot.cafe.callback(ctx)
+        self.command_latencies.append(time.perf_counter() - started)
+
+    async def click(self, user: int, action: str) -> None:
+        if not self.bot.owns(user):
+            await self.remote_click(user, action)
+            return
+        state = self.bot.store.peek(str(user))
+        if state is None or not state.get("panel_message_id"):
+            return
+        channel = self.fake.get_channel(state["panel_channel_id"])
+        message = channel.messages.get(state["panel_message_id"])
+        view = message.view if message is not None else None
+        if view is None:
+            return
+        button = next(item for item in view.children if getattr(item, "custom_id", None) == f"cafe:{action}")
+        if button.disabled:
+            # Discord greys the button out; nothing reaches the bot.
+            return
+        interaction = FakeInteraction(self.fake.rest, self.fake.get_user(user), message, self.click_latencies)
+        if await view.interaction_check(interaction):
+            await button.callback(interaction)
+
+    async def remote_click(self, user: int, action: str) -> None:
+        panel = self.panels.get(user)
+        if panel is None:
+            return
+        message = RemotePanel(panel[1], self.fake.get_channel(panel[0]))
+        view = self.persistent
+        button = next(item for item in view.children if getattr(item, "custom_id", None) == f"cafe:{action}")
+        interaction = FakeInteraction(self.fake.rest, self.fake.get_user(user), message, self.click_latencies)
+        started = time.perf_counter()
+        if await view.interaction_check(interaction):
+            await button.callback(interaction)
+        self.routed_latencies.append(time.perf_counter() - started)
+
+    async def shop(self, user: int) -> None:
+        view = self.bot.ShopView(user)
+        view.select._values = [random.choice(list(self.bot.SHOP_ITEMS))]
+        interaction = FakeInteraction(self.fake.rest, self.fake.get_user(user), None, self.click_latencies)
+        if await view.interaction_check(interaction):
+            await view.purchase(interaction)
+
+    async def dispatch(self, event: dict) -> None:
+        try:
+            if event["kind"] == "click":
+                await self.click(event["user"], event["action"])
+            elif event["kind"] == "shop":
+                await self.shop(event["user"])
+            elif event["kind"] == "cafe":
+                await self.cafe(event["user"])
+        except Exception as exc:
+            self.errors += 1
+            name = type(exc).__name__
+            self.error_kinds[name] = self.error_kinds.get(name, 0) + 1
+
+    async def ticker(self, stop: asyncio.Event) -> None:
+        period = self.bot.TICK_RESOLUTION
+        while not stop.is_set():
+            started = time.perf_counter()
+            await self.bot.hourly_tick.coro()
+            if self.bot.store.flush_due():
+                self.bot.store.flush()
+            elapsed = time.perf_counter() - started
+            self.tick_durations.append(elapsed)
+            await asyncio.sleep(max(0.0, period - elapsed))
+
+    async def replay(self, events: List[dict]) -> float:
+        started = time.perf_counter()
+        tasks = []
+        for event in events:
+            delay = event["t"] - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.dispatch(event)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+
+async def run(args, bot_module, index: int = 0, processes: int = 1) -> dict:
+    """Play the load against one bot process and return its raw samples and counters."""
+    rest = FakeRest(args.latency, args.jitter)
+    fake = FakeDiscord(rest, args.channels, args.guilds)
+    bot_module.bot.get_partial_messageable = lambda channel_id, **_: fake.get_channel(channel_id)
+    bot_module.bot.get_user = fake.get_user
+    bot_module.store.load()
+    bot_module.edits.start()
+    if bot_module.router is not None:
+        await bot_module.router.start(bot_module.handle_routed)
+    lag_task = asyncio.create_task(bot_module.watch_loop_lag())
+    load = LoadRun(bot_module, fake, index, processes)
+    if bot_module.router is not None:
+        # Nobody routes a request before every process is listening.
+        await load.barrier("listening")
+
+    # A burst of !cafe from every user puts all the panels up at once.
+    users = [user_id(number) for number in range(args.cafes)]
+    burst_started = time.perf_counter()
+    await asyncio.gather(*(load.dispatch({"kind": "cafe", "user": user}) for user in users if load.receiver(user) == index))
+    burst = time.perf_counter() - burst_started
+    await load.barrier("burst")
+
+    now = time.time()
+    rng = random.Random(args.seed)
+    owned = {}
+    for user in users:
+        jitter = rng.random()
+        cash = rng.randint(50, 1500)
+        state = bot_module.store.peek(str(user))
+        if not bot_module.owns(user) or state is None:
+            continue
+        state["cash"] = cash
+        # Spread the cafes over the hour as a long-running bot would have them.
+        state["last_tick"] = now - jitter * bot_module.HOUR_SECONDS
+        bot_module.store.mark_dirty(str(user))
+        bot_module.scheduler.schedule(str(user), state["last_tick"], now)
+        owned[user] = [state["panel_channel_id"], state["panel_message_id"]]
+    if processes > 1:
+        with open(f"panels.{index}.json", "w", encoding="utf-8") as fp:
+            json.dump(owned, fp)
+        await load.barrier("panels")
+        for number in range(processes):
+            with open(f"panels.{number}.json", "r", encoding="utf-8") as fp:
+                load.panels.update((int(user), panel) for user, panel in json.load(fp).items())
+    load.command_latencies.clear()
+
+    if args.trace:
+        events = read_trace(args.trace)
+    else:
+        actions = [action for _, action, _, _ in bot_module.PANEL_LAYOUT if action is not None]
+        events = synthetic_trace(args.cafes, args.duration, args.rate, actions, args.seed)
+    if args.record and index == 0:
+        write_trace(args.record, events)
+    events = [event for event in events if load.receiver(event["user"]) == index]
+
+    await load.barrier("start")
+    stop = asyncio.Event()
+    edits_before = rest.calls.get("message.edit", 0)
+    ticker = asyncio.create_task(load.ticker(stop))
+    elapsed = await load.replay(events)
+    edits_during = rest.calls.get("message.edit", 0) - edits_before
+    # Others may still be routing requests here; keep serving until they are done too.
+    await load.barrier("replayed")
+    stop.set()
+    await ticker
+    backlog = bot_module.edits.queue_depth
+    # Give the refreshes still queued behind the channel limits a bounded time to go out.
+    deadline = time.perf_counter() + args.drain
+    while bot_module.edits.queue_depth and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    lag_task.cancel()
+    await bot_module.edits.stop()
+    if bot_module.router is not None:
+        await load.barrier("drained")
+        await bot_module.router.close()
+    bot_module.store.close()
+
+    router = bot_module.router
+    return {
+        "index": index,
+        "events": len(events),
+        "cafes_owned": len(bot_module.store),
+        "elapsed": elapsed,
+        "burst": burst,
+        "click": load.click_latencies,
+        "command": load.command_latencies,
+        "routed": load.routed_latencies,
+        "tick": load.tick_durations,
+        "edits": edits_during,
+        "backlog_at_end": backlog,
+        "backlog_after_drain": bot_module.edits.queue_depth,
+        "rest_calls": rest.calls,
+        "edit_scheduler": bot_module.edits.stats(),
+        "time_to_first_tick": bot_module.time_to_first_tick,
+        "loop_lag": bot_module.loop_lag_stats(),
+        "router": (
+            {"forwarded": router.forwarded, "served": router.served, "failed": router.failures} if router else None
+        ),
+        "errors": load.errors,
+        "error_kinds": load.error_kinds,
+    }
+
+
+def summarize(parts: List[dict], cafes: int, period: float) -> dict:
+    def merged(key: str) -> List[float]:
+        return [value for part in parts for value in part[key]]
+
+    clicks, commands, routed, ticks = merged("click"), merged("command"), merged("routed"), merged("tick")
+    elapsed = max(part["elapsed"] for part in parts)
+    rest_calls: Dict[str, int] = {}
+    error_kinds: Dict[str, int] = {}
+    for part in parts:
+        for route, count in part["rest_calls"].items():
+            rest_calls[route] = rest_calls.get(route, 0) + count
+        for name, count in part["error_kinds"].items():
+            error_kinds[name] = error_kinds.get(name, 0) + count
+    report = {
+        "cafes": cafes,
+        "processes": len(parts),
+        "events": sum(part["events"] for part in parts),
+        "elapsed_sec": elapsed,
+        "cafe_burst_sec": max(part["burst"] for part in parts),
+        "interactions": len(clicks),
+        "interaction_latency_p50": percentile(clicks, 0.5),
+        "interaction_latency_p99": percentile(clicks, 0.99),
+        "command_latency_p50": percentile(commands, 0.5),
+        "command_latency_p99": percentile(commands, 0.99),
+        "routed_clicks": len(routed),
+        "routed_click_latency_p50": percentile(routed, 0.5),
+        "routed_click_latency_p99": percentile(routed, 0.99),
+        "ticks": len(ticks),
+        "tick_overrun_rate": sum(1 for value in ticks if value > period) / max(1, len(ticks)),
+        "tick_duration_p99": percentile(ticks, 0.99),
+        "panel_edits_per_sec": sum(part["edits"] for part in parts) / elapsed if elapsed else 0.0,
+        "edit_backlog_at_end": sum(part["backlog_at_end"] for part in parts),
+        "edit_backlog_after_drain": sum(part["backlog_after_drain"] for part in parts),
+        "rest_calls": rest_calls,
+        "errors": sum(part["errors"] for part in parts),
+        "error_kinds": error_kinds,
+    }
+    keys = ("index", "events", "cafes_owned", "edit_scheduler", "time_to_first_tick", "loop_lag", "router")
+    report["per_process"] = [{key: part[key] for key in keys} for part in parts]
+    return report
+
+
+# --------------- PROCESSES ---------------
+def free_ports(count: int) -> List[int]:
+    sockets = [socket.socket() for _ in range(count)]
+    for sock in sockets:
+        sock.bind(("127.0.0.1", 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+
+def run_workers(args, workdir: str) -> List[dict]:
+    """Start one worker per bot process and collect what each of them measured."""
+    peers = ",".join(f"127.0.0.1:{port}" for port in free_ports(args.processes))
+    secret = secrets.token_hex(16)
+    workers = []
+    for index in range(args.processes):
+        env = dict(
+            os.environ,
+            BOT_PROCESSES=str(args.processes),
+            BOT_PROCESS_INDEX=str(index),
+            SHARD_COUNT=str(args.shards or args.processes),
+            SHARD_PEERS=peers,
+            SHARD_SECRET=secret,
+        )
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker", str(index), "--workdir", workdir]
+        workers.append(subprocess.Popen(command, env=env, stdout=sys.stderr))
+    failed = [index for index, worker in enumerate(workers) if worker.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Load workers {failed} exited with an error.")
+    parts = []
+    for index in range(args.processes):
+        with open(os.path.join(workdir, f"part.{index}.json"), "r", encoding="utf-8") as fp:
+            parts.append(json.load(fp))
+    return parts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cafes", type=int, default=1000, help="users with a live panel")
+    parser.add_argument("--channels", type=int, default=50, help="channels the panels are spread over")
+    parser.add_argument("--guilds", type=int, default=10, help="guilds the channels belong to")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of synthetic traffic")
+    parser.add_argument("--rate", type=float, default=100.0, help="synthetic events per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated REST latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="extra random REST latency in seconds")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for queued edits after the trace")
+    parser.add_argument("--trace", help="replay this trace instead of generating one")
+    parser.add_argument("--record", help="write the trace that was played to this file")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--backend", default="json", help="STATE_BACKEND to run with")
+    parser.add_argument("--processes", type=int, default=1, help="bot processes in sharded mode")
+    parser.add_argument("--shards", type=int, default=0, help="gateway shards, defaults to one per process")
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for name in ("trace", "record", "output"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    if args.worker is not None:
+        return worker_main(args)
+
+    workdir = tempfile.mkdtemp(prefix="cafe-load-")
+    try:
+        if args.processes > 1:
+            parts = run_workers(args, workdir)
+            period = float(os.getenv("TICK_RESOLUTION", "1"))
+        else:
+            # The bot's own output goes to stderr so stdout stays the report.
+            with contextlib.redirect_stdout(sys.stderr):
+                bot_module = import_bot(args, workdir)
+                parts = [asyncio.run(run(args, bot_module))]
+            period = bot_module.TICK_RESOLUTION
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = summarize(parts, args.cafes, period)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, indent=2)
+    return 0
+
+
+def import_bot(args, workdir: str):
+    # The bot reads its configuration at import and keeps data.json in the
+    # working directory, so move to scratch files first.
+    os.chdir(workdir)
+    os.environ["STATE_DB_FILE"] = os.path.join(workdir, "data.db")
+    os.environ["STATE_PACK_FILE"] = os.path.join(workdir, "data.pack")
+    os.environ["STATE_BACKEND"] = args.backend
+    return importlib.import_module("main")
+
+
+def worker_main(args) -> int:
+    bot_module = import_bot(args, args.workdir)
+    part = asyncio.run(run(args, bot_module, args.worker, args.processes))
+    with open(f"part.{args.worker}.json", "w", encoding="utf-8") as fp:
+        json.dump(part, fp)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
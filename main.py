@@ -1,60 +1,87 @@
+import asyncio
 import io
 import json
 import os
-import random
+import threading
 import time
-from copy import deepcopy
-from typing import Dict, Tuple
+import traceback
+import weakref
+from collections import OrderedDict, deque
+from functools import partial
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
 import discord
 from discord.ext import commands, tasks
 
+import vector_engine
+from game import (
+    BASE_STATE,
+    ELECTRICITY_COSTS,
+    FAST_FORWARD_MIN_HOURS,
+    HOUR_SECONDS,
+    INTERNET_COSTS,
+    PLAYER_ACTIONS,
+    SHOP_ITEMS,
+    buy_shop_item,
+    compute_daily_profit,
+    customer_counts,
+    electricity_load,
+    internet_status,
+    tick_state,
+    upgrade_state,
+    working_pcs,
+)
+from leaderboard import LEADERBOARD_METRICS, Leaderboard
+from metrics import Registry, StackSampler, serve
+from panel_cache import PanelCache
+from panel_edits import EditScheduler
+from sharding import ShardRouter, owner_process, parse_peers, partition_path, process_shards
+from storage import StateHandle, StateStore, open_backend, read_snapshot, snapshot
+from tick_pool import ShardedTickPool
+from tick_scheduler import TickScheduler
 
 TOKEN = os.getenv("DISCORD_TOKEN")
 PREFIX = "!"
 MESSAGE_CONTENT_INTENT = os.getenv("DISCORD_MESSAGE_CONTENT_INTENT", "false").lower() == "true"
 
-DATA_FILE = "data.json"
-
-BASE_STATE = {
-    "cash": 25,
-    "pcs": 1,
-    "broken_pcs": 0,
-    "overheating": 1,
-    "internet_level": 0,
-    "electricity_level": 0,
-    "customers": [],
-    "staff": {"total": 0, "lazy": 0, "corrupt": 0, "skilled": 0, "technicians": 0},
-    "reputation": 1.4,
-    "latest_review": "The café smells like burnt circuits.",
-    "alerts": {"viruses": 1, "fire": 18, "police": 6},
-    "is_open": False,
-    "bills": 45,
-    "loan": 0,
-    "open_cost": 12,
-    "profit_log": [],
-    "panel_message_id": None,
-    "panel_channel_id": None,
-    "last_tick": 0.0,
-    "shop": {},
-}
-
-INTERNET_SPEEDS = ["Slow", "Stable", "Fast"]
-INTERNET_COSTS = [60, 140, 260]
-ELECTRICITY_COSTS = [50, 120, 220]
-INCOME_PER_CUSTOMER = {"casual": (2, 4), "hardcore": (4, 7)}
-CUSTOMER_DURATION = (2, 6)
-HOUR_SECONDS = 10
-
-SHOP_ITEMS = {
-    "better_pc": {"name": "Refurbished PC", "cost": 130, "effect": {"pcs": 1, "overheating": 1}},
-    "pro_pc": {"name": "Enthusiast PC", "cost": 320, "effect": {"pcs": 1, "overheating": 0}},
-    "internet_plus": {"name": "Fiber Booster", "cost": 220, "effect": {"internet_level": 1}},
-    "power_saver": {"name": "Power Optimizer", "cost": 160, "effect": {"electricity_level": 1}},
-    "decor": {"name": "Comfy Decorations", "cost": 90, "effect": {"reputation": 0.2}},
-    "camera": {"name": "Security Cameras", "cost": 140, "effect": {"alerts.police": -2}},
-    "coffee": {"name": "Coffee Machine", "cost": 110, "effect": {"customers_stay": 1}},
-}
+BOT_PROCESSES = int(os.getenv("BOT_PROCESSES", "1"))
+BOT_PROCESS_INDEX = int(os.getenv("BOT_PROCESS_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", str(BOT_PROCESSES)))
+SHARD_RPC_HOST = os.getenv("SHARD_RPC_HOST", "127.0.0.1")
+SHARD_RPC_PORT = int(os.getenv("SHARD_RPC_PORT", "8470"))
+SHARD_PEERS = os.getenv("SHARD_PEERS", "")
+SHARD_SECRET = os.getenv("SHARD_SECRET", "")
+# Where this process listens for routed requests; set to 0.0.0.0 when peers run on other hosts.
+SHARD_RPC_BIND = os.getenv("SHARD_RPC_BIND", "127.0.0.1")
+
+# Each process of a sharded deployment keeps its own partition of the state.
+DATA_FILE = partition_path("data.json", BOT_PROCESS_INDEX, BOT_PROCESSES)
+STATE_DB_FILE = partition_path(os.getenv("STATE_DB_FILE", "data.db"), BOT_PROCESS_INDEX, BOT_PROCESSES)
+STATE_PACK_FILE = partition_path(os.getenv("STATE_PACK_FILE", "data.pack"), BOT_PROCESS_INDEX, BOT_PROCESSES)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "json").lower()
+STATE_COMPACT_BYTES = int(os.getenv("STATE_COMPACT_BYTES", str(4 * 1024 * 1024)))
+STATE_FLUSH_SECONDS = float(os.getenv("STATE_FLUSH_SECONDS", "5"))
+STATE_FLUSH_MAX_DIRTY = int(os.getenv("STATE_FLUSH_MAX_DIRTY", "256"))
+TICK_ENGINES = ("python", "numpy")
+TICK_ENGINE = os.getenv("TICK_ENGINE", "python").lower()
+VECTOR_MIN_HOURS = int(os.getenv("VECTOR_MIN_HOURS", "4"))
+CAFE_IDLE_SECONDS = float(os.getenv("CAFE_IDLE_SECONDS", str(3 * 86400)))
+TICK_RESOLUTION = float(os.getenv("TICK_RESOLUTION", "1"))
+TICK_WORKERS = int(os.getenv("TICK_WORKERS", "0"))
+PANEL_RENDER_CACHE = int(os.getenv("PANEL_RENDER_CACHE", "1024"))
+PANEL_CACHE_SIZE = int(os.getenv("PANEL_CACHE_SIZE", "4096"))
+PANEL_CACHE_TTL = float(os.getenv("PANEL_CACHE_TTL", str(2 * 3600)))
+EDIT_CONCURRENCY = int(os.getenv("EDIT_CONCURRENCY", "8"))
+EDIT_CHANNEL_RATE = int(os.getenv("EDIT_CHANNEL_RATE", "5"))
+EDIT_CHANNEL_PER = float(os.getenv("EDIT_CHANNEL_PER", "5"))
+LOOP_LAG_INTERVAL = 0.25
+LOOP_LAG_WARN = float(os.getenv("LOOP_LAG_WARN", "0.5"))
+TICK_SHARDS = int(os.getenv("TICK_SHARDS", "64"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PANEL_VERIFY_CONCURRENCY = int(os.getenv("PANEL_VERIFY_CONCURRENCY", "4"))
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
 
 CYBER_DARK = 0x111827
 CYBER_CYAN = 0x14b8a6
@@ -62,189 +89,286 @@ CYBER_CYAN = 0x14b8a6
 intents = discord.Intents.default()
 intents.message_content = MESSAGE_CONTENT_INTENT
 
-bot = commands.Bot(command_prefix=PREFIX, intents=intents, help_command=None)
-
-panel_cache: Dict[int, discord.Message] = {}
+if BOT_PROCESSES > 1:
+    bot = commands.AutoShardedBot(
+        command_prefix=PREFIX,
+        intents=intents,
+        help_command=None,
+        shard_count=SHARD_COUNT,
+        shard_ids=process_shards(BOT_PROCESS_INDEX, BOT_PROCESSES, SHARD_COUNT),
+    )
+    router: Optional[ShardRouter] = ShardRouter(
+        BOT_PROCESS_INDEX,
+        parse_peers(SHARD_PEERS, BOT_PROCESSES, SHARD_RPC_HOST, SHARD_RPC_PORT),
+        SHARD_SECRET,
+        bind=SHARD_RPC_BIND,
+    )
+else:
+    bot = commands.Bot(command_prefix=PREFIX, intents=intents, help_command=None)
+    router = None
+
+# Panels are edited through partial messages built from (channel_id,
+# message_id) handles, so nothing has to be fetched before the first edit.
+panel_cache = PanelCache(PANEL_CACHE_SIZE, PANEL_CACHE_TTL)
+# Owners whose panel is known to still exist: edited, or fetched by verify_panels.
+verified_panels: Set[int] = set()
+# Fingerprint of what each panel currently shows, and built embeds by (owner, fingerprint).
+panel_fingerprints: Dict[int, tuple] = {}
+rendered_panels: "OrderedDict[Tuple[int, tuple], discord.Embed]" = OrderedDict()
+
+store = StateStore(
+    open_backend(
+        STATE_BACKEND,
+        DATA_FILE,
+        STATE_DB_FILE,
+        compact_bytes=STATE_COMPACT_BYTES,
+        pack_file=STATE_PACK_FILE,
+        defaults=BASE_STATE,
+    ),
+    flush_interval=STATE_FLUSH_SECONDS,
+    max_dirty=STATE_FLUSH_MAX_DIRTY,
+)
+tick_pool: Optional[ShardedTickPool] = None
+scheduler = TickScheduler(HOUR_SECONDS)
+# Ranks of this process's cafes, updated wherever a state is written or ticked.
+leaderboard = Leaderboard()
+cafe_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+# How late the event loop woke up for each probe, in seconds.
+loop_lag: Deque[float] = deque(maxlen=1200)
+loop_lag_task: Optional[asyncio.Task] = None
+edits = EditScheduler(concurrency=EDIT_CONCURRENCY, channel_rate=EDIT_CHANNEL_RATE, channel_per=EDIT_CHANNEL_PER)
+metrics_server: Optional[asyncio.AbstractServer] = None
+profiler: Optional[StackSampler] = None
+verify_task: Optional[asyncio.Task] = None
+boot_started = time.monotonic()
+time_to_first_tick: Optional[float] = None
+
+
+# --------------- METRICS ---------------
+metrics = Registry()
+tick_seconds = metrics.histogram("cafe_tick_seconds", "Duration of tick loop passes that had cafes due.")
+ticked_cafes = metrics.counter("cafe_ticked_total", "Cafes advanced by the tick loop.")
+tick_errors = metrics.counter("cafe_tick_errors_total", "Tick loop passes that raised.")
+handler_seconds = metrics.histogram("cafe_handler_seconds", "Control panel button handlers, lock wait included.")
+panels_rehydrated = metrics.counter("cafe_panels_rehydrated_total", "Panels restored from stored ids at boot.")
+panel_checks = metrics.counter("cafe_panel_checks_total", "Background panel verifications by result.")
+metrics.sampled("cafe_resident", "gauge", "Cafes held in memory.", lambda: len(store))
+metrics.sampled("cafe_scheduled", "gauge", "Cafes waiting on the tick loop.", lambda: len(scheduler))
+metrics.sampled(
+    "cafe_state_load_seconds",
+    "gauge",
+    "Time the last load of the state backend took.",
+    lambda: store.load_seconds,
+)
+metrics.sampled("cafe_state_load_bytes", "gauge", "Backend size on disk at the last load.", lambda: store.load_bytes)
+metrics.sampled(
+    "cafe_state_disk_bytes",
+    "gauge",
+    "Backend size on disk after the last write.",
+    lambda: store.disk_bytes,
+)
+metrics.sampled("cafe_state_dirty", "gauge", "Cafes changed since the last flush.", lambda: len(store.dirty))
+metrics.sampled("cafe_state_writes_total", "counter", "Batches written to the state backend.", lambda: store.writes)
+metrics.sampled(
+    "cafe_state_write_failures_total",
+    "counter",
+    "Batches the state backend failed to write.",
+    lambda: store.write_failures,
+)
+metrics.sampled("cafe_state_written_total", "counter", "Cafes written to the state backend.", lambda: store.written)
+metrics.sampled("cafe_state_write_seconds_total", "counter", "Time spent writing batches.", lambda: store.write_seconds)
+metrics.sampled(
+    "cafe_panel_edits_total",
+    "counter",
+    "Panel edits by result.",
+    lambda: {"sent": edits.sent, "failed": edits.failed},
+    label="result",
+)
+metrics.sampled(
+    "cafe_panel_edits_coalesced_total",
+    "counter",
+    "Queued panel edits replaced by a newer one.",
+    lambda: edits.coalesced,
+)
+metrics.sampled("cafe_panel_edit_queue", "gauge", "Panel edits waiting to go out.", lambda: edits.queue_depth)
+metrics.sampled(
+    "cafe_panel_edit_latency_seconds",
+    "gauge",
+    "Queue-to-sent latency of recent panel edits.",
+    lambda: {"0.5": edits.stats()["latency_p50"], "0.99": edits.stats()["latency_p99"]},
+    label="quantile",
+)
+metrics.sampled("cafe_panel_cache_size", "gauge", "Panel handles held in panel_cache.", lambda: len(panel_cache))
+metrics.sampled(
+    "cafe_panel_cache_lookups_total",
+    "counter",
+    "Panel handle lookups by result.",
+    lambda: {"hit": panel_cache.hits, "miss": panel_cache.misses},
+    label="result",
+)
+metrics.sampled(
+    "cafe_panel_cache_evictions_total",
+    "counter",
+    "Panel handles dropped from panel_cache by reason.",
+    lambda: {"size": panel_cache.evictions, "ttl": panel_cache.expirations},
+    label="reason",
+)
+metrics.sampled(
+    "cafe_panel_cache_hit_ratio",
+    "gauge",
+    "Share of panel lookups served from panel_cache.",
+    lambda: panel_cache.stats()["hit_ratio"],
+)
+metrics.sampled(
+    "cafe_routed_requests_total",
+    "counter",
+    "Requests exchanged with the other processes of a sharded deployment.",
+    lambda: (
+        {"forwarded": router.forwarded, "served": router.served, "failed": router.failures, "rejected": router.rejected}
+        if router
+        else {}
+    ),
+    label="outcome",
+)
+metrics.sampled(
+    "cafe_time_to_first_tick_seconds",
+    "gauge",
+    "Seconds from start-up to the end of the first tick pass that advanced a cafe.",
+    lambda: time_to_first_tick or 0.0,
+)
+metrics.sampled(
+    "cafe_loop_lag_seconds",
+    "gauge",
+    "How late recent event loop wakeups were.",
+    lambda: {"0.5": loop_lag_stats()["p50"], "0.99": loop_lag_stats()["p99"], "1": loop_lag_stats()["max"]},
+    label="quantile",
+)
 
 
 # --------------- DATA HELPERS ---------------
-def ensure_file() -> None:
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w", encoding="utf-8") as fp:
-            json.dump({}, fp)
-
-
-def load_data() -> Dict[str, dict]:
-    ensure_file()
-    with open(DATA_FILE, "r", encoding="utf-8") as fp:
-        try:
-            return json.load(fp)
-        except json.JSONDecodeError:
-            return {}
-
+def is_dormant(state: dict, now: float) -> bool:
+    """Cafes nobody is watching are left to ``get_state`` instead of the background loop."""
+    if not (state.get("panel_message_id") and state.get("panel_channel_id")):
+        return True
+    return now - state.get("last_active", 0) > CAFE_IDLE_SECONDS
 
-def save_data(data: Dict[str, dict]) -> None:
-    with open(DATA_FILE, "w", encoding="utf-8") as fp:
-        json.dump(data, fp, indent=2)
 
+def wake(user_id: str, state: dict, now: float) -> None:
+    if user_id not in scheduler and not is_dormant(state, now):
+        scheduler.schedule(user_id, state["last_tick"], now)
 
-def get_state(user_id: int) -> dict:
-    data = load_data()
-    if str(user_id) not in data:
-        data[str(user_id)] = deepcopy(BASE_STATE)
-        data[str(user_id)]["last_tick"] = time.time()
-        save_data(data)
-    return deepcopy(data[str(user_id)])
 
+async def get_state(user_id: int) -> StateHandle:
+    """The user's cafe, caught up to now, as a copy-on-write handle for ``set_state``."""
+    key = str(user_id)
+    now = time.time()
+    state = await store.get(key)
+    if state is None:
+        state = snapshot(BASE_STATE)
+        state["last_tick"] = now
+    elif key not in scheduler:
+        # Dormant cafes skip the background loop; catch them up on demand.
+        elapsed = int((now - state.get("last_tick", now)) // HOUR_SECONDS)
+        if elapsed > 0:
+            tick_state(key, state, elapsed)
+    state["last_active"] = now
+    await store.put(key, state)
+    leaderboard.update(int(user_id), state)
+    if tick_pool is not None:
+        tick_pool.update(key, state)
+    wake(key, state, now)
+    return StateHandle(state)
 
-def set_state(user_id: int, state: dict) -> None:
-    data = load_data()
-    data[str(user_id)] = state
-    save_data(data)
 
+def cafe_lock(user_id) -> asyncio.Lock:
+    """Lock held around every read-modify-write of one user's cafe.
 
-# --------------- GAME HELPERS ---------------
-def working_pcs(state: dict) -> int:
-    return max(0, state["pcs"] - state["broken_pcs"])
+    Locks live only while someone holds or waits on them, so idle cafes
+    cost nothing.
+    """
+    key = str(user_id)
+    lock = cafe_locks.get(key)
+    if lock is None:
+        lock = cafe_locks[key] = asyncio.Lock()
+    return lock
 
 
-def electricity_load(state: dict) -> int:
-    load = 40 + (state["pcs"] * 8) - state["electricity_level"] * 6
-    return max(10, min(100, load))
+def is_busy(user_id: str) -> bool:
+    lock = cafe_locks.get(user_id)
+    return lock is not None and lock.locked()
 
 
-def internet_status(state: dict) -> str:
-    return INTERNET_SPEEDS[min(len(INTERNET_SPEEDS) - 1, state["internet_level"])]
+def owns(user_id: int) -> bool:
+    """Whether this process owns ``user_id``'s cafe; always true without sharding."""
+    return BOT_PROCESSES <= 1 or owner_process(user_id, BOT_PROCESSES) == BOT_PROCESS_INDEX
 
 
-def add_profit(state: dict, amount: float) -> None:
-    timestamp = time.time()
-    state.setdefault("profit_log", []).append([timestamp, amount])
-    state["profit_log"] = [entry for entry in state["profit_log"] if entry[0] >= timestamp - 86400]
+def index_states(now: float) -> None:
+    """Rebuild what is derived from every loaded cafe: panel owners, ranks and the tick schedule."""
+    for user_id, state in store.items():
+        upgrade_state(state)
+        if state.get("panel_message_id"):
+            panel_owners[state["panel_message_id"]] = int(user_id)
+    leaderboard.rebuild(store.items())
+    scheduler.rebuild(((user_id, state) for user_id, state in store.items() if not is_dormant(state, now)), now)
 
 
-def compute_daily_profit(state: dict) -> float:
-    timestamp = time.time()
-    return round(sum(amount for ts, amount in state.get("profit_log", []) if ts >= timestamp - 86400), 2)
+async def set_state(user_id: int, state: StateHandle) -> None:
+    key = str(user_id)
+    resident = await store.commit(key, state)
+    leaderboard.update(int(user_id), resident)
+    if tick_pool is not None:
+        tick_pool.update(key, resident)
+    wake(key, resident, time.time())
 
 
-def add_review(state: dict, text: str, delta: float) -> None:
-    state["latest_review"] = text
-    state["reputation"] = max(0.5, min(5.0, state["reputation"] + delta))
+# --------------- EMBEDS ---------------
+def format_customers(state: dict) -> Tuple[int, int, int, int]:
+    return customer_counts(state)
+
+
+def panel_fingerprint(state: dict) -> tuple:
+    """Everything the panel embed shows or its buttons are enabled by."""
+    staff = state["staff"]
+    alerts = state["alerts"]
+    return (
+        state["is_open"],
+        f"{state['reputation']:.1f}",
+        state["pcs"],
+        state["overheating"],
+        state["broken_pcs"],
+        state["internet_level"],
+        state["electricity_level"],
+        format_customers(state),
+        staff["total"],
+        staff["lazy"],
+        staff["corrupt"],
+        staff["skilled"],
+        state["cash"],
+        compute_daily_profit(state),
+        state["bills"],
+        state["latest_review"],
+        alerts["viruses"],
+        alerts["fire"],
+        alerts["police"],
+        button_mask(state),
+    )
 
 
-def spawn_customers(state: dict, count: int) -> None:
-    customers = state.get("customers", [])
-    for _ in range(count):
-        if len(customers) >= working_pcs(state):
-            break
-        hardcore = random.random() < 0.25
-        suspicious = random.random() < 0.15
-        angry = random.random() < 0.2
-        rate_range = INCOME_PER_CUSTOMER["hardcore" if hardcore else "casual"]
-        base_rate = random.randint(*rate_range)
-        rate = base_rate + state["internet_level"]
-        duration = random.randint(*CUSTOMER_DURATION) + state["shop"].get("coffee", 0)
-        customers.append(
-            {
-                "hardcore": hardcore,
-                "suspicious": suspicious,
-                "angry": angry,
-                "hours_left": duration,
-                "rate": rate,
-            }
-        )
-    state["customers"] = customers
-
-
-def resolve_staff(state: dict) -> Tuple[int, int]:
-    technicians = state["staff"].get("technicians", 0)
-    skilled = state["staff"].get("skilled", 0)
-    lazy = state["staff"].get("lazy", 0)
-    corrupt = state["staff"].get("corrupt", 0)
-
-    fixes = max(0, technicians + skilled - lazy)
-    mischief = max(0, corrupt - skilled)
-    return fixes, mischief
-
-
-def apply_hour(state: dict) -> None:
-    if state["last_tick"] == 0:
-        state["last_tick"] = time.time()
-    pc_stress = working_pcs(state)
-    fixes, mischief = resolve_staff(state)
-
-    if state["is_open"]:
-        earnings = 0
-        remaining_customers = []
-        for customer in state.get("customers", []):
-            earnings += customer["rate"]
-            customer["hours_left"] -= 1
-            if customer["hours_left"] > 0:
-                remaining_customers.append(customer)
-            else:
-                if customer["angry"]:
-                    add_review(state, "They never cleaned the PCs.", -0.1)
-                elif customer["hardcore"]:
-                    add_review(state, "Decent rigs for marathon gaming.", 0.05)
-        state["customers"] = remaining_customers
-        state["cash"] += earnings
-        add_profit(state, earnings)
-        state["daily_profit"] = compute_daily_profit(state)
+def render_panel(
+    user: discord.abc.User, owner_id: int, state: dict, fingerprint: tuple
+) -> Tuple[discord.Embed, discord.ui.View]:
+    """Build the panel payload, reusing the embed built for the same owner and fingerprint."""
+    key = (owner_id, fingerprint)
+    embed = rendered_panels.get(key)
+    if embed is not None:
+        rendered_panels.move_to_end(key)
     else:
-        state["customers"] = []
-
-    if state["customers"] and random.random() < 0.25:
-        state["overheating"] = min(state["pcs"], state["overheating"] + 1)
-
-    if pc_stress <= 0 or random.random() < 0.12 + max(0, state["overheating"] - fixes) * 0.02:
-        if state["broken_pcs"] < state["pcs"]:
-            state["broken_pcs"] += 1
-            add_review(state, "Another station died mid-match.", -0.15)
-
-    state["broken_pcs"] = min(state["pcs"], max(0, state["broken_pcs"] - fixes))
-    if fixes > 0:
-        state["overheating"] = max(0, state["overheating"] - fixes)
-
-    if mischief > 0:
-        loss = mischief * 6
-        state["cash"] = max(0, state["cash"] - loss)
-        state["alerts"]["police"] = min(20, state["alerts"].get("police", 0) + mischief)
-        add_review(state, "Rumors of bribery float around.", -0.05)
-
-    state["bills"] += max(3, electricity_load(state) // 6)
-    salary_cost = state["staff"]["total"] * 2
-    state["bills"] += salary_cost
-
-    if state["bills"] > state["cash"] + 80:
-        state["is_open"] = False
-        state["latest_review"] = "Bills piled up. Doors locked until you pay."
-
-    if random.random() < 0.18:
-        state["alerts"]["viruses"] = min(10, state["alerts"]["viruses"] + 1)
-    if state["alerts"]["viruses"] >= 7 and random.random() < 0.25:
-        state["broken_pcs"] = min(state["pcs"], state["broken_pcs"] + 1)
-
-    fire_risk = electricity_load(state) + state["overheating"] * 4
-    state["alerts"]["fire"] = min(100, max(5, fire_risk))
-    state["alerts"]["police"] = max(0, min(100, state["alerts"].get("police", 0)))
-
-    state["last_tick"] += HOUR_SECONDS
-
-
-def tick_state(user_id: str, state: dict, hours: int) -> dict:
-    for _ in range(hours):
-        apply_hour(state)
-    return state
-
-
-# --------------- EMBEDS ---------------
-def format_customers(state: dict) -> Tuple[int, int, int, int]:
-    active = len(state.get("customers", []))
-    angry = sum(1 for c in state.get("customers", []) if c.get("angry"))
-    hardcore = sum(1 for c in state.get("customers", []) if c.get("hardcore"))
-    suspicious = sum(1 for c in state.get("customers", []) if c.get("suspicious"))
-    return active, angry, hardcore, suspicious
+        embed = rendered_panels[key] = build_panel_embed(user, state)
+        if len(rendered_panels) > PANEL_RENDER_CACHE:
+            rendered_panels.popitem(last=False)
+    # The button mask is the last field of the fingerprint.
+    return embed, panel_layout(fingerprint[-1])
 
 
 def build_panel_embed(user: discord.abc.User, state: dict) -> discord.Embed:
@@ -326,330 +450,166 @@ def build_panel_embed(user: discord.abc.User, state: dict) -> discord.Embed:
 
 
 # --------------- VIEW ---------------
+# One row per panel button: label, action, style and, for action buttons, the
+# rule that disables it. Headers have no action. Bit ``n`` of a panel's button
+# mask is the rule of the ``n``-th action button.
+PANEL_LAYOUT = (
+    ("SYSTEM", None, discord.ButtonStyle.gray, None),
+    ("Buy PC", "buy_pc", discord.ButtonStyle.success, lambda s, c: s["cash"] < 95 + s["pcs"] * 30),
+    ("Repair PC", "repair_pc", discord.ButtonStyle.secondary, lambda s, c: s["broken_pcs"] <= 0 or s["cash"] < 40),
+    (
+        "Upgrade Internet",
+        "upgrade_internet",
+        discord.ButtonStyle.primary,
+        lambda s, c: s["internet_level"] >= len(INTERNET_COSTS) - 1 or s["cash"] < INTERNET_COSTS[s["internet_level"]],
+    ),
+    (
+        "Upgrade Electricity",
+        "upgrade_electric",
+        discord.ButtonStyle.primary,
+        lambda s, c: s["electricity_level"] >= len(ELECTRICITY_COSTS) - 1
+        or s["cash"] < ELECTRICITY_COSTS[s["electricity_level"]],
+    ),
+    ("CUSTOMERS", None, discord.ButtonStyle.gray, None),
+    ("Accept Customers", "accept_customers", discord.ButtonStyle.success, lambda s, c: not s["is_open"] or working_pcs(s) <= 0),
+    ("Kick Angry Customer", "kick_angry", discord.ButtonStyle.danger, lambda s, c: c[1] <= 0),
+    ("Ban Suspicious User", "ban_suspicious", discord.ButtonStyle.danger, lambda s, c: c[3] <= 0),
+    ("STAFF", None, discord.ButtonStyle.gray, None),
+    ("Hire Staff", "hire_staff", discord.ButtonStyle.success, lambda s, c: s["cash"] < 55),
+    ("Fire Staff", "fire_staff", discord.ButtonStyle.secondary, lambda s, c: s["staff"]["total"] <= 0),
+    ("Assign Technician", "assign_tech", discord.ButtonStyle.primary, lambda s, c: s["staff"]["skilled"] <= 0),
+    (
+        "Bribe Corrupt Staff",
+        "bribe_staff",
+        discord.ButtonStyle.danger,
+        lambda s, c: s["staff"]["corrupt"] <= 0 or s["cash"] < 30,
+    ),
+    ("FINANCE", None, discord.ButtonStyle.gray, None),
+    ("Open Cafe", "open_cafe", discord.ButtonStyle.success, lambda s, c: s["is_open"] or s["cash"] < s["open_cost"]),
+    ("Close Cafe", "close_cafe", discord.ButtonStyle.secondary, lambda s, c: not s["is_open"]),
+    ("Pay Bills", "pay_bills", discord.ButtonStyle.primary, lambda s, c: s["bills"] <= 0 or s["cash"] < s["bills"]),
+    ("Take Loan", "take_loan", discord.ButtonStyle.danger, lambda s, c: s["loan"] > 0),
+    ("REPUTATION", None, discord.ButtonStyle.gray, None),
+    ("Clean Cafe", "clean_cafe", discord.ButtonStyle.success, lambda s, c: s["cash"] < 20),
+    ("Improve Service", "improve_service", discord.ButtonStyle.primary, lambda s, c: s["cash"] < 60),
+    ("Fake Review (illegal)", "fake_review", discord.ButtonStyle.danger, lambda s, c: s["cash"] < 35),
+)
+PANEL_RULES = tuple(rule for _, action, _, rule in PANEL_LAYOUT if action is not None)
+PANEL_ACTIONS = frozenset(action for _, action, _, _ in PANEL_LAYOUT if action is not None)
+
+# Message id -> owner id of every known panel, so the shared view can route clicks.
+panel_owners: Dict[int, int] = {}
+# The one view registered with ``bot.add_view``; clicks on every panel reach it.
+panel_controls: Optional["CafeView"] = None
+panel_layouts: Dict[int, "PanelLayout"] = {}
+
+
+def button_mask(state: dict) -> int:
+    """Bitmask of the panel's disabled action buttons."""
+    customers = format_customers(state)
+    mask = 0
+    for bit, rule in enumerate(PANEL_RULES):
+        if rule(state, customers):
+            mask |= 1 << bit
+    return mask
+
+
+def panel_layout(mask: int) -> "PanelLayout":
+    layout = panel_layouts.get(mask)
+    if layout is None:
+        layout = panel_layouts[mask] = PanelLayout(mask)
+    return layout
+
+
 class CafeView(discord.ui.View):
-    def __init__(self, owner_id: int, state: dict):
+    """The control panel's buttons with the actions in ``mask`` disabled.
+
+    Custom ids are the same for every panel, so one instance registered with
+    ``bot.add_view`` serves clicks on any panel; the owner is looked up from
+    the clicked message. Messages are sent with a ``PanelLayout`` instead.
+    """
+
+    def __init__(self, mask: int = 0):
         super().__init__(timeout=None)
-        self.owner_id = owner_id
-        self.state = state
+        self.mask = mask
         self.build_buttons()
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.owner_id:
+        if not owns(interaction.user.id):
+            # The owning process checks the panel when the click reaches it.
+            return True
+        owner_id = panel_owners.get(interaction.message.id)
+        if owner_id is None:
+            state = store.peek(str(interaction.user.id))
+            if state and state.get("panel_message_id") == interaction.message.id:
+                owner_id = panel_owners[interaction.message.id] = interaction.user.id
+        if interaction.user.id != owner_id:
             await interaction.response.send_message("This control panel is bound to another user.", ephemeral=True)
             return False
         return True
 
     def build_buttons(self) -> None:
         self.clear_items()
-        self.add_item(discord.ui.Button(label="SYSTEM", style=discord.ButtonStyle.gray, disabled=True))
-        self.add_item(self._button("Buy PC", "buy_pc", discord.ButtonStyle.success))
-        self.add_item(self._button("Repair PC", "repair_pc", discord.ButtonStyle.secondary))
-        self.add_item(self._button("Upgrade Internet", "upgrade_internet", discord.ButtonStyle.primary))
-        self.add_item(self._button("Upgrade Electricity", "upgrade_electric", discord.ButtonStyle.primary))
-
-        self.add_item(discord.ui.Button(label="CUSTOMERS", style=discord.ButtonStyle.gray, disabled=True))
-        self.add_item(self._button("Accept Customers", "accept_customers", discord.ButtonStyle.success))
-        self.add_item(self._button("Kick Angry Customer", "kick_angry", discord.ButtonStyle.danger))
-        self.add_item(self._button("Ban Suspicious User", "ban_suspicious", discord.ButtonStyle.danger))
-
-        self.add_item(discord.ui.Button(label="STAFF", style=discord.ButtonStyle.gray, disabled=True))
-        self.add_item(self._button("Hire Staff", "hire_staff", discord.ButtonStyle.success))
-        self.add_item(self._button("Fire Staff", "fire_staff", discord.ButtonStyle.secondary))
-        self.add_item(self._button("Assign Technician", "assign_tech", discord.ButtonStyle.primary))
-        self.add_item(self._button("Bribe Corrupt Staff", "bribe_staff", discord.ButtonStyle.danger))
-
-        self.add_item(discord.ui.Button(label="FINANCE", style=discord.ButtonStyle.gray, disabled=True))
-        self.add_item(self._button("Open Cafe", "open_cafe", discord.ButtonStyle.success))
-        self.add_item(self._button("Close Cafe", "close_cafe", discord.ButtonStyle.secondary))
-        self.add_item(self._button("Pay Bills", "pay_bills", discord.ButtonStyle.primary))
-        self.add_item(self._button("Take Loan", "take_loan", discord.ButtonStyle.danger))
-
-        self.add_item(discord.ui.Button(label="REPUTATION", style=discord.ButtonStyle.gray, disabled=True))
-        self.add_item(self._button("Clean Cafe", "clean_cafe", discord.ButtonStyle.success))
-        self.add_item(self._button("Improve Service", "improve_service", discord.ButtonStyle.primary))
-        self.add_item(self._button("Fake Review (illegal)", "fake_review", discord.ButtonStyle.danger))
-        self.refresh_disabled()
-
-    def _button(self, label: str, action: str, style: discord.ButtonStyle) -> discord.ui.Button:
-        button = discord.ui.Button(label=label, style=style, custom_id=f"{action}_{self.owner_id}")
-        button.callback = getattr(self, action)
-        return button
-
-    def refresh_disabled(self) -> None:
-        state = self.state
-        cost_pc = 95 + state["pcs"] * 30
-        cost_internet = INTERNET_COSTS[state["internet_level"]] if state["internet_level"] < len(INTERNET_COSTS) else 9999
-        cost_electric = ELECTRICITY_COSTS[state["electricity_level"]] if state["electricity_level"] < len(ELECTRICITY_COSTS) else 9999
-        active, angry, hardcore, suspicious = format_customers(state)
-
-        for item in self.children:
-            if not isinstance(item, discord.ui.Button) or item.disabled:
+        bit = 0
+        for label, action, style, _ in PANEL_LAYOUT:
+            if action is None:
+                self.add_item(
+                    discord.ui.Button(label=label, style=style, disabled=True, custom_id=f"cafe:header:{label.lower()}")
+                )
                 continue
-            if item.custom_id.startswith("buy_pc"):
-                item.disabled = state["cash"] < cost_pc
-            elif item.custom_id.startswith("repair_pc"):
-                item.disabled = state["broken_pcs"] <= 0 or state["cash"] < 40
-            elif item.custom_id.startswith("upgrade_internet"):
-                item.disabled = state["internet_level"] >= len(INTERNET_COSTS) - 1 or state["cash"] < cost_internet
-            elif item.custom_id.startswith("upgrade_electric"):
-                item.disabled = state["electricity_level"] >= len(ELECTRICITY_COSTS) - 1 or state["cash"] < cost_electric
-            elif item.custom_id.startswith("accept_customers"):
-                item.disabled = not state["is_open"] or working_pcs(state) <= 0
-            elif item.custom_id.startswith("kick_angry"):
-                item.disabled = angry <= 0
-            elif item.custom_id.startswith("ban_suspicious"):
-                item.disabled = suspicious <= 0
-            elif item.custom_id.startswith("hire_staff"):
-                item.disabled = state["cash"] < 55
-            elif item.custom_id.startswith("fire_staff"):
-                item.disabled = state["staff"]["total"] <= 0
-            elif item.custom_id.startswith("assign_tech"):
-                item.disabled = state["staff"]["skilled"] <= 0
-            elif item.custom_id.startswith("bribe_staff"):
-                item.disabled = state["staff"]["corrupt"] <= 0 or state["cash"] < 30
-            elif item.custom_id.startswith("open_cafe"):
-                item.disabled = state["is_open"] or state["cash"] < state["open_cost"]
-            elif item.custom_id.startswith("close_cafe"):
-                item.disabled = not state["is_open"]
-            elif item.custom_id.startswith("pay_bills"):
-                item.disabled = state["bills"] <= 0 or state["cash"] < state["bills"]
-            elif item.custom_id.startswith("take_loan"):
-                item.disabled = state["loan"] > 0
-            elif item.custom_id.startswith("clean_cafe"):
-                item.disabled = state["cash"] < 20
-            elif item.custom_id.startswith("improve_service"):
-                item.disabled = state["cash"] < 60
-            elif item.custom_id.startswith("fake_review"):
-                item.disabled = state["cash"] < 35
+            button = discord.ui.Button(
+                label=label, style=style, custom_id=f"cafe:{action}", disabled=bool(self.mask >> bit & 1)
+            )
+            button.callback = partial(self._locked, action)
+            self.add_item(button)
+            bit += 1
+
+    async def _locked(self, action: str, interaction: discord.Interaction) -> None:
+        started = time.perf_counter()
+        try:
+            if not owns(interaction.user.id):
+                payload = {
+                    "kind": "click",
+                    "action": action,
+                    "user_id": interaction.user.id,
+                    "channel_id": interaction.message.channel.id,
+                    "message_id": interaction.message.id,
+                }
+                await route_interaction(interaction, payload)
+                return
+            async with cafe_lock(interaction.user.id):
+                await self.act(action, interaction)
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, action=action)
 
     async def _update(self, interaction: discord.Interaction, state: dict) -> None:
-        set_state(self.owner_id, state)
-        embed = build_panel_embed(interaction.user, state)
-        await interaction.response.edit_message(embed=embed, view=CafeView(self.owner_id, state))
-
-    async def buy_pc(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        cost = 95 + state["pcs"] * 30
-        if state["cash"] < cost:
-            await interaction.response.send_message("You can't afford another junk PC yet.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        state["pcs"] += 1
-        state["overheating"] += 1
-        add_review(state, "More seats, same dusty floor.", 0)
-        await self._update(interaction, state)
-
-    async def repair_pc(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["broken_pcs"] <= 0:
-            await interaction.response.send_message("No broken rigs to fix.", ephemeral=True)
-            return
-        cost = 40
-        if state["cash"] < cost:
-            await interaction.response.send_message("Too broke for duct tape repairs.", ephemeral=True)
+        owner_id = interaction.user.id
+        await set_state(owner_id, state)
+        fingerprint = panel_fingerprint(state)
+        embed, view = render_panel(interaction.user, owner_id, state, fingerprint)
+        await edits.respond(owner_id, lambda: interaction.response.edit_message(embed=embed, view=view))
+        panel_fingerprints[owner_id] = fingerprint
+
+    async def act(self, action: str, interaction: discord.Interaction) -> None:
+        state = await get_state(interaction.user.id)
+        refusal = PLAYER_ACTIONS[action](state)
+        if refusal is not None:
+            await interaction.response.send_message(refusal, ephemeral=True)
             return
-        state["cash"] -= cost
-        if random.random() < 0.4:
-            state["broken_pcs"] = min(state["pcs"], state["broken_pcs"] + 1)
-            add_review(state, "Repair scam ruined another station.", -0.2)
-        else:
-            state["broken_pcs"] = max(0, state["broken_pcs"] - 1)
         await self._update(interaction, state)
 
-    async def upgrade_internet(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["internet_level"] >= len(INTERNET_COSTS) - 1:
-            await interaction.response.send_message("Connection is already maxed.", ephemeral=True)
-            return
-        cost = INTERNET_COSTS[state["internet_level"]]
-        if state["cash"] < cost:
-            await interaction.response.send_message("Save up for a better ISP plan.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        state["internet_level"] += 1
-        add_review(state, "Ping finally feels playable.", 0.1)
-        await self._update(interaction, state)
 
-    async def upgrade_electric(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["electricity_level"] >= len(ELECTRICITY_COSTS) - 1:
-            await interaction.response.send_message("Power grid already stable enough.", ephemeral=True)
-            return
-        cost = ELECTRICITY_COSTS[state["electricity_level"]]
-        if state["cash"] < cost:
-            await interaction.response.send_message("Can't pay the electrician yet.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        state["electricity_level"] += 1
-        state["overheating"] = max(0, state["overheating"] - 1)
-        await self._update(interaction, state)
+class PanelLayout(CafeView):
+    """The buttons a panel message shows, never dispatched to.
 
-    async def accept_customers(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if not state["is_open"]:
-            await interaction.response.send_message("Open the cafe before inviting anyone.", ephemeral=True)
-            return
-        spawn_customers(state, random.randint(1, 3))
-        await self._update(interaction, state)
+    discord.py only tracks dispatchable views against the messages they are
+    sent with, and refreshes tracked views from message updates. A layout is
+    not tracked, so one per mask can be reused for every panel; clicks go to
+    ``panel_controls``.
+    """
 
-    async def kick_angry(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        customers = state.get("customers", [])
-        angry = [c for c in customers if c.get("angry")]
-        if not angry:
-            await interaction.response.send_message("No angry customers to kick.", ephemeral=True)
-            return
-        target = angry[0]
-        customers.remove(target)
-        state["customers"] = customers
-        add_review(state, "Bouncer removed a screamer.", 0.05)
-        await self._update(interaction, state)
-
-    async def ban_suspicious(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        customers = state.get("customers", [])
-        suspects = [c for c in customers if c.get("suspicious")]
-        if not suspects:
-            await interaction.response.send_message("No suspicious activity detected.", ephemeral=True)
-            return
-        target = suspects[0]
-        customers.remove(target)
-        state["customers"] = customers
-        state["alerts"]["police"] = max(0, state["alerts"]["police"] - 3)
-        await self._update(interaction, state)
-
-    async def hire_staff(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        cost = 55
-        if state["cash"] < cost:
-            await interaction.response.send_message("Can't afford new hires.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        state["staff"]["total"] += 1
-        roll = random.random()
-        if roll < 0.4:
-            state["staff"]["lazy"] += 1
-        elif roll < 0.65:
-            state["staff"]["corrupt"] += 1
-        else:
-            state["staff"]["skilled"] += 1
-        await self._update(interaction, state)
-
-    async def fire_staff(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["staff"]["total"] <= 0:
-            await interaction.response.send_message("No staff to fire.", ephemeral=True)
-            return
-        state["staff"]["total"] -= 1
-        for key in ("lazy", "corrupt", "skilled", "technicians"):
-            if state["staff"].get(key, 0) > 0:
-                state["staff"][key] -= 1
-                break
-        await self._update(interaction, state)
-
-    async def assign_tech(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["staff"]["skilled"] <= 0:
-            await interaction.response.send_message("No skilled worker to assign.", ephemeral=True)
-            return
-        state["staff"]["skilled"] -= 1
-        state["staff"]["technicians"] += 1
-        add_review(state, "A tech now patrols the rigs.", 0.05)
-        await self._update(interaction, state)
-
-    async def bribe_staff(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["staff"]["corrupt"] <= 0:
-            await interaction.response.send_message("No corrupt staff to bribe.", ephemeral=True)
-            return
-        cost = 30
-        if state["cash"] < cost:
-            await interaction.response.send_message("You can't cover the hush money.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        state["alerts"]["police"] = max(0, state["alerts"]["police"] - 4)
-        add_review(state, "Rumors quieted down for now.", 0)
-        await self._update(interaction, state)
-
-    async def open_cafe(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["is_open"]:
-            await interaction.response.send_message("Already open for business.", ephemeral=True)
-            return
-        if state["cash"] < state["open_cost"]:
-            await interaction.response.send_message("Can't afford to unlock the doors.", ephemeral=True)
-            return
-        state["cash"] -= state["open_cost"]
-        state["is_open"] = True
-        add_review(state, "Doors creak open again.", 0)
-        set_state(self.owner_id, state)
-        await interaction.response.edit_message(embed=build_panel_embed(interaction.user, state), view=CafeView(self.owner_id, state))
-
-    async def close_cafe(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if not state["is_open"]:
-            await interaction.response.send_message("Already closed.", ephemeral=True)
-            return
-        state["is_open"] = False
-        state["customers"] = []
-        await self._update(interaction, state)
-
-    async def pay_bills(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["bills"] <= 0:
-            await interaction.response.send_message("No bills pending.", ephemeral=True)
-            return
-        if state["cash"] < state["bills"]:
-            await interaction.response.send_message("Not enough cash to settle debts.", ephemeral=True)
-            return
-        state["cash"] -= state["bills"]
-        state["bills"] = 0
-        state["is_open"] = True
-        add_review(state, "Suppliers got paid. Doors stay open.", 0.1)
-        await self._update(interaction, state)
-
-    async def take_loan(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        if state["loan"] > 0:
-            await interaction.response.send_message("Repay your current loan first.", ephemeral=True)
-            return
-        amount = 120
-        state["cash"] += amount
-        state["loan"] = amount * 1.25
-        state["alerts"]["police"] = min(100, state["alerts"]["police"] + 5)
-        await self._update(interaction, state)
-
-    async def clean_cafe(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        cost = 20
-        if state["cash"] < cost:
-            await interaction.response.send_message("Too broke to buy cleaning supplies.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        add_review(state, "Floors finally got mopped.", 0.15)
-        await self._update(interaction, state)
-
-    async def improve_service(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        cost = 60
-        if state["cash"] < cost:
-            await interaction.response.send_message("Can't afford training right now.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        add_review(state, "Staff learned to reboot routers politely.", 0.25)
-        spawn_customers(state, 1)
-        await self._update(interaction, state)
-
-    async def fake_review(self, interaction: discord.Interaction):
-        state = get_state(self.owner_id)
-        cost = 35
-        if state["cash"] < cost:
-            await interaction.response.send_message("Can't pay for bots yet.", ephemeral=True)
-            return
-        state["cash"] -= cost
-        add_review(state, "Suspiciously glowing online praise.", 0.35)
-        state["alerts"]["police"] = min(100, state["alerts"]["police"] + 10)
-        await self._update(interaction, state)
+    def is_dispatchable(self) -> bool:
+        return False
 
 
 # --------------- SHOP ---------------
@@ -673,54 +633,223 @@ class ShopView(discord.ui.View):
 
     async def purchase(self, interaction: discord.Interaction):
         choice = self.select.values[0]
-        item = SHOP_ITEMS[choice]
-        state = get_state(self.owner_id)
-        if state["cash"] < item["cost"]:
-            await interaction.response.send_message("Too expensive right now.", ephemeral=True)
+        if not owns(self.owner_id):
+            payload = {"kind": "shop", "user_id": self.owner_id, "choice": choice}
+            await route_interaction(interaction, payload, thinking=True)
             return
-        state["cash"] -= item["cost"]
-        state["shop"][choice] = state["shop"].get(choice, 0) + 1
-        for key, value in item["effect"].items():
-            if key == "internet_level":
-                state["internet_level"] = min(len(INTERNET_SPEEDS) - 1, state["internet_level"] + value)
-            elif key == "electricity_level":
-                state["electricity_level"] = min(len(ELECTRICITY_COSTS) - 1, state["electricity_level"] + value)
-            elif key == "pcs":
-                state["pcs"] += value
-            elif key == "overheating":
-                state["overheating"] = max(0, state["overheating"] - abs(value) if value < 0 else state["overheating"] + value)
-            elif key == "reputation":
-                add_review(state, state["latest_review"], value)
-            elif key == "alerts.police":
-                state["alerts"]["police"] = max(0, state["alerts"]["police"] + value)
-            elif key == "customers_stay":
-                state.setdefault("shop", {})
-        set_state(self.owner_id, state)
-        await interaction.response.send_message(
-            f"Purchased {item['name']}!", ephemeral=True
+        await interaction.response.send_message(await buy_item(self.owner_id, choice), ephemeral=True)
+
+
+async def buy_item(owner_id: int, choice: str) -> str:
+    """Apply a shop purchase to the owner's cafe and return the reply for them."""
+    async with cafe_lock(owner_id):
+        state = await get_state(owner_id)
+        refusal = buy_shop_item(state, choice)
+        if refusal is not None:
+            return refusal
+        await set_state(owner_id, state)
+        return f"Purchased {SHOP_ITEMS[choice]['name']}!"
+
+
+# --------------- ROUTING ---------------
+# Commands and clicks reach the process holding the guild's gateway shard.
+# For cafes another process owns, the request is forwarded there and run
+# through the same handlers with the stand-ins below; the owner edits the
+# panel itself and sends back any ephemeral reply for this process to relay.
+ROUTED_COMMANDS = ("cafe", "data")
+ROUTE_UNAVAILABLE = "Your cafe is handled by a bot process that is not answering. Try again in a moment."
+
+
+class RemoteUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.display_name = str(user_id)
+
+
+class RoutedResponse:
+    def __init__(self, interaction: "RoutedInteraction"):
+        self.interaction = interaction
+        self.reply: Optional[str] = None
+
+    async def send_message(self, content: Optional[str] = None, **_) -> None:
+        self.reply = content
+
+    async def edit_message(self, embed: Optional[discord.Embed] = None, view=None, **_) -> None:
+        await self.interaction.message.edit(embed=embed, view=view)
+
+
+class RoutedInteraction:
+    def __init__(self, user_id: int, channel_id: int, message_id: int):
+        self.user = RemoteUser(user_id)
+        self.message = partial_panel(channel_id, message_id)
+        self.response = RoutedResponse(self)
+
+
+class RoutedContext:
+    def __init__(self, user_id: int, channel_id: int):
+        self.author = RemoteUser(user_id)
+        self.channel = bot.get_partial_messageable(channel_id)
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+async def route_interaction(interaction: discord.Interaction, payload: dict, thinking: bool = False) -> None:
+    """Acknowledge a click for a cafe owned elsewhere, forward it and relay the owner's reply."""
+    await interaction.response.defer(ephemeral=True, thinking=thinking)
+    try:
+        reply = (await router.forward(owner_process(payload["user_id"], BOT_PROCESSES), payload)).get("reply")
+    except RuntimeError as exc:
+        print(f"[WARN] {exc}")
+        reply = ROUTE_UNAVAILABLE
+    if reply:
+        await interaction.followup.send(reply, ephemeral=True)
+
+
+async def route_command(ctx: commands.Context) -> None:
+    payload = {"kind": "command", "name": ctx.command.name, "user_id": ctx.author.id, "channel_id": ctx.channel.id}
+    try:
+        await router.forward(owner_process(ctx.author.id, BOT_PROCESSES), payload)
+    except RuntimeError as exc:
+        print(f"[WARN] {exc}")
+        await ctx.send(ROUTE_UNAVAILABLE)
+
+
+async def handle_routed(payload: dict) -> dict:
+    """Run a request forwarded by another process for a cafe this one owns."""
+    if payload["kind"] == "leaderboard":
+        return leaderboard_reply(payload)
+    user_id = payload["user_id"]
+    if not owns(user_id):
+        raise RuntimeError(f"Process {BOT_PROCESS_INDEX} does not own user {user_id}.")
+    kind = payload["kind"]
+    if kind == "click":
+        if payload["action"] not in PANEL_ACTIONS:
+            raise RuntimeError(f"Unknown panel action {payload['action']!r}.")
+        interaction = RoutedInteraction(user_id, payload["channel_id"], payload["message_id"])
+        if await panel_controls.interaction_check(interaction):
+            await panel_controls._locked(payload["action"], interaction)
+        return {"reply": interaction.response.reply}
+    if kind == "shop":
+        if payload["choice"] not in SHOP_ITEMS:
+            raise RuntimeError(f"Unknown shop item {payload['choice']!r}.")
+        return {"reply": await buy_item(user_id, payload["choice"])}
+    if kind == "command" and payload["name"] in ROUTED_COMMANDS:
+        await bot.get_command(payload["name"]).callback(RoutedContext(user_id, payload["channel_id"]))
+        return {}
+    raise RuntimeError(f"Cannot route a {kind!r} request.")
+
+
+# --------------- LEADERBOARD ---------------
+LEADERBOARD_TITLES = {"cash": "💰 RICHEST CAFES", "reputation": "⭐ BEST REVIEWED CAFES", "pcs": "💻 BIGGEST CAFES"}
+
+
+def leaderboard_reply(request: dict) -> dict:
+    """This process's part of a leaderboard: its top cafes and how many of its cafes rank above the caller."""
+    metric, user_id = request["metric"], request["user_id"]
+    value = leaderboard.value(metric, user_id)
+    reply = {"top": leaderboard.top(metric, request["count"]), "value": value}
+    if value is None:
+        value = request.get("value")
+    if value is not None:
+        reply["ahead"] = leaderboard.ahead(metric, value, user_id)
+    return reply
+
+
+async def ask_leaderboard(process: int, request: dict) -> dict:
+    if process == BOT_PROCESS_INDEX:
+        return leaderboard_reply(request)
+    return await router.forward(process, request)
+
+
+async def query_leaderboard(
+    metric: str, user_id: int, count: int
+) -> Tuple[List[Tuple[int, float]], Optional[int], List[int]]:
+    """The top ``count`` cafes over every process, the caller's rank and the processes that did not answer."""
+    if router is None:
+        return leaderboard.top(metric, count), leaderboard.rank(metric, user_id), []
+    request = {"kind": "leaderboard", "metric": metric, "user_id": user_id, "count": count}
+    # Only the owner knows the caller's value, which the others need to count who is ahead.
+    owner = owner_process(user_id, BOT_PROCESSES)
+    processes = [owner] + [process for process in range(BOT_PROCESSES) if process != owner]
+    replies: Dict[int, dict] = {}
+    missing = []
+    for batch in ([owner], processes[1:]):
+        value = replies[owner]["value"] if owner in replies else None
+        answers = await asyncio.gather(
+            *(ask_leaderboard(process, dict(request, value=value)) for process in batch), return_exceptions=True
         )
+        for process, answer in zip(batch, answers):
+            if isinstance(answer, RuntimeError):
+                print(f"[WARN] {answer}")
+                missing.append(process)
+            elif isinstance(answer, BaseException):
+                raise answer
+            else:
+                replies[process] = answer
+    entries = [(int(entry_id), value) for reply in replies.values() for entry_id, value in reply["top"]]
+    top = sorted(entries, key=lambda entry: (-entry[1], entry[0]))[:count]
+    ranked = owner in replies and replies[owner]["value"] is not None
+    rank = 1 + sum(reply.get("ahead", 0) for reply in replies.values()) if ranked else None
+    return top, rank, missing
+
+
+def format_metric(metric: str, value: float) -> str:
+    if metric == "cash":
+        return f"${round(value, 2):,}"
+    if metric == "reputation":
+        return f"{value:.2f}/5"
+    return f"{value} PCs"
+
+
+def leaderboard_embed(
+    metric: str, top: List[Tuple[int, float]], rank: Optional[int], missing: List[int]
+) -> discord.Embed:
+    embed = discord.Embed(
+        title=LEADERBOARD_TITLES[metric],
+        description="\n".join(
+            f"**{place}.** <@{user_id}> · {format_metric(metric, value)}"
+            for place, (user_id, value) in enumerate(top, 1)
+        )
+        or "No cafes yet.",
+        color=CYBER_CYAN,
+    )
+    footer = f"You are #{rank}." if rank is not None else "Open a cafe with !cafe to get ranked."
+    if missing:
+        footer += f" Processes {', '.join(map(str, missing))} did not answer, so ranks may be off."
+    embed.set_footer(text=footer)
+    return embed
 
 
 # --------------- COMMANDS ---------------
 @bot.command(name="cafe")
 async def cafe(ctx: commands.Context):
-    state = get_state(ctx.author.id)
-    embed = build_panel_embed(ctx.author, state)
-    view = CafeView(ctx.author.id, state)
-    message = None
-    if state.get("panel_message_id"):
-        channel = bot.get_channel(state["panel_channel_id"])
-        try:
-            message = await channel.fetch_message(state["panel_message_id"])
-            await message.edit(embed=embed, view=view)
-        except Exception:
-            message = None
-    if message is None:
-        message = await ctx.send(embed=embed, view=view)
-        state["panel_message_id"] = message.id
-        state["panel_channel_id"] = message.channel.id
-        set_state(ctx.author.id, state)
-    panel_cache[ctx.author.id] = message
+    if not owns(ctx.author.id):
+        await route_command(ctx)
+        return
+    async with cafe_lock(ctx.author.id):
+        state = await get_state(ctx.author.id)
+        fingerprint = panel_fingerprint(state)
+        embed, view = render_panel(ctx.author, ctx.author.id, state, fingerprint)
+        message = None
+        if state.get("panel_message_id") and state.get("panel_channel_id"):
+            message = panel_message(ctx.author.id, state)
+            try:
+                await message.edit(embed=embed, view=view)
+            except Exception:
+                panel_owners.pop(state["panel_message_id"], None)
+                forget_panel(ctx.author.id)
+                message = None
+        if message is None:
+            message = await ctx.send(embed=embed, view=view)
+            state["panel_message_id"] = message.id
+            state["panel_channel_id"] = message.channel.id
+            await set_state(ctx.author.id, state)
+        panel_cache.put(ctx.author.id, message.channel.id, message.id)
+        panel_owners[message.id] = ctx.author.id
+        panel_fingerprints[ctx.author.id] = fingerprint
+        verified_panels.add(ctx.author.id)
 
 
 @bot.command(name="help")
@@ -742,6 +871,11 @@ async def help_cmd(ctx: commands.Context):
         value="Use !shop to buy upgrades like better PCs, internet, electricity optimizers, and ambience items.",
         inline=False,
     )
+    embed.add_field(
+        name="Leaderboard",
+        value="Use !leaderboard cash, reputation or pcs to see the top cafes and where yours ranks.",
+        inline=False,
+    )
     embed.set_footer(text="Progress is slow. Decisions matter.")
     await ctx.send(embed=embed)
 
@@ -752,40 +886,360 @@ async def shop_cmd(ctx: commands.Context):
     await ctx.send("Select an item to purchase:", view=view)
 
 
+@bot.command(name="leaderboard")
+async def leaderboard_cmd(ctx: commands.Context, metric: str = "cash"):
+    metric = metric.lower()
+    if metric not in LEADERBOARD_METRICS:
+        await ctx.send(f"Rank cafes by one of: {', '.join(LEADERBOARD_METRICS)}.")
+        return
+    top, rank, missing = await query_leaderboard(metric, ctx.author.id, LEADERBOARD_SIZE)
+    await ctx.send(embed=leaderboard_embed(metric, top, rank, missing))
+
+
 @bot.command(name="data")
 async def data_cmd(ctx: commands.Context):
-    state = get_state(ctx.author.id)
-    payload = json.dumps(state, indent=2)
+    if not owns(ctx.author.id):
+        await route_command(ctx)
+        return
+    async with cafe_lock(ctx.author.id):
+        state = await get_state(ctx.author.id)
+        payload = json.dumps(dict(state), indent=2)
     buffer = io.BytesIO(payload.encode("utf-8"))
     await ctx.send(file=discord.File(buffer, filename="data.json"))
 
 
+MIGRATE_BACKENDS = ("sqlite", "packed")
+
+
+@bot.command(name="migrate")
+@commands.is_owner()
+async def migrate_cmd(ctx: commands.Context):
+    target = STATE_DB_FILE if STATE_BACKEND == "sqlite" else STATE_PACK_FILE
+    if STATE_BACKEND not in MIGRATE_BACKENDS or os.path.abspath(target) == os.path.abspath(DATA_FILE):
+        # The journal backend's snapshot is DATA_FILE itself; importing it
+        # would roll cafes back to their last compaction.
+        await ctx.send(f"!migrate imports {DATA_FILE} into a {' or '.join(MIGRATE_BACKENDS)} store kept elsewhere.")
+        return
+    legacy = await asyncio.to_thread(read_snapshot, DATA_FILE)
+    # Wait out handlers holding these cafes so none saves its older copy over
+    # the import; ticks skip locked cafes until the schedule is rebuilt.
+    locks = [cafe_lock(user_id) for user_id in sorted(legacy)]
+    for lock in locks:
+        await lock.acquire()
+    try:
+        imported = store.import_states({user_id: upgrade_state(state) for user_id, state in legacy.items()})
+        index_states(time.time())
+        if tick_pool is not None:
+            for user_id in legacy:
+                tick_pool.update(user_id, store.peek(user_id))
+    finally:
+        for lock in locks:
+            lock.release()
+    await ctx.send(f"Imported {imported} cafes from {DATA_FILE} into the {STATE_BACKEND} store.")
+
+
+@bot.command(name="workers")
+@commands.is_owner()
+async def workers_cmd(ctx: commands.Context, count: int):
+    if tick_pool is None:
+        await ctx.send("Ticks run in this process. Start with TICK_WORKERS set to use a worker pool.")
+        return
+    if count < 1:
+        await ctx.send("The pool needs at least one worker.")
+        return
+    await tick_pool.resize(count)
+    await ctx.send(f"Tick pool rebalanced over {count} workers.")
+
+
+@bot.command(name="stats")
+@commands.is_owner()
+async def stats_cmd(ctx: commands.Context):
+    await ctx.send(embed=stats_embed())
+
+
+@bot.command(name="profile")
+@commands.is_owner()
+async def profile_cmd(ctx: commands.Context):
+    global profiler
+    if profiler is None:
+        # Commands run on the event loop thread, which is the one ticks run on.
+        profiler = StackSampler(threading.get_ident(), interval=PROFILE_INTERVAL, focus="hourly_tick")
+        profiler.start()
+        await ctx.send("Sampling the tick loop. Run !profile again to stop and get the hot stacks.")
+        return
+    report = profiler.stop()
+    profiler = None
+    buffer = io.BytesIO(report.encode("utf-8"))
+    await ctx.send(file=discord.File(buffer, filename="tick-profile.txt"))
+
+
 # --------------- BACKGROUND LOOP ---------------
-@tasks.loop(seconds=HOUR_SECONDS)
+def advance_states(due: List[Tuple[str, dict, int]]) -> None:
+    if TICK_ENGINE == "numpy":
+        # Copying cafes into columns and back costs more than a few hours of
+        # apply_hour, so the engine only takes cafes that are catching up.
+        # Long offline gaps are cheaper still through the fast-forward path.
+        vectorised = [VECTOR_MIN_HOURS <= hours < FAST_FORWARD_MIN_HOURS for _, _, hours in due]
+        batch = [entry for entry, picked in zip(due, vectorised) if picked]
+        vector_engine.advance([state for _, state, _ in batch], [hours for _, _, hours in batch])
+        due = [entry for entry, picked in zip(due, vectorised) if not picked]
+    for user_id, state, hours in due:
+        tick_state(user_id, state, hours)
+
+
+@tasks.loop(seconds=TICK_RESOLUTION)
 async def hourly_tick():
-    data = load_data()
-    now = time.time()
-    changed = False
-    for user_id, state in data.items():
-        elapsed = int((now - state.get("last_tick", now)) // HOUR_SECONDS)
-        if elapsed <= 0:
-            continue
-        changed = True
-        state = tick_state(user_id, state, elapsed)
-        data[user_id] = state
+    global time_to_first_tick
+    started = time.perf_counter()
+    try:
+        processed = await tick_due(time.time())
+    except Exception as exc:
+        tick_errors.inc()
+        print(f"[WARN] Tick failed: {exc!r}")
+        traceback.print_exc()
+        return
+    if processed:
+        tick_seconds.observe(time.perf_counter() - started)
+        ticked_cafes.inc(processed)
+        if time_to_first_tick is None:
+            time_to_first_tick = time.monotonic() - boot_started
+            print(f"First tick advanced {processed} cafes {time_to_first_tick:.1f}s after start-up.")
+
+
+async def tick_due(now: float) -> int:
+    """Advance the cafes whose hour is up and queue their panel refreshes; returns how many."""
+    due_ids = scheduler.pop_due(now)
+    if not due_ids:
+        return 0
+    # A handler is between reading and saving these cafes. Ticking them now
+    # would be overwritten by its copy, so try again a little later.
+    for user_id in [user_id for user_id in due_ids if is_busy(user_id)]:
+        due_ids.remove(user_id)
+        scheduler.schedule(user_id, store.peek(user_id).get("last_tick", now), now)
+    if tick_pool is not None:
+        ticked = []
+        for user_id, delta in (await tick_pool.tick(now, due_ids)).items():
+            state = store.peek(user_id)
+            state.update(delta)
+            store.mark_dirty(user_id)
+            ticked.append((user_id, state))
+    else:
+        due = []
+        for user_id in due_ids:
+            state = store.peek(user_id)
+            elapsed = int((now - state.get("last_tick", now)) // HOUR_SECONDS)
+            if elapsed > 0:
+                due.append((user_id, state, elapsed))
+        advance_states(due)
+        for user_id, _, _ in due:
+            store.mark_dirty(user_id)
+        ticked = [(user_id, state) for user_id, state, _ in due]
+    for user_id in due_ids:
+        state = store.peek(user_id)
+        if not is_dormant(state, now):
+            scheduler.schedule(user_id, state.get("last_tick", now), now)
+
+    for user_id, state in ticked:
+        leaderboard.update(int(user_id), state)
         if state.get("panel_message_id") and state.get("panel_channel_id"):
-            channel = bot.get_channel(state["panel_channel_id"])
-            if channel:
-                try:
-                    message = panel_cache.get(int(user_id)) or await channel.fetch_message(state["panel_message_id"])
-                    panel_cache[int(user_id)] = message
-                    user = bot.get_user(int(user_id)) or (message.author if hasattr(message, "author") else bot.user)
-                    embed = build_panel_embed(user, state)
-                    await message.edit(embed=embed, view=CafeView(int(user_id), state))
-                except Exception:
-                    panel_cache.pop(int(user_id), None)
-    if changed:
-        save_data(data)
+            if panel_fingerprints.get(int(user_id)) == panel_fingerprint(state):
+                continue
+            edits.refresh(
+                int(user_id),
+                state["panel_channel_id"],
+                lambda uid=user_id: refresh_panel(uid),
+                on_error=lambda exc, uid=int(user_id): panel_edit_failed(uid, exc),
+            )
+    return len(ticked)
+
+
+def forget_panel(user_id: int) -> None:
+    panel_cache.pop(user_id)
+    panel_fingerprints.pop(user_id, None)
+    verified_panels.discard(user_id)
+
+
+def drop_panel(user_id: int) -> None:
+    """Unlink a panel that was deleted or can no longer be reached; ``!cafe`` posts a new one."""
+    forget_panel(user_id)
+    key = str(user_id)
+    state = store.peek(key)
+    if state is None or not state.get("panel_message_id"):
+        return
+    panel_owners.pop(state["panel_message_id"], None)
+    state["panel_message_id"] = None
+    state["panel_channel_id"] = None
+    store.mark_dirty(key)
+    # Without a panel the cafe is dormant and catches up on its next command.
+    scheduler.unschedule(key)
+
+
+def panel_edit_failed(user_id: int, exc: Exception) -> None:
+    if isinstance(exc, (discord.NotFound, discord.Forbidden)):
+        drop_panel(user_id)
+    else:
+        forget_panel(user_id)
+
+
+def partial_panel(channel_id: int, message_id: int) -> discord.PartialMessage:
+    return bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+
+
+def panel_message(user_id: int, state: dict) -> discord.PartialMessage:
+    """The user's panel as a partial message, from ``panel_cache`` or else the stored ids."""
+    handle = panel_cache.get(user_id)
+    if handle is None:
+        handle = (state["panel_channel_id"], state["panel_message_id"])
+        panel_cache.put(user_id, *handle)
+    return partial_panel(*handle)
+
+
+async def refresh_panel(user_id: str) -> None:
+    """Edit a panel with the user's state as it is when the edit goes out."""
+    state = store.peek(user_id)
+    if not state or not state.get("panel_message_id"):
+        return
+    fingerprint = panel_fingerprint(state)
+    if panel_fingerprints.get(int(user_id)) == fingerprint:
+        return
+    message = panel_message(int(user_id), state)
+    user = bot.get_user(int(user_id)) or bot.user
+    embed, view = render_panel(user, int(user_id), state, fingerprint)
+    await message.edit(embed=embed, view=view)
+    panel_fingerprints[int(user_id)] = fingerprint
+    verified_panels.add(int(user_id))
+
+
+def stored_panels() -> List[Tuple[int, dict]]:
+    return [
+        (int(user_id), state)
+        for user_id, state in store.items()
+        if state.get("panel_message_id") and state.get("panel_channel_id")
+    ]
+
+
+def rehydrate_panels() -> int:
+    """Load handles for the most recently active stored panels into ``panel_cache`` without calling the API."""
+    panels = sorted(stored_panels(), key=lambda entry: entry[1].get("last_active", 0))[-panel_cache.max_size :]
+    for user_id, state in panels:
+        panel_cache.put(user_id, state["panel_channel_id"], state["panel_message_id"])
+    panels_rehydrated.inc(len(panels))
+    return len(panels)
+
+
+async def verify_panels() -> None:
+    """Fetch each restored panel once in the background and unlink the ones that are gone.
+
+    Panels already edited since boot are known to exist and are skipped. At
+    most ``PANEL_VERIFY_CONCURRENCY`` fetches are in flight at a time.
+    """
+    limit = asyncio.Semaphore(PANEL_VERIFY_CONCURRENCY)
+
+    async def verify(user_id: int, state: dict) -> None:
+        async with limit:
+            if user_id in verified_panels or not state.get("panel_message_id"):
+                return
+            try:
+                await partial_panel(state["panel_channel_id"], state["panel_message_id"]).fetch()
+            except (discord.NotFound, discord.Forbidden):
+                panel_checks.inc(result="stale")
+                drop_panel(user_id)
+            except discord.HTTPException:
+                # Not proof the panel is gone; the next edit will tell.
+                panel_checks.inc(result="error")
+            else:
+                panel_checks.inc(result="ok")
+                verified_panels.add(user_id)
+
+    started = time.monotonic()
+    await asyncio.gather(*(verify(user_id, state) for user_id, state in stored_panels()))
+    print(
+        f"Verified stored panels in {time.monotonic() - started:.1f}s: "
+        f"{int(panel_checks.value(result='stale'))} stale, {int(panel_checks.value(result='error'))} unreachable."
+    )
+
+
+@tasks.loop(seconds=1)
+async def flush_state():
+    if store.flush_due():
+        store.flush()
+
+
+async def watch_loop_lag() -> None:
+    """Sleep in short steps and record how late each wakeup is."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - started - LOOP_LAG_INTERVAL)
+        loop_lag.append(lag)
+        if lag >= LOOP_LAG_WARN:
+            print(f"[WARN] Event loop stalled for {lag:.2f}s.")
+
+
+def loop_lag_stats() -> dict:
+    ordered = sorted(loop_lag)
+    if not ordered:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "p50": ordered[len(ordered) // 2],
+        "p99": ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))],
+        "max": ordered[-1],
+    }
+
+
+def stats_embed() -> discord.Embed:
+    embed = discord.Embed(title="📊 BOT STATS", color=CYBER_DARK)
+    embed.add_field(
+        name="Ticks",
+        value=(
+            f"Passes: {tick_seconds.count()} | Errors: {int(tick_errors.value())}\n"
+            f"Cafes ticked: {int(ticked_cafes.value())} | Scheduled: {len(scheduler)}\n"
+            f"Pass p50/p99: {tick_seconds.percentile(0.5) * 1000:.1f}/{tick_seconds.percentile(0.99) * 1000:.1f} ms\n"
+            f"First tick: {'pending' if time_to_first_tick is None else f'{time_to_first_tick:.1f}s after start-up'}"
+        ),
+        inline=False,
+    )
+    slowest = sorted(
+        ((handler_seconds.percentile(0.99, action=action), action) for _, action, _, _ in PANEL_LAYOUT if action),
+        reverse=True,
+    )[:5]
+    embed.add_field(
+        name="Slowest handlers (p99)",
+        value="\n".join(f"{action}: {value * 1000:.1f} ms" for value, action in slowest if value) or "No clicks yet.",
+        inline=False,
+    )
+    state = store.stats()
+    embed.add_field(
+        name="Storage",
+        value=(
+            f"Backend: {STATE_BACKEND} | Cafes: {state['cafes']} | Dirty: {state['dirty']}\n"
+            f"Load: {state['load_seconds']:.2f}s, {state['load_bytes'] / 1024:.0f} KiB | "
+            f"On disk: {state['disk_bytes'] / 1024:.0f} KiB\n"
+            f"Writes: {state['writes']} ({state['write_failures']} failed) | "
+            f"p50/p99: {state['write_p50'] * 1000:.1f}/{state['write_p99'] * 1000:.1f} ms"
+        ),
+        inline=False,
+    )
+    edit = edits.stats()
+    embed.add_field(
+        name="Panel edits",
+        value=(
+            f"Sent: {edit['sent']} | Failed: {edit['failed']} | "
+            f"Coalesced: {edit['coalesced']} | Queued: {edit['queue_depth']}\n"
+            f"Latency p50/p99: {edit['latency_p50'] * 1000:.0f}/{edit['latency_p99'] * 1000:.0f} ms\n"
+            f"Panel cache hit rate: {panel_cache.stats()['hit_ratio']:.0%} | "
+            f"Stale panels unlinked: {int(panel_checks.value(result='stale'))}"
+        ),
+        inline=False,
+    )
+    lag = loop_lag_stats()
+    embed.add_field(
+        name="Event loop lag",
+        value=f"p50: {lag['p50'] * 1000:.1f} ms | p99: {lag['p99'] * 1000:.1f} ms | max: {lag['max'] * 1000:.1f} ms",
+        inline=False,
+    )
+    return embed
 
 
 @hourly_tick.before_loop
@@ -793,8 +1247,25 @@ async def before_tick():
     await bot.wait_until_ready()
 
 
+@bot.event
+async def setup_hook():
+    global panel_controls
+    # Runs after login and before the gateway connects, so panels can be
+    # clicked and edited as soon as events arrive.
+    started = time.monotonic()
+    panel_controls = CafeView()
+    bot.add_view(panel_controls)
+    restored = rehydrate_panels()
+    print(f"Restored {restored} panels in {time.monotonic() - started:.2f}s.")
+    if router is not None:
+        await router.start(handle_routed)
+        _, port = router.peers[BOT_PROCESS_INDEX]
+        print(f"Process {BOT_PROCESS_INDEX}/{BOT_PROCESSES} routing on {router.bind}:{port}, shards {bot.shard_ids}.")
+
+
 @bot.event
 async def on_ready():
+    global loop_lag_task, metrics_server, verify_task
     print("===================================")
     print(f"Logged in as: {bot.user}")
     print(f"Bot ID: {bot.user.id}")
@@ -802,21 +1273,81 @@ async def on_ready():
     print("===================================")
     if not hourly_tick.is_running():
         hourly_tick.start()
+    if not flush_state.is_running():
+        flush_state.start()
+    edits.start()
+    if loop_lag_task is None:
+        loop_lag_task = asyncio.create_task(watch_loop_lag())
+    if METRICS_PORT and metrics_server is None:
+        # Processes of a sharded deployment sharing a host each take the next port.
+        port = METRICS_PORT + BOT_PROCESS_INDEX
+        try:
+            metrics_server = await serve(metrics, METRICS_HOST, port)
+        except OSError as exc:
+            print(f"[WARN] Metrics endpoint could not listen on {METRICS_HOST}:{port}: {exc}")
+        else:
+            print(f"Metrics on http://{METRICS_HOST}:{port}/metrics")
+    if verify_task is None:
+        verify_task = asyncio.create_task(verify_panels())
 
 
-if not TOKEN:
-    raise RuntimeError("DISCORD_TOKEN is not set. Please add the bot token to the environment before starting.")
+def main() -> None:
+    global tick_pool
+    if not TOKEN:
+        raise RuntimeError("DISCORD_TOKEN is not set. Please add the bot token to the environment before starting.")
 
-if not MESSAGE_CONTENT_INTENT:
-    print(
-        "[WARN] Message content intent disabled. Prefix commands such as !cafe and !help will not work.\n"
-        "Enable the Message Content Intent in your Discord developer portal and set DISCORD_MESSAGE_CONTENT_INTENT=true."
-    )
+    if TICK_ENGINE not in TICK_ENGINES:
+        raise RuntimeError(f"Unknown TICK_ENGINE {TICK_ENGINE!r}. Choose one of: {', '.join(TICK_ENGINES)}.")
+
+    if TICK_ENGINE == "numpy" and vector_engine.np is None:
+        raise RuntimeError("TICK_ENGINE=numpy needs NumPy. Install it with `pip install numpy`.")
+
+    if not 0 <= BOT_PROCESS_INDEX < BOT_PROCESSES:
+        raise RuntimeError(
+            f"BOT_PROCESS_INDEX must be between 0 and {BOT_PROCESSES - 1} for BOT_PROCESSES={BOT_PROCESSES}."
+        )
+
+    if SHARD_COUNT < BOT_PROCESSES:
+        raise RuntimeError(f"SHARD_COUNT={SHARD_COUNT} leaves some of the {BOT_PROCESSES} processes without a shard.")
 
-try:
-    bot.run(TOKEN)
-except discord.errors.PrivilegedIntentsRequired as exc:
-    raise RuntimeError(
-        "Privileged intents are required. Enable the Message Content Intent in the Discord developer portal "
-        "or set DISCORD_MESSAGE_CONTENT_INTENT=false to start without prefix commands."
-    ) from exc
+    if BOT_PROCESSES > 1 and not SHARD_SECRET:
+        raise RuntimeError(
+            "BOT_PROCESSES > 1 needs SHARD_SECRET, a shared secret the processes sign routed requests with. "
+            "Set it to the same random value in each process."
+        )
+
+    if not MESSAGE_CONTENT_INTENT:
+        print(
+            "[WARN] Message content intent disabled. Prefix commands such as !cafe and !help will not work.\n"
+            "Enable the Message Content Intent in your Discord developer portal and set DISCORD_MESSAGE_CONTENT_INTENT=true."
+        )
+
+    store.load()
+    started = time.perf_counter()
+    index_states(time.time())
+    print(f"Indexed {len(store)} cafes in {time.perf_counter() - started:.2f}s.")
+    foreign = sum(1 for user_id in store.data if not owns(int(user_id)))
+    if foreign:
+        print(
+            f"[WARN] {foreign} loaded cafes belong to other processes and would be ticked twice. "
+            f"Split the state first with `python sharding.py split --processes {BOT_PROCESSES}`."
+        )
+    if TICK_WORKERS > 0:
+        tick_pool = ShardedTickPool(TICK_WORKERS, shard_count=TICK_SHARDS)
+        tick_pool.start(store.data)
+
+    try:
+        bot.run(TOKEN)
+    except discord.errors.PrivilegedIntentsRequired as exc:
+        raise RuntimeError(
+            "Privileged intents are required. Enable the Message Content Intent in the Discord developer portal "
+            "or set DISCORD_MESSAGE_CONTENT_INTENT=false to start without prefix commands."
+        ) from exc
+    finally:
+        if tick_pool is not None:
+            tick_pool.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
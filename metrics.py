@@ -0,0 +1,260 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter as StackCounts
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --------------- METRICS ---------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(label_key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{format_labels(key)} {format_value(value)}" for key, value in self.values.items()]
+
+
+class Histogram:
+    """Cumulative buckets for the exposition, plus the last ``recent`` samples for percentiles."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, recent: int = 1024):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.recent = recent
+        self.series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            # Per-bucket counts, sum, count and recent samples.
+            series = self.series[key] = [[0] * len(self.buckets), 0.0, 0, deque(maxlen=self.recent)]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        series[1] += value
+        series[2] += 1
+        series[3].append(value)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(label_key(labels))
+        return series[2] if series else 0
+
+    def percentile(self, q: float, **labels) -> float:
+        series = self.series.get(label_key(labels))
+        if not series or not series[3]:
+            return 0.0
+        ordered = sorted(series[3])
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count, _) in self.series.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{format_labels(key, (('le', format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(key, (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class Sampled:
+    """A gauge or counter read from ``fn`` at scrape time.
+
+    ``fn`` returns one number, or with ``label`` set a mapping of label value
+    to number.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        fn: Callable[[], Union[float, Dict[str, float]]],
+        label: Optional[str] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.fn = fn
+        self.label = label
+
+    def samples(self) -> List[str]:
+        value = self.fn()
+        if self.label is None:
+            return [f"{self.name} {format_value(value)}"]
+        return [
+            f"{self.name}{format_labels(((self.label, str(key)),))} {format_value(item)}" for key, item in value.items()
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._add(Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, buckets))
+
+    def sampled(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        fn: Callable[[], Union[float, Dict[str, float]]],
+        label: Optional[str] = None,
+    ) -> Sampled:
+        return self._add(Sampled(name, kind, help_text, fn, label))
+
+    def render(self) -> str:
+        """Everything registered, in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as exc:
+                print(f"[WARN] Metric {metric.name} failed to collect: {exc}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise RuntimeError(f"Metric {metric.name} is already registered.")
+        self.metrics[metric.name] = metric
+        return metric
+
+
+# --------------- ENDPOINT ---------------
+async def serve(registry: Registry, host: str, port: int) -> asyncio.AbstractServer:
+    """Serve ``GET /metrics`` on ``host:port`` from the running event loop."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+                status, body = "200 OK", registry.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# --------------- PROFILER ---------------
+class StackSampler:
+    """Samples one thread's stack every ``interval`` seconds from a helper thread.
+
+    Only stacks passing through a function named ``focus`` are kept, so a
+    sampler focused on the tick loop ignores the time the event loop spends
+    on anything else. ``stop`` returns the hottest stacks in the collapsed
+    ``outer;inner count`` format flame graph tools read.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005, focus: Optional[str] = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.focus = focus
+        self.stacks: "StackCounts[str]" = StackCounts()
+        self.samples = 0
+        self.started = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.stacks.clear()
+        self.samples = 0
+        self.started = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, top: int = 50) -> str:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        elapsed = time.monotonic() - self.started
+        kept = sum(self.stacks.values())
+        lines = [f"# {self.samples} samples over {elapsed:.1f}s, {kept} in {self.focus or 'any function'}"]
+        lines.extend(f"{stack} {count}" for stack, count in self.stacks.most_common(top))
+        return "\n".join(lines) + "\n"
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            names: Deque[str] = deque()
+            matched = self.focus is None
+            while frame is not None:
+                code = frame.f_code
+                matched = matched or code.co_name == self.focus
+                names.appendleft(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if matched:
+                self.stacks[";".join(names)] += 1
@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, Tuple
+
+
+class PanelCache:
+    """``(channel_id, message_id)`` of recently used panels, bounded by count and idle time.
+
+    Entries are kept in least recently used order. Adding one past
+    ``max_size`` evicts the oldest, and entries idle for ``ttl`` seconds are
+    dropped as they are reached, both on lookup and from the old end on
+    every insert, so users who stop playing do not stay resident.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 7200.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: "OrderedDict[int, Tuple[int, int, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, owner_id: int) -> bool:
+        return owner_id in self.entries
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self.entries))
+
+    def get(self, owner_id: int) -> Optional[Tuple[int, int]]:
+        entry = self.entries.get(owner_id)
+        now = self.clock()
+        if entry is not None and now - entry[2] > self.ttl:
+            del self.entries[owner_id]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[owner_id] = (entry[0], entry[1], now)
+        self.entries.move_to_end(owner_id)
+        return entry[0], entry[1]
+
+    def put(self, owner_id: int, channel_id: int, message_id: int) -> None:
+        now = self.clock()
+        self.entries[owner_id] = (channel_id, message_id, now)
+        self.entries.move_to_end(owner_id)
+        while self.entries:
+            oldest_id, oldest = next(iter(self.entries.items()))
+            if now - oldest[2] > self.ttl:
+                self.expirations += 1
+            elif len(self.entries) > self.max_size:
+                self.evictions += 1
+            else:
+                break
+            del self.entries[oldest_id]
+
+    def pop(self, owner_id: int) -> None:
+        self.entries.pop(owner_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+class TokenBucket:
+    """``rate`` sends per ``per`` seconds, refilled continuously."""
+
+    def __init__(self, rate: int, per: float, now: float):
+        self.capacity = rate
+        self.refill = rate / per
+        self.tokens = float(rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """Take a token and return 0, or return how long until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.refill
+
+
+class EditJob:
+    __slots__ = ("key", "channel_id", "send", "on_error", "enqueued", "seq")
+
+    def __init__(self, key, channel_id, send, on_error, seq, enqueued):
+        self.key = key
+        self.channel_id = channel_id
+        self.send = send
+        self.on_error = on_error
+        self.enqueued = enqueued
+        self.seq = seq
+
+
+class EditScheduler:
+    """Outbound panel edits with coalescing and per-channel rate limits.
+
+    Background refreshes are keyed by panel. Submitting a refresh for a panel
+    that already has one queued only swaps the payload, so at most one edit
+    per panel is ever waiting. Interactive responses bypass the queue and
+    drop any refresh still waiting for the same panel. ``concurrency``
+    workers send at most that many refreshes at once, and a job whose
+    channel bucket is empty is parked until a token frees up instead of
+    holding a worker.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        channel_rate: int = 5,
+        channel_per: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.clock = clock
+        self.concurrency = concurrency
+        self.channel_rate = channel_rate
+        self.channel_per = channel_per
+        self.jobs: Dict[Hashable, EditJob] = {}
+        self.buckets: Dict[int, TokenBucket] = {}
+        self.latencies: Deque[float] = deque(maxlen=1024)
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self._ready: List[Tuple[int, Hashable]] = []
+        self._parked: List[Tuple[float, int, Hashable]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.jobs)
+
+    def stats(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+        return {
+            "queue_depth": self.queue_depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+        }
+
+    def refresh(
+        self,
+        key: Hashable,
+        channel_id: int,
+        send: Callable[[], Awaitable[None]],
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> None:
+        """Queue a background edit of panel ``key``, replacing one that is still waiting."""
+        job = self.jobs.get(key)
+        if job is not None:
+            job.send = send
+            job.on_error = on_error
+            self.coalesced += 1
+            return
+        self._push(EditJob(key, channel_id, send, on_error, next(self._seq), self.clock()))
+
+    async def respond(self, key: Hashable, send: Callable[[], Awaitable[None]]) -> None:
+        """Send an interaction response for panel ``key`` now, dropping any refresh still waiting for it."""
+        if self.jobs.pop(key, None) is not None:
+            self.coalesced += 1
+        # Interaction responses have a 3 s deadline and go through the
+        # interaction webhook rather than the channel, so they are sent from
+        # the handler itself instead of waiting for a worker or a bucket.
+        started = self.clock()
+        try:
+            await send()
+        except Exception:
+            self.failed += 1
+            raise
+        self.sent += 1
+        self.latencies.append(self.clock() - started)
+
+    def _push(self, job: EditJob) -> None:
+        self.jobs[job.key] = job
+        heapq.heappush(self._ready, (job.seq, job.key))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next_job(self) -> Tuple[Optional[EditJob], Optional[float]]:
+        now = self.clock()
+        while self._parked and self._parked[0][0] <= now:
+            _, seq, job_key = heapq.heappop(self._parked)
+            job = self.jobs.get(job_key)
+            if job is not None and job.seq == seq:
+                heapq.heappush(self._ready, (seq, job_key))
+        while self._ready:
+            seq, job_key = heapq.heappop(self._ready)
+            job = self.jobs.get(job_key)
+            if job is None or job.seq != seq:
+                continue
+            bucket = self.buckets.get(job.channel_id)
+            if bucket is None:
+                bucket = self.buckets[job.channel_id] = TokenBucket(self.channel_rate, self.channel_per, now)
+            delay = bucket.reserve(now)
+            if delay > 0:
+                heapq.heappush(self._parked, (now + delay, seq, job_key))
+                continue
+            del self.jobs[job_key]
+            return job, None
+        return None, (self._parked[0][0] - now if self._parked else None)
+
+    async def _work(self) -> None:
+        while True:
+            job, wait = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await job.send()
+            except Exception as exc:
+                self.failed += 1
+                if job.on_error is not None:
+                    job.on_error(exc)
+            else:
+                self.sent += 1
+            self.latencies.append(self.clock() - job.enqueued)
@@ -0,0 +1,286 @@
+"""Running the bot as several processes that split the gateway shards and the cafes.
+
+Process ``i`` of ``n`` connects the gateway shards ``s`` with ``s % n == i``
+and owns the cafes of users with ``owner_process(user_id, n) == i``: only it
+loads, ticks and saves them, from its own partition of the state files.
+Discord delivers a command or click to the process that holds the guild's
+shard, which is often not the owner. That process hands the request to the
+owner over a small JSON-lines connection (``ShardRouter``) and relays the
+answer; the owner edits the panel itself, since REST calls work from any
+process. Every request is signed with the ``SHARD_SECRET`` all processes
+share, and the router listens on localhost unless told otherwise.
+
+    python sharding.py split --processes 4
+
+splits the existing state files of ``STATE_BACKEND`` (or ``--backend``)
+into the per-process files.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from game import BASE_STATE
+from storage import STATE_BACKENDS, open_backend
+
+Handler = Callable[[dict], Awaitable[dict]]
+
+
+def owner_process(user_id: int, processes: int) -> int:
+    """The process that owns ``user_id``'s cafe.
+
+    Uses the same bits of the snowflake that Discord shards guilds on, which
+    spread evenly where the low bits do not.
+    """
+    return (int(user_id) >> 22) % processes
+
+
+def process_shards(index: int, processes: int, shard_count: int) -> List[int]:
+    return [shard for shard in range(shard_count) if shard % processes == index]
+
+
+def guild_shard(guild_id: int, shard_count: int) -> int:
+    return (int(guild_id) >> 22) % shard_count
+
+
+def partition_path(path: str, index: int, processes: int) -> str:
+    """``data.json`` becomes ``data.p1.json`` for process 1; unchanged with one process."""
+    if processes <= 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.p{index}{ext}"
+
+
+def parse_peers(spec: str, processes: int, host: str, base_port: int) -> List[Tuple[str, int]]:
+    """``host:port`` per process from a comma-separated ``spec``, or consecutive ports on ``host``."""
+    if not spec:
+        return [(host, base_port + index) for index in range(processes)]
+    peers = []
+    for entry in spec.split(","):
+        peer_host, _, port = entry.strip().rpartition(":")
+        peers.append((peer_host or host, int(port)))
+    if len(peers) != processes:
+        raise RuntimeError(f"SHARD_PEERS lists {len(peers)} processes but BOT_PROCESSES is {processes}.")
+    return peers
+
+
+# --------------- ROUTER ---------------
+class ShardRouter:
+    """Request/response between bot processes over one TCP connection per peer.
+
+    Every message is a JSON object on its own line. Requests carry an ``id``
+    the reply echoes, so one connection serves any number of requests at
+    once. A request line starts with the hex HMAC-SHA256 of its JSON under
+    ``secret``; a connection that sends one that does not verify is dropped
+    unanswered. Connections are opened on first use and reopened after a
+    failure. The server binds to ``bind``, not the host peers reach it by.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        peers: List[Tuple[str, int]],
+        secret: str,
+        bind: str = "127.0.0.1",
+        timeout: float = 10.0,
+    ):
+        self.index = index
+        self.peers = peers
+        self.secret = secret.encode("utf-8")
+        self.bind = bind
+        self.timeout = timeout
+        self.forwarded = 0
+        self.served = 0
+        self.failures = 0
+        self.rejected = 0
+        self._ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._connections: Dict[int, asyncio.StreamWriter] = {}
+        self._connecting: Dict[int, asyncio.Lock] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: List[asyncio.Task] = []
+        self._clients: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self, handler: Handler) -> None:
+        if not self.secret:
+            raise RuntimeError("Routing between bot processes needs SHARD_SECRET set to the same value in each.")
+        _, port = self.peers[self.index]
+
+        async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            async def answer(request: dict) -> None:
+                try:
+                    reply = await handler(request["payload"])
+                except Exception as exc:
+                    print(f"[WARN] Routed {request['payload'].get('kind')} request failed: {exc!r}")
+                    reply = {"error": repr(exc)}
+                self.served += 1
+                writer.write(json.dumps({"id": request["id"], "reply": reply}).encode("utf-8") + b"\n")
+                await writer.drain()
+
+            tasks = set()
+            self._clients[asyncio.current_task()] = writer
+            try:
+                while line := await reader.readline():
+                    request = self._verify(line)
+                    if request is None:
+                        self.rejected += 1
+                        peer = writer.get_extra_info("peername")
+                        print(f"[WARN] Dropped a routed connection from {peer}: request not signed with SHARD_SECRET.")
+                        break
+                    task = asyncio.create_task(answer(request))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            except ConnectionError:
+                pass
+            finally:
+                self._clients.pop(asyncio.current_task(), None)
+                writer.close()
+
+        self._server = await asyncio.start_server(serve, self.bind, port)
+
+    async def forward(self, process: int, payload: dict) -> dict:
+        """Send ``payload`` to ``process`` and return its reply."""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            writer = await self._connection(process)
+            writer.write(self._sign(json.dumps({"id": request_id, "payload": payload}).encode("utf-8")))
+            await writer.drain()
+            reply = await asyncio.wait_for(future, self.timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            self.failures += 1
+            raise RuntimeError(f"Process {process} did not answer a routed request: {exc!r}") from exc
+        finally:
+            self._pending.pop(request_id, None)
+        self.forwarded += 1
+        if "error" in reply:
+            raise RuntimeError(f"Process {process} failed a routed request: {reply['error']}")
+        return reply
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for writer in self._connections.values():
+            writer.close()
+        self._connections.clear()
+        if self._server is not None:
+            self._server.close()
+            # Closing the connections ends their handlers; wait so none is
+            # left running when the loop shuts down.
+            handlers = list(self._clients)
+            for writer in self._clients.values():
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def _sign(self, body: bytes) -> bytes:
+        return hmac.new(self.secret, body, hashlib.sha256).hexdigest().encode("ascii") + b" " + body + b"\n"
+
+    def _verify(self, line: bytes) -> Optional[dict]:
+        """The request in a signed line, or None if the signature does not match."""
+        mac, _, body = line.rstrip(b"\n").partition(b" ")
+        expected = hmac.new(self.secret, body, hashlib.sha256).hexdigest().encode("ascii")
+        if not hmac.compare_digest(mac, expected):
+            return None
+        return json.loads(body)
+
+    async def _connection(self, process: int) -> asyncio.StreamWriter:
+        lock = self._connecting.setdefault(process, asyncio.Lock())
+        async with lock:
+            writer = self._connections.get(process)
+            if writer is None or writer.is_closing():
+                host, port = self.peers[process]
+                reader, writer = await asyncio.open_connection(host, port)
+                self._connections[process] = writer
+                self._tasks.append(asyncio.create_task(self._read_replies(process, reader, writer)))
+            return writer
+
+    async def _read_replies(self, process: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                future = self._pending.get(message["id"])
+                if future is not None and not future.done():
+                    future.set_result(message["reply"])
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            if self._connections.get(process) is writer:
+                del self._connections[process]
+
+
+# --------------- SPLIT ---------------
+def split_states(
+    backend: str, data_file: str, db_file: str, pack_file: str, processes: int, defaults: dict
+) -> List[int]:
+    """Move every cafe of a ``backend`` store into its owner's partition, in the same format.
+
+    The cafes are loaded through the backend itself, so a journal's tail and
+    SQLite or packed files are split as the bot would see them. Returns the
+    cafes written per process.
+    """
+    source = open_backend(backend, data_file, db_file, pack_file=pack_file, defaults=defaults)
+    try:
+        data = source.load()
+    finally:
+        source.close()
+    parts: List[Dict[str, dict]] = [{} for _ in range(processes)]
+    for user_id, state in data.items():
+        parts[owner_process(int(user_id), processes)][user_id] = state
+    targets = [
+        open_backend(
+            backend,
+            partition_path(data_file, index, processes),
+            partition_path(db_file, index, processes),
+            pack_file=partition_path(pack_file, index, processes),
+            defaults=defaults,
+        )
+        for index in range(processes)
+    ]
+    try:
+        # Check every partition before writing any, so a refusal leaves nothing half split.
+        for index, target in enumerate(targets):
+            existing = target.load()
+            if existing:
+                raise RuntimeError(
+                    f"Partition {index} already holds {len(existing)} cafes. Move its files aside before splitting."
+                )
+        for target, part in zip(targets, parts):
+            target.write(part)
+    finally:
+        for target in targets:
+            target.close()
+    return [len(part) for part in parts]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    split = commands.add_parser("split", help="split the state files into per-process partitions")
+    split.add_argument("--processes", type=int, required=True)
+    split.add_argument("--backend", default=os.getenv("STATE_BACKEND", "json").lower(), choices=STATE_BACKENDS)
+    split.add_argument("--data-file", default="data.json")
+    split.add_argument("--db-file", default=os.getenv("STATE_DB_FILE", "data.db"))
+    split.add_argument("--pack-file", default=os.getenv("STATE_PACK_FILE", "data.pack"))
+    args = parser.parse_args()
+
+    if args.processes < 2:
+        raise RuntimeError("Splitting only makes sense for two or more processes.")
+    counts = split_states(args.backend, args.data_file, args.db_file, args.pack_file, args.processes, BASE_STATE)
+    path = {"sqlite": args.db_file, "packed": args.pack_file}.get(args.backend, args.data_file)
+    for index, count in enumerate(counts):
+        print(f"{partition_path(path, index, args.processes)}: {count} cafes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,695 @@
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+from collections.abc import MutableMapping
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+def encode_entry(user_id: str, state: dict) -> str:
+    # One line per user keeps the file diffable and lets unchanged users
+    # reuse their previous encoding on the next write.
+    return f"{json.dumps(user_id)}: {json.dumps(state, separators=(',', ':'))}"
+
+
+def write_snapshot(path: str, entries: Iterable[str], durable: bool = False) -> None:
+    """Write encoded entries to ``path`` through a temp file and an atomic rename."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        fp.write("{\n")
+        fp.write(",\n".join(entries))
+        fp.write("\n}\n")
+        if durable:
+            fp.flush()
+            os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+    if durable:
+        fsync_dir(path)
+
+
+def read_snapshot(path: str) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as fp:
+        try:
+            return json.load(fp)
+        except json.JSONDecodeError:
+            return {}
+
+
+_MISSING = object()
+
+
+def snapshot(state: dict) -> dict:
+    """Detached copy of a state for the I/O thread, much cheaper than ``deepcopy``.
+
+    States nest at most three levels deep (``customers`` buckets, the
+    ``profit_ring`` buckets), so copying containers down to that depth is
+    enough for the loop to keep mutating the original.
+    """
+    return {key: copy_container(value) for key, value in state.items()}
+
+
+def copy_container(value):
+    """Copy a dict or list from a state deep enough to mutate it freely."""
+    if isinstance(value, dict):
+        return {key: item[:] if isinstance(item, list) else item for key, item in value.items()}
+    if isinstance(value, list):
+        return [item[:] if isinstance(item, list) else item for item in value]
+    return value
+
+
+class StateHandle(MutableMapping):
+    """Copy-on-write view of a resident state.
+
+    Scalars are read straight from the shared state. A dict or list field is
+    copied the first time a handler reaches for it, so handlers can mutate
+    what they get back as before while everything they never touch stays
+    shared. Assignments and copied fields are kept on the handle;
+    ``changes`` returns the fields that actually differ and
+    ``StateStore.commit`` applies them to the resident state.
+    """
+
+    __slots__ = ("base", "own", "assigned")
+
+    def __init__(self, base: dict):
+        self.base = base
+        self.own: Dict[str, object] = {}
+        self.assigned: Set[str] = set()
+
+    def __getitem__(self, key: str):
+        if key in self.own:
+            return self.own[key]
+        value = self.base[key]
+        if isinstance(value, (dict, list)):
+            value = self.own[key] = copy_container(value)
+        return value
+
+    def __setitem__(self, key: str, value) -> None:
+        self.own[key] = value
+        self.assigned.add(key)
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("Cafe state fields cannot be deleted.")
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.base
+        for key in self.own:
+            if key not in self.base:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self.base) + sum(1 for key in self.own if key not in self.base)
+
+    def __contains__(self, key) -> bool:
+        return key in self.own or key in self.base
+
+    def changes(self) -> Dict[str, object]:
+        return {
+            key: value
+            for key, value in self.own.items()
+            if key in self.assigned or value != self.base.get(key, _MISSING)
+        }
+
+
+def fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# --------------- BACKENDS ---------------
+class JsonFileBackend:
+    """The original format: the whole of ``data.json`` rewritten on every write."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._encoded: Dict[str, str] = {}
+
+    def load(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            write_snapshot(self.path, [])
+        data = read_snapshot(self.path)
+        self._encoded = {user_id: encode_entry(user_id, state) for user_id, state in data.items()}
+        return data
+
+    def write(self, changes: Dict[str, Optional[dict]]) -> None:
+        for user_id, state in changes.items():
+            if state is None:
+                self._encoded.pop(user_id, None)
+            else:
+                self._encoded[user_id] = encode_entry(user_id, state)
+        write_snapshot(self.path, self._encoded.values())
+
+    def close(self) -> None:
+        pass
+
+
+PACK_MAGIC = b"ICSP"
+PACK_VERSION = 1
+
+
+def state_delta(state: dict, defaults: dict) -> dict:
+    """Fields of ``state`` that differ from ``defaults``, one level into nested dicts."""
+    delta = {}
+    for key, value in state.items():
+        default = defaults.get(key, _MISSING)
+        if value == default:
+            continue
+        if isinstance(value, dict) and isinstance(default, dict):
+            value = {name: item for name, item in value.items() if default.get(name, _MISSING) != item}
+        delta[key] = value
+    return delta
+
+
+def delta_containers(defaults: dict) -> List[Tuple[str, object, bool]]:
+    """The dict and list entries of ``defaults`` that each rebuilt state needs its own copy of."""
+    containers = []
+    for key, value in defaults.items():
+        if isinstance(value, dict):
+            containers.append((key, value, any(isinstance(item, list) for item in value.values())))
+        elif isinstance(value, list):
+            containers.append((key, value, True))
+    return containers
+
+
+def apply_delta(defaults: dict, delta: dict, containers: Optional[List[Tuple[str, object, bool]]] = None) -> dict:
+    """Rebuild a state from ``defaults`` and a freshly decoded ``delta``.
+
+    Values taken from ``delta`` are used as they are; only the dicts and
+    lists inherited from ``defaults`` are copied. ``containers`` comes from
+    ``delta_containers`` and can be computed once for many calls.
+    """
+    if containers is None:
+        containers = delta_containers(defaults)
+    state = {**defaults, **delta}
+    for key, default, nested in containers:
+        value = delta.get(key)
+        if isinstance(default, dict):
+            if value is not None and not isinstance(value, dict):
+                continue
+            if nested:
+                merged = {name: item[:] if isinstance(item, list) else item for name, item in default.items()}
+            else:
+                merged = dict(default)
+            if value:
+                merged.update(value)
+            state[key] = merged
+        elif value is None:
+            state[key] = [item[:] if isinstance(item, list) else item for item in default]
+    return state
+
+
+class PackedFileBackend:
+    """Versioned, zlib-compressed snapshot storing only what differs from the defaults.
+
+    The file is ``PACK_MAGIC``, a version byte and a zlib stream of text
+    lines: the defaults the file was written against, then one
+    ``["<user id>", {delta}]`` line per user. Keeping the defaults in
+    the file means changing ``BASE_STATE`` in a later release cannot
+    silently change what a saved cafe loads as. Like ``JsonFileBackend``
+    the whole file is rewritten on every write, from per-user lines cached
+    between writes; lines loaded against unchanged defaults are reused as
+    they are.
+    """
+
+    def __init__(self, path: str, defaults: dict):
+        self.path = path
+        self.defaults = defaults
+        self._encoded: Dict[str, str] = {}
+
+    def load(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as fp:
+            header = fp.read(len(PACK_MAGIC) + 1)
+            body = fp.read()
+        if header[: len(PACK_MAGIC)] != PACK_MAGIC:
+            raise RuntimeError(f"{self.path} is not a packed state file.")
+        if header[-1] != PACK_VERSION:
+            raise RuntimeError(
+                f"{self.path} uses packed format v{header[-1]}, this version reads v{PACK_VERSION}. "
+                "Upgrade the bot or restore a matching snapshot."
+            )
+        lines = zlib.decompress(body).decode("utf-8").split("\n")
+        defaults = json.loads(lines[0])
+        lines = lines[1:]
+        # One decoder call for every line is far cheaper than one per user.
+        records = json.loads(f"[{','.join(lines)}]")
+        containers = delta_containers(defaults)
+        data = {}
+        self._encoded = {}
+        reuse = defaults == self.defaults
+        for line, (user_id, delta) in zip(lines, records):
+            data[user_id] = apply_delta(defaults, delta, containers)
+            self._encoded[user_id] = line if reuse else self._encode(user_id, data[user_id])
+        return data
+
+    def write(self, changes: Dict[str, Optional[dict]]) -> None:
+        for user_id, state in changes.items():
+            if state is None:
+                self._encoded.pop(user_id, None)
+            else:
+                self._encoded[user_id] = self._encode(user_id, state)
+        lines = [json.dumps(self.defaults, separators=(",", ":"))]
+        lines.extend(self._encoded.values())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(PACK_MAGIC + bytes([PACK_VERSION]))
+            fp.write(zlib.compress("\n".join(lines).encode("utf-8"), 6))
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        pass
+
+    def _encode(self, user_id: str, state: dict) -> str:
+        return json.dumps([user_id, state_delta(state, self.defaults)], separators=(",", ":"))
+
+
+class JournalBackend:
+    """Append-only journal of per-user records, folded into ``data.json`` in the background.
+
+    Every ``write`` appends one JSON line per changed user and fsyncs once for
+    the whole batch (group commit). When the journal grows past
+    ``compact_bytes`` it is rotated to ``<path>.journal.old`` and a compactor
+    thread folds it into a new snapshot that replaces ``data.json`` with an
+    atomic rename. Loading replays the snapshot, then any rotated segment,
+    then the live journal; records carry the full user state, so replaying a
+    segment that was already folded in is harmless.
+    """
+
+    def __init__(self, path: str, compact_bytes: int = 4 * 1024 * 1024):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.rotated_path = f"{path}.journal.old"
+        self.compact_bytes = compact_bytes
+        self._fp = None
+        self._journal_size = 0
+        self._compactor: Optional[threading.Thread] = None
+
+    def load(self) -> Dict[str, dict]:
+        data = read_snapshot(self.path)
+        self._replay(self.rotated_path, data)
+        valid = self._replay(self.journal_path, data)
+        self._fp = open(self.journal_path, "ab")
+        # Drop a torn tail so new records do not get glued onto it.
+        self._fp.truncate(valid)
+        self._journal_size = valid
+        if os.path.exists(self.rotated_path):
+            self._start_compactor()
+        return data
+
+    def write(self, changes: Dict[str, Optional[dict]]) -> None:
+        if not changes:
+            return
+        batch = "".join(
+            json.dumps({"u": user_id, "s": state}, separators=(",", ":")) + "\n" for user_id, state in changes.items()
+        )
+        encoded = batch.encode("utf-8")
+        self._fp.write(encoded)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._journal_size += len(encoded)
+        if self._journal_size >= self.compact_bytes:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rotate the live journal and fold it into the snapshot on a background thread."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        if os.path.exists(self.rotated_path):
+            self._start_compactor()
+            return
+        self._fp.close()
+        os.replace(self.journal_path, self.rotated_path)
+        fsync_dir(self.journal_path)
+        self._fp = open(self.journal_path, "ab")
+        self._journal_size = 0
+        self._start_compactor()
+
+    def close(self) -> None:
+        if self._compactor is not None:
+            self._compactor.join()
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _start_compactor(self) -> None:
+        self._compactor = threading.Thread(target=self._fold_rotated, name="journal-compactor", daemon=True)
+        self._compactor.start()
+
+    def _fold_rotated(self) -> None:
+        data = read_snapshot(self.path)
+        self._replay(self.rotated_path, data)
+        write_snapshot(self.path, (encode_entry(user_id, state) for user_id, state in data.items()), durable=True)
+        os.remove(self.rotated_path)
+        fsync_dir(self.rotated_path)
+
+    @staticmethod
+    def _replay(segment: str, data: Dict[str, dict]) -> int:
+        """Apply a journal segment to ``data`` and return the length of its valid prefix."""
+        if not os.path.exists(segment):
+            return 0
+        valid = 0
+        with open(segment, "rb") as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final record from a crash mid-append.
+                    break
+                if record["s"] is None:
+                    data.pop(record["u"], None)
+                else:
+                    data[record["u"]] = record["s"]
+                valid += len(line)
+        return valid
+
+
+class SqliteBackend:
+    """One row per user in a WAL-mode SQLite database, written from a dedicated thread.
+
+    The connection lives on the writer thread and every statement runs there in
+    submission order. ``write`` waits for its batch to commit, so it returns
+    only once the rows are on disk. The hot fields are mirrored into indexed
+    columns so a query can pick out cafes without decoding any state.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS cafes (
+            user_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            last_tick REAL NOT NULL DEFAULT 0,
+            is_open INTEGER NOT NULL DEFAULT 0,
+            panel_channel_id INTEGER,
+            cash REAL NOT NULL DEFAULT 0
+        )
+        """,
+        # Ticks are scheduled in memory now; nothing looks cafes up by last_tick.
+        "DROP INDEX IF EXISTS cafes_last_tick",
+        "CREATE INDEX IF NOT EXISTS cafes_is_open ON cafes (is_open)",
+        "CREATE INDEX IF NOT EXISTS cafes_panel_channel_id ON cafes (panel_channel_id)",
+        "CREATE INDEX IF NOT EXISTS cafes_cash ON cafes (cash)",
+    )
+    UPSERT = (
+        "INSERT INTO cafes (user_id, state, last_tick, is_open, panel_channel_id, cash) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, last_tick = excluded.last_tick, "
+        "is_open = excluded.is_open, panel_channel_id = excluded.panel_channel_id, cash = excluded.cash"
+    )
+    DELETE = "DELETE FROM cafes WHERE user_id = ?"
+    SELECT_ALL = "SELECT user_id, state FROM cafes"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._jobs: "queue.Queue[Optional[Tuple[Callable[[sqlite3.Connection], object], Future]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    def load(self) -> Dict[str, dict]:
+        self._writer = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        return self._submit(self._load_rows).result()
+
+    def write(self, changes: Dict[str, Optional[dict]]) -> None:
+        upserts = [self._row(user_id, state) for user_id, state in changes.items() if state is not None]
+        deletes = [(user_id,) for user_id, state in changes.items() if state is None]
+        # Already on the state-io thread: wait, so a failed batch reaches StateStore's retry.
+        self._submit(lambda conn: self._apply(conn, upserts, deletes)).result()
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        self._jobs.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _submit(self, job: Callable[[sqlite3.Connection], object]) -> Future:
+        future: Future = Future()
+        self._jobs.put((job, future))
+        return future
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                break
+            job, future = item
+            try:
+                future.set_result(job(conn))
+            except Exception as exc:
+                future.set_exception(exc)
+        conn.close()
+
+    def _load_rows(self, conn: sqlite3.Connection) -> Dict[str, dict]:
+        return {user_id: json.loads(state) for user_id, state in conn.execute(self.SELECT_ALL)}
+
+    def _apply(self, conn: sqlite3.Connection, upserts: List[tuple], deletes: List[tuple]) -> None:
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(self.UPSERT, upserts)
+            conn.executemany(self.DELETE, deletes)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row(user_id: str, state: dict) -> tuple:
+        return (
+            user_id,
+            json.dumps(state, separators=(",", ":")),
+            state.get("last_tick", 0),
+            int(bool(state.get("is_open"))),
+            state.get("panel_channel_id"),
+            state.get("cash", 0),
+        )
+
+
+STATE_BACKENDS = ("json", "journal", "sqlite", "packed")
+
+
+def open_backend(
+    kind: str,
+    data_file: str,
+    db_file: str,
+    compact_bytes: int = 4 * 1024 * 1024,
+    pack_file: str = "data.pack",
+    defaults: Optional[dict] = None,
+):
+    if kind == "json":
+        return JsonFileBackend(data_file)
+    if kind == "packed":
+        return PackedFileBackend(pack_file, defaults or {})
+    if kind == "journal":
+        return JournalBackend(data_file, compact_bytes=compact_bytes)
+    if kind == "sqlite":
+        return SqliteBackend(db_file)
+    raise RuntimeError(f"Unknown STATE_BACKEND {kind!r}. Choose one of: {', '.join(STATE_BACKENDS)}.")
+
+
+def backend_bytes(backend) -> int:
+    """Size on disk of everything a backend keeps next to its ``path``."""
+    total = 0
+    for suffix in ("", ".journal", ".journal.old", "-wal"):
+        try:
+            total += os.path.getsize(backend.path + suffix)
+        except OSError:
+            pass
+    return total
+
+
+# --------------- STATE STORE ---------------
+class StateStore:
+    """Resident copy of every cafe, written back in batches from an I/O thread.
+
+    The backend is read once by ``load``. Reads and writes after that only
+    touch memory; changed users are remembered in ``dirty`` and handed to the
+    backend by ``flush`` once ``flush_interval`` seconds have passed or
+    ``max_dirty`` users are waiting, whichever comes first.
+
+    ``flush`` never touches the disk itself. It snapshots the dirty states
+    and queues them for the ``state-io`` thread, which encodes and writes
+    them, so the event loop only pays for the copy. ``get`` and ``put`` are
+    the coroutine API for handlers; ``put`` waits for the I/O thread when it
+    falls more than ``max_pending`` batches behind. ``peek`` and
+    ``mark_dirty`` are for code that works on the resident states in place.
+
+    ``stats`` reports load and write timings and the backend's size on disk.
+    """
+
+    def __init__(self, backend, flush_interval: float = 5.0, max_dirty: int = 256, max_pending: int = 4):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.max_pending = max_pending
+        self.data: Dict[str, dict] = {}
+        self.dirty: Set[str] = set()
+        self._last_flush = time.monotonic()
+        self._jobs: "queue.Queue[Optional[Tuple[Dict[str, Optional[dict]], Future]]]" = queue.Queue()
+        self._pending: Deque[Future] = deque()
+        self._retry: List[Iterable[str]] = []
+        self._writer: Optional[threading.Thread] = None
+        self.load_seconds = 0.0
+        self.load_bytes = 0
+        self.disk_bytes = 0
+        self.writes = 0
+        self.write_failures = 0
+        self.written = 0
+        self.write_seconds = 0.0
+        self.write_latencies: Deque[float] = deque(maxlen=1024)
+
+    def load(self) -> None:
+        started = time.perf_counter()
+        self.data = self.backend.load()
+        self.load_seconds = time.perf_counter() - started
+        self.load_bytes = self.disk_bytes = backend_bytes(self.backend)
+        self.dirty.clear()
+        self._last_flush = time.monotonic()
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        return iter(list(self.data.items()))
+
+    def peek(self, user_id: str) -> Optional[dict]:
+        return self.data.get(user_id)
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return self.data.get(user_id)
+
+    async def put(self, user_id: str, state: dict) -> None:
+        self.data[user_id] = state
+        self.mark_dirty(user_id)
+        while len(self._pending) > self.max_pending:
+            await asyncio.wrap_future(self._pending.popleft())
+
+    async def commit(self, user_id: str, handle: StateHandle) -> dict:
+        """Apply what a handler changed through ``handle`` to the resident state and return it."""
+        changes = handle.changes()
+        state = self.data.get(user_id)
+        if state is None:
+            state = self.data[user_id] = snapshot(handle.base)
+        state.update(changes)
+        # The resident state now owns the handle's copies; start the handle
+        # over so later writes through it copy again instead of sharing.
+        handle.base = state
+        handle.own = {}
+        handle.assigned = set()
+        await self.put(user_id, state)
+        return state
+
+    def mark_dirty(self, user_id: str) -> None:
+        self.dirty.add(user_id)
+        if len(self.dirty) >= self.max_dirty:
+            self.flush()
+
+    def import_states(self, data: Dict[str, dict]) -> int:
+        self.data.update(data)
+        self.dirty.update(data)
+        self.flush()
+        return len(data)
+
+    def flush_due(self) -> bool:
+        return bool(self.dirty or self._retry) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self) -> Future:
+        """Hand the dirty states to the I/O thread; the future resolves once they are written."""
+        self._last_flush = time.monotonic()
+        while self._retry:
+            self.dirty.update(self._retry.pop())
+        future: Future = Future()
+        if not self.dirty:
+            future.set_result(0)
+            return future
+        changes = {}
+        for user_id in self.dirty:
+            state = self.data.get(user_id)
+            changes[user_id] = None if state is None else snapshot(state)
+        self.dirty.clear()
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run, name="state-io", daemon=True)
+            self._writer.start()
+        self._jobs.put((changes, future))
+        while self._pending and self._pending[0].done():
+            self._pending.popleft()
+        self._pending.append(future)
+        return future
+
+    def wait(self) -> None:
+        """Block until every queued write has reached the backend."""
+        while self._pending:
+            self._pending.popleft().result()
+
+    def _run(self) -> None:
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                break
+            changes, future = item
+            started = time.perf_counter()
+            try:
+                self.backend.write(changes)
+            except Exception as exc:
+                self.write_failures += 1
+                print(f"[WARN] Saving {len(changes)} cafes failed, retrying on the next flush: {exc}")
+                # Picked up by the next flush on the event loop thread.
+                self._retry.append(list(changes))
+                future.set_result(0)
+            else:
+                elapsed = time.perf_counter() - started
+                self.writes += 1
+                self.written += len(changes)
+                self.write_seconds += elapsed
+                self.write_latencies.append(elapsed)
+                self.disk_bytes = backend_bytes(self.backend)
+                future.set_result(len(changes))
+
+    def stats(self) -> dict:
+        ordered = sorted(self.write_latencies)
+
+        def percentile(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+        return {
+            "cafes": len(self.data),
+            "dirty": len(self.dirty),
+            "load_seconds": self.load_seconds,
+            "load_bytes": self.load_bytes,
+            "disk_bytes": self.disk_bytes,
+            "writes": self.writes,
+            "write_failures": self.write_failures,
+            "written": self.written,
+            "write_seconds": self.write_seconds,
+            "write_p50": percentile(0.5),
+            "write_p99": percentile(0.99),
+        }
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._jobs.put(None)
+            self._writer.join()
+            self._writer = None
+        self.backend.close()
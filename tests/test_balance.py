@@ -0,0 +1,63 @@
+import pytest
+
+import balance
+import game
+
+
+def task(seed="1:0:0", **overrides) -> dict:
+    return {
+        "population": 3,
+        "strategy": "steady",
+        "overrides": overrides,
+        "cafes": 20,
+        "hours": 72,
+        "online": 0.5,
+        "target_pcs": 5,
+        "bankrupt_hours": 24,
+        "seed": seed,
+    }
+
+
+def tunables() -> dict:
+    return {name: getattr(game, name) for name in balance.TUNABLES}
+
+
+def test_seeded_batches_are_reproducible():
+    population, first = balance.simulate_batch(task())
+    assert population == 3 and first["cafes"] == 20
+    assert balance.simulate_batch(task()) == (3, first)
+    assert balance.simulate_batch(task(seed="1:0:20"))[1] != first
+
+
+def test_overrides_apply_to_their_batch_only():
+    plain = balance.simulate_batch(task())
+    overridden = balance.simulate_batch(task(**{"BREAK_CHANCE": 0.9, "SHOP_ITEMS.pro_pc.cost": 1}))
+    assert overridden != plain
+    assert tunables() == balance.DEFAULTS
+    # An earlier override must not leak into a later batch in the same process.
+    assert balance.simulate_batch(task()) == plain
+
+
+def test_configure_resets_before_applying_overrides():
+    try:
+        balance.configure({"BREAK_CHANCE": 0.5, "SHOP_ITEMS.pro_pc.cost": 7, "CUSTOMER_DURATION": [1, 2]})
+        assert game.BREAK_CHANCE == 0.5 and game.SHOP_ITEMS["pro_pc"]["cost"] == 7
+        assert game.CUSTOMER_DURATION == [1, 2]
+        assert balance.DEFAULTS["SHOP_ITEMS"]["pro_pc"]["cost"] == 320
+
+        balance.configure({"VIRUS_CHANCE": 0.0})
+        assert game.VIRUS_CHANCE == 0.0
+        assert {name: value for name, value in tunables().items() if name != "VIRUS_CHANCE"} == {
+            name: value for name, value in balance.DEFAULTS.items() if name != "VIRUS_CHANCE"
+        }
+    finally:
+        balance.configure({})
+    assert tunables() == balance.DEFAULTS
+
+
+def test_grid_names_are_checked():
+    assert balance.parse_grid(["SHOP_ITEMS.pro_pc.cost=[260,320]"]) == {"SHOP_ITEMS.pro_pc.cost": [260, 320]}
+    with pytest.raises(RuntimeError):
+        balance.parse_grid(["HOUR_SECONDS=[1]"])
+    with pytest.raises(RuntimeError):
+        balance.parse_grid(["SHOP_ITEMS.missing.cost=[1]"])
@@ -0,0 +1,116 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+import main
+from game import BASE_STATE, HOUR_SECONDS, electricity_load
+from leaderboard import Leaderboard
+from panel_edits import EditScheduler
+from storage import JsonFileBackend, StateStore, snapshot
+from tick_scheduler import TickScheduler
+
+USERS = 6
+CLICKS = 60
+TICK_ROUNDS = 400
+
+
+class User:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.display_name = str(user_id)
+
+
+class Response:
+    async def edit_message(self, **_) -> None:
+        await asyncio.sleep(0)
+
+    async def send_message(self, *_, **__) -> None:
+        await asyncio.sleep(0)
+
+
+class Interaction:
+    def __init__(self, user_id: int):
+        self.user = User(user_id)
+        self.message = None
+        self.response = Response()
+
+
+@pytest.fixture
+def bot(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "store", StateStore(JsonFileBackend(str(tmp_path / "data.json"))))
+    monkeypatch.setattr(main, "scheduler", TickScheduler(HOUR_SECONDS))
+    monkeypatch.setattr(main, "leaderboard", Leaderboard())
+    monkeypatch.setattr(main, "edits", EditScheduler(concurrency=2, channel_rate=1000, channel_per=1))
+    monkeypatch.setattr(main, "panel_fingerprints", {})
+    monkeypatch.setattr(main, "tick_pool", None)
+    monkeypatch.setattr(main, "TICK_ENGINE", "python")
+
+    async def refresh_panel(user_id: str) -> None:
+        pass
+
+    monkeypatch.setattr(main, "refresh_panel", refresh_panel)
+
+    # Hold each handler between changing the cafe and saving it for a moment,
+    # so ticks land inside that window as often as they can.
+    set_state = main.set_state
+
+    async def slow_set_state(user_id: int, state) -> None:
+        await asyncio.sleep(random.random() * 0.001)
+        await set_state(user_id, state)
+
+    monkeypatch.setattr(main, "set_state", slow_set_state)
+    main.store.load()
+    yield main
+    main.store.close()
+
+
+def test_clicks_and_ticks_lose_no_updates(bot):
+    random.seed(0)
+    now = [time.time()]
+    start = {}
+    for index in range(USERS):
+        state = snapshot(BASE_STATE)
+        state.update(cash=10**6, is_open=True, last_tick=now[0] - HOUR_SECONDS, last_active=now[0])
+        state["panel_message_id"] = 1000 + index
+        state["panel_channel_id"] = 1
+        bot.store.data[str(index + 1)] = state
+        start[str(index + 1)] = snapshot(state)
+    bot.index_states(now[0])
+    view = bot.CafeView()
+
+    async def clicker(user_id: int) -> None:
+        for _ in range(CLICKS):
+            await view._locked("pay_bills", Interaction(user_id))
+            await asyncio.sleep(random.random() * 0.001)
+
+    async def ticker() -> int:
+        ticked = 0
+        for _ in range(TICK_ROUNDS):
+            now[0] += HOUR_SECONDS
+            ticked += await bot.tick_due(now[0])
+            await asyncio.sleep(random.random() * 0.0005)
+        return ticked
+
+    async def play() -> int:
+        bot.edits.start()
+        try:
+            results = await asyncio.gather(ticker(), *(clicker(index + 1) for index in range(USERS)))
+        finally:
+            await bot.edits.stop()
+        return results[0]
+
+    ticked = asyncio.run(play())
+    assert ticked > 0
+
+    for user_id, before in start.items():
+        after = bot.store.peek(user_id)
+        hours = round((after["last_tick"] - before["last_tick"]) / HOUR_SECONDS)
+        assert hours > 0
+        # Paying bills moves money from cash to bills and a tick only adds its
+        # fixed hourly bill, so a tick or a payment that was overwritten
+        # shows up as a gap here.
+        hourly = max(3, electricity_load(after) // 6)
+        assert after["cash"] - after["bills"] == before["cash"] - before["bills"] - hours * hourly
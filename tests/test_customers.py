@@ -0,0 +1,163 @@
+import random
+
+import pytest
+
+import game
+import storage
+from game import ANGRY, HARDCORE, SUSPICIOUS
+
+
+def legacy_customer(rng: random.Random) -> dict:
+    return {
+        "hardcore": rng.random() < 0.25,
+        "suspicious": rng.random() < 0.15,
+        "angry": rng.random() < 0.2,
+        "hours_left": rng.randint(1, 4),
+        "rate": rng.randint(2, 4),
+    }
+
+
+def legacy_cafe(rng: random.Random, count: int) -> dict:
+    state = storage.snapshot(game.BASE_STATE)
+    state.update(pcs=count + 2, is_open=True, last_tick=1000.0)
+    state["customers"] = [legacy_customer(rng) for _ in range(count)]
+    return state
+
+
+def unpack(buckets: list) -> list:
+    """The legacy list the buckets stand for, customer by customer in bucket order."""
+    return [
+        {
+            "hardcore": bool(flags & HARDCORE),
+            "suspicious": bool(flags & SUSPICIOUS),
+            "angry": bool(flags & ANGRY),
+            "hours_left": hours_left,
+            "rate": rate,
+        }
+        for flags, hours_left, rate, count in buckets
+        for _ in range(count)
+    ]
+
+
+def legacy_remove(customers: list, key: str) -> bool:
+    """How the list-based panel removed a customer: the first one with ``key`` set."""
+    flagged = [customer for customer in customers if customer.get(key)]
+    if not flagged:
+        return False
+    customers.remove(flagged[0])
+    return True
+
+
+def legacy_hour(state: dict) -> None:
+    """The customer part of apply_hour from before buckets, one customer at a time."""
+    remaining = []
+    for customer in state["customers"]:
+        state["cash"] += customer["rate"]
+        customer["hours_left"] -= 1
+        if customer["hours_left"] > 0:
+            remaining.append(customer)
+        elif customer["angry"]:
+            game.add_review(state, "They never cleaned the PCs.", -0.1)
+        elif customer["hardcore"]:
+            game.add_review(state, "Decent rigs for marathon gaming.", 0.05)
+    state["customers"] = remaining
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_legacy_customers_convert_to_buckets_and_round_trip(seed):
+    rng = random.Random(seed)
+    state = legacy_cafe(rng, 30)
+    legacy = [dict(customer) for customer in state["customers"]]
+    game.upgrade_state(state)
+    buckets = state["customers"]
+
+    assert all(isinstance(bucket, list) and len(bucket) == 4 for bucket in buckets)
+    assert sum(bucket[3] for bucket in buckets) == len(legacy)
+    assert len({tuple(bucket[:3]) for bucket in buckets}) == len(buckets)
+    assert game.customer_counts(state) == (
+        len(legacy),
+        sum(customer["angry"] for customer in legacy),
+        sum(customer["hardcore"] for customer in legacy),
+        sum(customer["suspicious"] for customer in legacy),
+    )
+    assert game.pack_customers(unpack(buckets)) == buckets
+    # Already converted cafes are left alone.
+    assert game.upgrade_state(state)["customers"] == buckets
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("action, key", [(game.kick_angry, "angry"), (game.ban_suspicious, "suspicious")])
+def test_removal_takes_the_customer_the_list_code_did(seed, action, key):
+    rng = random.Random(seed)
+    state = legacy_cafe(rng, 12)
+    legacy = [dict(customer) for customer in state["customers"]]
+    game.upgrade_state(state)
+    while True:
+        removed = legacy_remove(legacy, key)
+        refusal = action(state)
+        assert (refusal is None) == removed
+        if not removed:
+            break
+        assert sorted(state["customers"]) == sorted(game.pack_customers(legacy))
+
+
+@pytest.mark.parametrize("action", [game.kick_angry, game.ban_suspicious])
+def test_removal_refuses_when_nobody_qualifies(action):
+    state = storage.snapshot(game.BASE_STATE)
+    state["customers"] = [[HARDCORE, 3, 5, 2], [0, 2, 3, 1]]
+    before = storage.snapshot(state)
+    assert isinstance(action(state), str)
+    assert state == before
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_hourly_aging_is_a_bucket_shift(seed, monkeypatch):
+    # Rolls that never fire keep the random events out of the comparison.
+    monkeypatch.setattr(game.random, "random", lambda: 0.999)
+    rng = random.Random(seed)
+    state = legacy_cafe(rng, 25)
+    game.upgrade_state(state)
+    expected = storage.snapshot(state)
+    expected["customers"] = unpack(expected["customers"])
+    for _ in range(5):
+        game.apply_hour(state)
+        legacy_hour(expected)
+        assert all(bucket[1] >= 1 for bucket in state["customers"])
+        assert state["customers"] == game.pack_customers(expected["customers"])
+        assert state["cash"] == expected["cash"]
+        assert state["reputation"] == pytest.approx(expected["reputation"])
+
+
+@pytest.mark.parametrize("start", [0.5, 0.55, 0.75, 4.9, 4.98, 5.0])
+@pytest.mark.parametrize("flags, delta", [(ANGRY, -0.1), (HARDCORE, 0.05), (ANGRY | HARDCORE, -0.1)])
+@pytest.mark.parametrize("count", [1, 3, 40])
+def test_grouped_review_matches_one_review_per_customer(start, flags, delta, count, monkeypatch):
+    # Reputation always stays within [0.5, 5.0], and a bucket's reviews all
+    # push the same way, so clamping once equals clamping after each one.
+    monkeypatch.setattr(game.random, "random", lambda: 0.999)
+    state = storage.snapshot(game.BASE_STATE)
+    state.update(pcs=count, is_open=True, last_tick=1000.0, reputation=start)
+    state["customers"] = [[flags, 1, 3, count]]
+    game.apply_hour(state)
+
+    expected = start
+    for _ in range(count):
+        expected = max(0.5, min(5.0, expected + delta))
+    assert state["reputation"] == pytest.approx(expected)
+    assert state["customers"] == []
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_spawning_never_seats_more_customers_than_working_pcs(seed):
+    rng = random.Random(seed)
+    random.seed(seed)
+    state = storage.snapshot(game.BASE_STATE)
+    state.update(pcs=rng.randint(1, 8), is_open=True)
+    state["broken_pcs"] = rng.randint(0, state["pcs"])
+    for _ in range(10):
+        game.spawn_customers(state, rng.randint(0, 6))
+        seated = sum(bucket[3] for bucket in state["customers"])
+        assert seated <= game.working_pcs(state)
+    # Asking for more than fits fills every working PC exactly.
+    game.spawn_customers(state, 100)
+    assert sum(bucket[3] for bucket in state["customers"]) == game.working_pcs(state)
@@ -0,0 +1,153 @@
+import math
+import random
+
+import pytest
+
+import game
+import storage
+
+RUNS = 1000
+
+
+def cafe(staff=None, alerts=None, **fields) -> dict:
+    state = storage.snapshot(game.BASE_STATE)
+    state["last_tick"] = 1000.0
+    state["staff"].update(staff or {})
+    state["staff"]["total"] = sum(value for key, value in state["staff"].items() if key != "total")
+    state["alerts"].update(alerts or {})
+    state.update(fields)
+    return state
+
+
+PROFILES = {
+    "unattended": cafe(pcs=6, broken_pcs=1, overheating=3, cash=5000, bills=0, is_open=True, reputation=5.0),
+    "staffed": cafe(
+        pcs=8, broken_pcs=4, overheating=6, cash=9000, bills=0, is_open=True, reputation=4.5,
+        staff={"technicians": 1, "skilled": 1},
+    ),
+    "single_pc": cafe(pcs=1, cash=3000, bills=0, is_open=True, reputation=5.0, staff={"technicians": 1}),
+    "corrupt": cafe(
+        pcs=4, cash=3000, bills=0, is_open=True, reputation=5.0, staff={"corrupt": 1, "technicians": 1},
+        alerts={"viruses": 6},
+    ),
+    "going_broke": cafe(pcs=3, overheating=2, cash=400, bills=100, is_open=True, staff={"lazy": 2}),
+}
+
+
+def stepped(state: dict, hours: int) -> dict:
+    for _ in range(hours):
+        game.apply_hour(state)
+    return state
+
+
+def moments(samples):
+    n = len(samples)
+    mean = sum(samples) / n
+    variance = sum((value - mean) ** 2 for value in samples) / n
+    fourth = sum((value - mean) ** 4 for value in samples) / n
+    return mean, variance, fourth
+
+
+def assert_same_distribution(expected, actual, name):
+    # Means and variances must agree to within four standard errors; a
+    # variance's standard error comes from the fourth central moment.
+    n = len(expected)
+    mean_e, var_e, fourth_e = moments(expected)
+    mean_a, var_a, fourth_a = moments(actual)
+    assert abs(mean_a - mean_e) <= 4 * math.sqrt((var_e + var_a) / n) + 1e-9, f"{name} mean"
+    spread = math.sqrt((fourth_e - var_e**2 + fourth_a - var_a**2) / n)
+    assert abs(var_a - var_e) <= 4 * spread + 1e-9, f"{name} variance"
+
+
+@pytest.mark.parametrize("name", sorted(PROFILES))
+@pytest.mark.parametrize("hours", [1, 37, 300])
+def test_closed_forms_match_stepping(name, hours):
+    # Without customers these fields follow from the staff, the PCs and the
+    # electricity alone, so no roll can make the two paths disagree.
+    expected = stepped(storage.snapshot(PROFILES[name]), hours)
+    actual = storage.snapshot(PROFILES[name])
+    game.fast_forward(actual, hours)
+    for field in ("cash", "bills", "overheating", "is_open", "last_tick"):
+        assert actual[field] == pytest.approx(expected[field]), field
+    for alert in ("police", "fire"):
+        assert actual["alerts"][alert] == pytest.approx(expected["alerts"][alert]), alert
+
+
+@pytest.mark.parametrize("p", [0.02, 0.18, 0.6])
+def test_geometric_moments(p):
+    random.seed(1)
+    draws = [game.geometric(p) for _ in range(20000)]
+    mean = sum(draws) / len(draws)
+    variance = sum((draw - mean) ** 2 for draw in draws) / len(draws)
+    assert mean == pytest.approx(1 / p, rel=0.05)
+    assert variance == pytest.approx((1 - p) / p**2, rel=0.1)
+    assert min(draws) == 1
+
+
+@pytest.mark.parametrize("n, p", [(40, 0.12), (500, 0.12), (5000, 0.3)])
+def test_binomial_matches_counted_rolls(n, p):
+    random.seed(2)
+    counted = [sum(random.random() < p for _ in range(n)) for _ in range(RUNS)]
+    drawn = [game.binomial(n, p) for _ in range(RUNS)]
+    assert_same_distribution(counted, drawn, f"binomial({n}, {p})")
+
+
+@pytest.mark.parametrize("viruses", [0, 5, 8])
+def test_virus_outbreak_matches_hourly_rolls(viruses):
+    hours = 30
+    random.seed(3)
+    counts, outbreaks = [], []
+    for _ in range(RUNS):
+        count, outbreak = viruses, 1 if viruses >= game.VIRUS_OUTBREAK_LEVEL else hours + 1
+        for hour in range(1, hours + 1):
+            if random.random() < game.VIRUS_CHANCE:
+                count = min(10, count + 1)
+                if count == game.VIRUS_OUTBREAK_LEVEL:
+                    outbreak = hour
+        counts.append(count)
+        outbreaks.append(outbreak)
+    sampled = [game.virus_outbreak(viruses, hours) for _ in range(RUNS)]
+    assert_same_distribution(counts, [count for count, _ in sampled], "viruses")
+    assert_same_distribution(outbreaks, [outbreak for _, outbreak in sampled], "outbreak hour")
+
+
+@pytest.mark.parametrize("name", sorted(PROFILES))
+def test_tick_state_matches_apply_hour_in_distribution(name):
+    hours = game.FAST_FORWARD_MIN_HOURS + 40
+    random.seed(4)
+    expected = [stepped(storage.snapshot(PROFILES[name]), hours) for _ in range(RUNS)]
+    actual = [game.tick_state("test", storage.snapshot(PROFILES[name]), hours) for _ in range(RUNS)]
+    for field in ("broken_pcs", "reputation", "cash", "bills"):
+        assert_same_distribution(
+            [float(state[field]) for state in expected], [float(state[field]) for state in actual], field
+        )
+    assert_same_distribution(
+        [state["alerts"]["viruses"] for state in expected], [state["alerts"]["viruses"] for state in actual], "viruses"
+    )
+
+
+@pytest.mark.parametrize("name", ["staffed", "single_pc", "corrupt"])
+@pytest.mark.parametrize("tail", [0, 2])
+def test_staffed_breaks_match_apply_hour_without_the_exact_tail(name, tail, monkeypatch):
+    # With no exact replay after the jump, broken PCs must already come out of
+    # the fast forward with the right spread, not just the right drift.
+    monkeypatch.setattr(game, "FAST_FORWARD_TAIL_HOURS", tail)
+    hours = game.FAST_FORWARD_MIN_HOURS + 40
+    random.seed(5)
+    expected = [stepped(storage.snapshot(PROFILES[name]), hours) for _ in range(RUNS)]
+    actual = [game.tick_state("test", storage.snapshot(PROFILES[name]), hours) for _ in range(RUNS)]
+    for field in ("broken_pcs", "reputation"):
+        assert_same_distribution(
+            [float(state[field]) for state in expected], [float(state[field]) for state in actual], field
+        )
+
+
+@pytest.mark.parametrize("fixes, broken_pcs", [(1, 0), (1, 6), (2, 7), (3, 8)])
+@pytest.mark.parametrize("hours", [1, 3, 12])
+def test_staffed_breaks_match_hourly_rolls(fixes, broken_pcs, hours):
+    # Short runs catch the backlog still being worked off, hot PCs included.
+    state = cafe(pcs=8, broken_pcs=broken_pcs, overheating=7, alerts={"viruses": 7}, staff={"technicians": fixes})
+    random.seed(6)
+    expected = [stepped(storage.snapshot(state), hours)["broken_pcs"] for _ in range(RUNS)]
+    actual = [game.staffed_breaks(state, hours, fixes, 1)[0] for _ in range(RUNS)]
+    assert_same_distribution(expected, actual, "broken_pcs")
@@ -0,0 +1,70 @@
+import json
+import os
+
+from storage import JournalBackend, encode_entry, read_snapshot, write_snapshot
+
+
+def journal_line(user_id: str, state) -> bytes:
+    return (json.dumps({"u": user_id, "s": state}) + "\n").encode("utf-8")
+
+
+def test_load_replays_the_journal_over_the_snapshot(tmp_path):
+    path = str(tmp_path / "data.json")
+    write_snapshot(path, [encode_entry("1", {"cash": 1}), encode_entry("2", {"cash": 2})])
+    with open(f"{path}.journal", "wb") as fp:
+        fp.write(journal_line("2", {"cash": 20}) + journal_line("3", {"cash": 3}) + journal_line("1", None))
+
+    backend = JournalBackend(path)
+    assert backend.load() == {"2": {"cash": 20}, "3": {"cash": 3}}
+    backend.write({"3": {"cash": 30}, "4": {"cash": 4}})
+    backend.close()
+
+    backend = JournalBackend(path)
+    assert backend.load() == {"2": {"cash": 20}, "3": {"cash": 30}, "4": {"cash": 4}}
+    backend.close()
+
+
+def test_torn_final_line_is_ignored_and_truncated(tmp_path):
+    path = str(tmp_path / "data.json")
+    committed = journal_line("1", {"cash": 1}) + journal_line("2", {"cash": 2})
+    with open(f"{path}.journal", "wb") as fp:
+        fp.write(committed + journal_line("3", {"cash": 3})[:-7])
+
+    backend = JournalBackend(path)
+    assert backend.load() == {"1": {"cash": 1}, "2": {"cash": 2}}
+    assert os.path.getsize(f"{path}.journal") == len(committed)
+    # The next record starts on a fresh line instead of being glued to the torn one.
+    backend.write({"3": {"cash": 33}})
+    backend.close()
+
+    backend = JournalBackend(path)
+    assert backend.load() == {"1": {"cash": 1}, "2": {"cash": 2}, "3": {"cash": 33}}
+    backend.close()
+
+
+def test_compaction_interrupted_after_rotation_recovers_every_entry(tmp_path, monkeypatch):
+    path = str(tmp_path / "data.json")
+    backend = JournalBackend(path, compact_bytes=200)
+    backend.load()
+    # Crash between the rename to .journal.old and the snapshot write.
+    monkeypatch.setattr(backend, "_start_compactor", lambda: None)
+    expected = {}
+    for batch in range(10):
+        changes = {str(user_id): {"cash": batch * 10 + user_id} for user_id in range(3)}
+        expected.update(changes)
+        backend.write(changes)
+    backend.write({"0": None})
+    del expected["0"]
+    backend.close()
+    assert os.path.exists(backend.rotated_path)
+    assert read_snapshot(path) == {}
+
+    backend = JournalBackend(path, compact_bytes=200)
+    assert backend.load() == expected
+    backend.close()
+    assert not os.path.exists(backend.rotated_path)
+    assert read_snapshot(path)
+
+    backend = JournalBackend(path)
+    assert backend.load() == expected
+    backend.close()
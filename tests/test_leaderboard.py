@@ -0,0 +1,75 @@
+import random
+from bisect import bisect_left, insort
+
+import pytest
+
+import leaderboard
+from leaderboard import LEADERBOARD_METRICS, BucketList, Leaderboard
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("load", [1, 2, 3, 8])
+def test_bucket_list_matches_a_sorted_list(seed, load):
+    rng = random.Random(seed)
+    initial = [rng.randint(0, 50) for _ in range(rng.randint(0, 30))]
+    keys = BucketList(initial, load=load)
+    expected = sorted(initial)
+    for _ in range(1500):
+        if expected and rng.random() < 0.45:
+            key = rng.choice(expected)
+            keys.remove(key)
+            expected.remove(key)
+        else:
+            key = rng.randint(0, 50)
+            keys.add(key)
+            insort(expected, key)
+        assert len(keys) == len(expected)
+        probe = rng.randint(-1, 51)
+        assert keys.bisect_left(probe) == bisect_left(expected, probe)
+        start = rng.randint(0, len(expected))
+        assert list(keys.islice(start, start + 5)) == expected[start : start + 5]
+        assert all(len(bucket) <= 2 * load for bucket in keys.buckets)
+        assert all(keys.buckets), "an emptied bucket was left behind"
+    assert list(keys.islice()) == expected
+
+
+def test_bucket_list_refuses_missing_keys():
+    keys = BucketList([1, 3], load=1)
+    with pytest.raises(ValueError):
+        keys.remove(2)
+    with pytest.raises(ValueError):
+        keys.remove(4)
+    keys.remove(1)
+    keys.remove(3)
+    assert len(keys) == 0 and keys.bisect_left(0) == 0
+    with pytest.raises(ValueError):
+        keys.remove(3)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_leaderboard_matches_a_full_sort(seed, monkeypatch):
+    # Without sortedcontainers and with tiny buckets, so splits and merges happen.
+    monkeypatch.setattr(leaderboard, "SortedList", None)
+    monkeypatch.setattr(leaderboard, "BucketList", lambda keys=(): BucketList(keys, load=2))
+    rng = random.Random(seed)
+
+    def cafe() -> dict:
+        return {"cash": rng.randint(0, 20), "reputation": rng.choice([0.5, 1.0, 2.5, 5.0]), "pcs": rng.randint(1, 4)}
+
+    states = {str(user_id): cafe() for user_id in range(1, 40)}
+    board = Leaderboard()
+    board.rebuild(states.items())
+    for _ in range(400):
+        user_id = rng.randint(1, 60)
+        states[str(user_id)] = cafe()
+        board.update(user_id, states[str(user_id)])
+
+        for metric in LEADERBOARD_METRICS:
+            ordered = sorted((-state[metric], int(key)) for key, state in states.items())
+            assert board.top(metric, 10) == [(uid, -negated) for negated, uid in ordered[:10]]
+            probe = int(rng.choice(list(states)))
+            assert board.rank(metric, probe) == ordered.index((-states[str(probe)][metric], probe)) + 1
+            value, stranger = rng.randint(0, 20), 10**6
+            assert board.ahead(metric, value, stranger) == bisect_left(ordered, (-value, stranger))
+    assert len(board) == len(states)
+    assert board.rank("cash", 10**6) is None
@@ -0,0 +1,97 @@
+import re
+import threading
+import time
+
+import pytest
+
+from metrics import Registry, StackSampler
+
+SAMPLE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+
+
+def parse(text: str) -> dict:
+    """``{(name, labels): value}`` for every sample line of an exposition."""
+    assert text.endswith("\n")
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        pairs = tuple(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or ""))
+        samples[(name, pairs)] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("tick_seconds", "Tick duration.", buckets=(0.1, 0.5, 1.0))
+    for value in (0.05, 0.1, 0.3, 0.7, 0.7, 4.0):
+        latency.observe(value, shard=1)
+    latency.observe(0.2, shard=2)
+    samples = parse(registry.render())
+
+    for shard, expected in (("1", [2, 3, 5, 6]), ("2", [0, 1, 1, 1])):
+        bounds = ("0.1", "0.5", "1.0", "+Inf")
+        buckets = [samples[("tick_seconds_bucket", (("shard", shard), ("le", le)))] for le in bounds]
+        assert buckets == expected
+        assert buckets == sorted(buckets)
+        assert buckets[-1] == samples[("tick_seconds_count", (("shard", shard),))]
+    assert samples[("tick_seconds_sum", (("shard", "1"),))] == pytest.approx(5.85)
+    assert latency.count(shard=1) == 6 and latency.count(shard=3) == 0
+    assert latency.percentile(0.5, shard=1) == 0.7
+
+
+def test_counters_render_names_and_labels():
+    registry = Registry()
+    clicks = registry.counter("button_clicks_total", "Panel button presses.")
+    clicks.inc(button="open")
+    clicks.inc(2, button="open")
+    clicks.inc(button='say "hi"\n', shard=0)
+    registry.counter("empty_total", "Never incremented.")
+    text = registry.render()
+
+    assert "# HELP button_clicks_total Panel button presses.\n# TYPE button_clicks_total counter\n" in text
+    assert "# TYPE empty_total counter\n" in text
+    assert 'button_clicks_total{button="open"} 3\n' in text
+    # Labels are sorted by name and values are escaped.
+    assert 'button_clicks_total{button="say \\"hi\\"\\n",shard="0"} 1\n' in text
+    assert clicks.value(button="open") == 3 and clicks.value(button="close") == 0
+
+
+def test_sampled_metrics_and_failing_collectors():
+    registry = Registry()
+    registry.sampled("cafes_open", "gauge", "Open cafes.", lambda: 4)
+    registry.sampled("queue_depth", "gauge", "Queued jobs per shard.", lambda: {0: 2, 1: 5}, label="shard")
+    registry.sampled("broken", "gauge", "Always fails.", lambda: 1 / 0)
+    samples = parse(registry.render())
+
+    assert samples == {
+        ("cafes_open", ()): 4,
+        ("queue_depth", (("shard", "0"),)): 2,
+        ("queue_depth", (("shard", "1"),)): 5,
+    }
+    with pytest.raises(RuntimeError):
+        registry.counter("cafes_open", "Registered twice.")
+
+
+def busy_focus(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_stack_sampler_keeps_only_focused_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_focus, args=(stop,))
+    worker.start()
+    sampler = StackSampler(worker.ident, interval=0.001, focus="busy_focus")
+    sampler.start()
+    time.sleep(0.2)
+    report = sampler.stop()
+    stop.set()
+    worker.join()
+
+    header, *stacks = report.splitlines()
+    assert not sampler.running and sampler.samples > 0
+    assert header.startswith(f"# {sampler.samples} samples") and header.endswith("in busy_focus")
+    assert stacks and all("busy_focus (test_metrics.py:" in stack for stack in stacks)
+    assert sum(int(stack.rsplit(" ", 1)[1]) for stack in stacks) <= sampler.samples
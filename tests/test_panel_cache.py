@@ -0,0 +1,72 @@
+from bench import CHURN_ACTIVE, panel_cache_week
+from panel_cache import PanelCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_size_cap_evicts_least_recently_used():
+    clock = Clock()
+    cache = PanelCache(max_size=3, ttl=100, clock=clock)
+    for owner_id in (1, 2, 3):
+        cache.put(owner_id, 10, owner_id * 100)
+    assert cache.get(1) == (10, 100)
+    cache.put(4, 10, 400)
+    assert 2 not in cache
+    assert list(cache) == [3, 1, 4]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_idle_entries_expire_on_lookup_and_insert():
+    clock = Clock()
+    cache = PanelCache(max_size=10, ttl=100, clock=clock)
+    cache.put(1, 10, 100)
+    cache.put(2, 10, 200)
+    clock.now = 60
+    assert cache.get(2) == (10, 200)
+    clock.now = 101
+    # Entry 1 is past its TTL, entry 2 was refreshed by the lookup at 60.
+    assert cache.get(1) is None
+    assert cache.get(2) == (10, 200)
+    clock.now = 300
+    cache.put(3, 10, 300)
+    assert list(cache) == [3]
+    stats = cache.stats()
+    assert stats["expirations"] == 2
+    assert stats["evictions"] == 0
+
+
+def test_counters():
+    clock = Clock()
+    cache = PanelCache(max_size=2, ttl=100, clock=clock)
+    assert cache.get(1) is None
+    cache.put(1, 10, 100)
+    cache.get(1)
+    cache.get(1)
+    cache.put(2, 10, 200)
+    cache.put(3, 10, 300)
+    cache.pop(3)
+    assert cache.stats() == {
+        "size": 1,
+        "hits": 2,
+        "misses": 1,
+        "evictions": 1,
+        "expirations": 0,
+        "hit_ratio": 2 / 3,
+    }
+
+
+def test_resident_size_stays_flat_over_a_week_of_churn():
+    # A cap well above the active window, so only the idle TTL can keep the
+    # cache from growing with every player who ever showed up.
+    cache, resident = panel_cache_week(seed=1, cache_size=100_000)
+    stats = cache.stats()
+    assert stats["expirations"] > 0
+    assert stats["evictions"] == 0
+    assert len(cache) < 2 * CHURN_ACTIVE
+    assert resident[-1] / resident[0] < 1.2
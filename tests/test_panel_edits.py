@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from panel_edits import EditScheduler, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeDiscord:
+    """Records what would have gone out, each send taking ``latency`` on the clock."""
+
+    def __init__(self, clock: Clock, latency: float = 0.0):
+        self.clock = clock
+        self.latency = latency
+        self.sent = []
+
+    def edit(self, label: str):
+        async def send() -> None:
+            await asyncio.sleep(0)
+            self.clock.now += self.latency
+            self.sent.append(label)
+
+        return send
+
+
+async def settle(rounds: int = 20) -> None:
+    """Let the workers run until every queued send has finished."""
+    for _ in range(rounds):
+        await asyncio.sleep(0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_only_the_latest_refresh_per_panel_is_sent():
+    async def play():
+        clock = Clock()
+        discord = FakeDiscord(clock)
+        scheduler = EditScheduler(concurrency=2, channel_rate=100, channel_per=1, clock=clock)
+        for version in range(3):
+            scheduler.refresh("a", 1, discord.edit(f"a{version}"))
+        scheduler.refresh("b", 1, discord.edit("b0"))
+        assert scheduler.queue_depth == 2
+        scheduler.start()
+        await settle()
+        await scheduler.stop()
+        return scheduler, discord
+
+    scheduler, discord = run(play())
+    assert sorted(discord.sent) == ["a2", "b0"]
+    assert scheduler.stats()["coalesced"] == 2
+    assert scheduler.stats()["sent"] == 2
+
+
+def test_respond_drops_a_pending_refresh_for_the_same_panel():
+    async def play():
+        clock = Clock()
+        discord = FakeDiscord(clock)
+        scheduler = EditScheduler(concurrency=1, channel_rate=100, channel_per=1, clock=clock)
+        scheduler.refresh("a", 1, discord.edit("refresh a"))
+        scheduler.refresh("b", 1, discord.edit("refresh b"))
+        # Answered from the handler, before any worker exists.
+        await scheduler.respond("a", discord.edit("respond a"))
+        assert discord.sent == ["respond a"]
+        scheduler.start()
+        await settle()
+        await scheduler.stop()
+        return scheduler, discord
+
+    scheduler, discord = run(play())
+    assert discord.sent == ["respond a", "refresh b"]
+    assert scheduler.stats()["coalesced"] == 1
+
+
+def test_respond_failures_reach_the_caller():
+    async def fail() -> None:
+        raise RuntimeError("interaction expired")
+
+    scheduler = EditScheduler()
+    with pytest.raises(RuntimeError):
+        run(scheduler.respond("a", fail))
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_empty_channel_bucket_parks_jobs_until_a_token_frees_up():
+    clock = Clock()
+    scheduler = EditScheduler(channel_rate=2, channel_per=10, clock=clock)
+
+    async def send() -> None:
+        pass
+
+    for panel in ("a", "b", "c"):
+        scheduler.refresh(panel, 1, send)
+    scheduler.refresh("d", 2, send)
+
+    picked = []
+    for _ in range(3):
+        job, wait = scheduler._next_job()
+        picked.append(job.key)
+    # Channel 1 spent both tokens; "c" is parked and channel 2 goes ahead.
+    assert picked == ["a", "b", "d"]
+    job, wait = scheduler._next_job()
+    assert job is None
+    assert wait == pytest.approx(5.0)
+    assert scheduler.queue_depth == 1
+
+    clock.now = 4.9
+    assert scheduler._next_job()[0] is None
+    clock.now = 5.0
+    job, wait = scheduler._next_job()
+    assert job.key == "c"
+    assert scheduler.queue_depth == 0
+
+
+def test_parked_refresh_is_replaced_not_duplicated():
+    clock = Clock()
+    scheduler = EditScheduler(channel_rate=1, channel_per=10, clock=clock)
+
+    async def send() -> None:
+        pass
+
+    scheduler.refresh("a", 1, send)
+    scheduler.refresh("b", 1, send)
+    assert scheduler._next_job()[0].key == "a"
+    assert scheduler._next_job()[0] is None
+    scheduler.refresh("b", 1, send)
+    assert scheduler.queue_depth == 1
+    assert scheduler.stats()["coalesced"] == 1
+    clock.now = 10
+    job, _ = scheduler._next_job()
+    assert job.key == "b"
+    assert scheduler._next_job() == (None, None)
+
+
+def test_token_bucket_refills_continuously():
+    bucket = TokenBucket(rate=5, per=5.0, now=0.0)
+    assert [bucket.reserve(0.0) for _ in range(5)] == [0.0] * 5
+    assert bucket.reserve(0.0) == pytest.approx(1.0)
+    assert bucket.reserve(2.5) == 0.0
+
+
+def test_queue_depth_and_latency_counters():
+    async def play():
+        clock = Clock()
+        discord = FakeDiscord(clock, latency=0.5)
+        scheduler = EditScheduler(concurrency=1, channel_rate=100, channel_per=1, clock=clock)
+        for panel in ("a", "b", "c"):
+            scheduler.refresh(panel, 1, discord.edit(panel))
+        depth = scheduler.queue_depth
+        scheduler.start()
+        await settle()
+        await scheduler.stop()
+        return scheduler, depth
+
+    scheduler, depth = run(play())
+    stats = scheduler.stats()
+    assert depth == 3
+    assert stats["queue_depth"] == 0
+    assert stats["sent"] == 3
+    # One worker sends them in turn, each waiting for the ones before it.
+    assert sorted(scheduler.latencies) == pytest.approx([0.5, 1.0, 1.5])
+    assert stats["latency_p50"] == pytest.approx(1.0)
+    assert stats["latency_p99"] == pytest.approx(1.5)
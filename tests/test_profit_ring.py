@@ -0,0 +1,89 @@
+import random
+import types
+
+import pytest
+
+import game
+from game import PROFIT_BUCKET_SECONDS, PROFIT_BUCKETS
+
+HOUR = PROFIT_BUCKET_SECONDS
+NOW = 1_700_000_000 // HOUR * HOUR + 1234
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [float(NOW)]
+    monkeypatch.setattr(game, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def cafe() -> dict:
+    return {"profit_ring": {"hour": 0, "total": 0, "buckets": [0] * PROFIT_BUCKETS}}
+
+
+def test_migration_drops_entries_older_than_a_day(clock):
+    log = [
+        [NOW - 25 * HOUR, 100],
+        [NOW - PROFIT_BUCKETS * HOUR, 50],
+        [NOW - (PROFIT_BUCKETS - 1) * HOUR, 7],
+        [NOW - 60, 3],
+        [NOW + 2 * HOUR, 1000],
+    ]
+    ring = game.profit_ring_from_log(log)
+    assert ring["hour"] == NOW // HOUR
+    assert ring["total"] == 10
+    assert sum(ring["buckets"]) == 10
+
+
+def test_migration_puts_entries_in_their_hourly_buckets(clock):
+    hour = NOW // HOUR
+    log = [[NOW - 5, 2], [NOW - 3 * HOUR, 4], [NOW - 3 * HOUR - 10, 1], [NOW - 23 * HOUR, 8]]
+    ring = game.profit_ring_from_log(log)
+    expected = [0] * PROFIT_BUCKETS
+    expected[hour % PROFIT_BUCKETS] = 2
+    expected[(hour - 3) % PROFIT_BUCKETS] = 5
+    expected[(hour - 23) % PROFIT_BUCKETS] = 8
+    assert ring["buckets"] == expected
+    state = {"profit_ring": ring}
+    assert game.compute_daily_profit(state) == 15
+    # An hour later the oldest bucket has left the window.
+    clock[0] += HOUR
+    assert game.compute_daily_profit(state) == 7
+
+
+def test_upgrade_state_replaces_the_log(clock):
+    state = {"customers": [], "profit_log": [[NOW - 10, 5], [NOW - 30 * HOUR, 9]]}
+    game.upgrade_state(state)
+    assert "profit_log" not in state
+    assert state["profit_ring"]["total"] == 5
+
+
+@pytest.mark.parametrize("gap", [PROFIT_BUCKETS, PROFIT_BUCKETS + 1, 500])
+def test_long_gaps_clear_the_ring(clock, gap):
+    state = cafe()
+    for _ in range(5):
+        game.add_profit(state, 10)
+        clock[0] += HOUR
+    clock[0] += (gap - 1) * HOUR
+    assert game.compute_daily_profit(state) == 0
+    game.add_profit(state, 3)
+    ring = state["profit_ring"]
+    assert ring["total"] == 3
+    assert sum(ring["buckets"]) == 3
+    assert ring["hour"] == int(clock[0] // HOUR)
+
+
+def test_total_tracks_the_buckets_as_the_ring_wraps(clock):
+    rng = random.Random(0)
+    state = cafe()
+    history = []
+    for _ in range(2000):
+        clock[0] += rng.choice([0, 60, HOUR, 3 * HOUR, 30 * HOUR]) if rng.random() < 0.3 else 0
+        amount = rng.randint(0, 40)
+        game.add_profit(state, amount)
+        history.append((int(clock[0] // HOUR), amount))
+        ring = state["profit_ring"]
+        assert ring["total"] == sum(ring["buckets"])
+        hour = int(clock[0] // HOUR)
+        expected = sum(value for entry_hour, value in history if hour - PROFIT_BUCKETS < entry_hour <= hour)
+        assert game.compute_daily_profit(state) == expected
@@ -0,0 +1,85 @@
+import asyncio
+import socket
+
+import pytest
+
+from game import BASE_STATE
+from sharding import ShardRouter, owner_process, partition_path, split_states
+from storage import STATE_BACKENDS, open_backend, snapshot
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def echo(payload: dict) -> dict:
+    return {"reply": payload["user_id"]}
+
+
+def test_router_answers_only_signed_requests():
+    async def play():
+        peers = [("127.0.0.1", free_port()), ("127.0.0.1", free_port())]
+        server = ShardRouter(0, peers, "s3cret")
+        client = ShardRouter(1, peers, "s3cret", timeout=0.5)
+        intruder = ShardRouter(1, peers, "guess", timeout=0.5)
+        await server.start(echo)
+        try:
+            assert await client.forward(0, {"kind": "click", "user_id": 7}) == {"reply": 7}
+            with pytest.raises(RuntimeError):
+                await intruder.forward(0, {"kind": "click", "user_id": 8})
+        finally:
+            await client.close()
+            await intruder.close()
+            await server.close()
+        return server
+
+    server = asyncio.run(play())
+    assert server.served == 1
+    assert server.rejected == 1
+
+
+def test_router_refuses_to_start_without_a_secret():
+    router = ShardRouter(0, [("127.0.0.1", free_port())], "")
+    with pytest.raises(RuntimeError, match="SHARD_SECRET"):
+        asyncio.run(router.start(echo))
+
+
+@pytest.mark.parametrize("kind", STATE_BACKENDS)
+def test_split_reads_through_the_configured_backend(kind, tmp_path):
+    paths = {name: str(tmp_path / name) for name in ("data.json", "data.db", "data.pack")}
+
+    def backend(index: int = 0, processes: int = 1):
+        return open_backend(
+            kind,
+            partition_path(paths["data.json"], index, processes),
+            partition_path(paths["data.db"], index, processes),
+            pack_file=partition_path(paths["data.pack"], index, processes),
+            defaults=BASE_STATE,
+        )
+
+    cafes = {}
+    for index in range(40):
+        state = snapshot(BASE_STATE)
+        state["cash"] = index
+        cafes[str((index + 1) << 22)] = state
+    source = backend()
+    source.load()
+    # For the journal these stay in the journal tail, not in data.json.
+    source.write(cafes)
+    source.close()
+
+    counts = split_states(kind, paths["data.json"], paths["data.db"], paths["data.pack"], 3, BASE_STATE)
+    assert sum(counts) == len(cafes)
+    for index in range(3):
+        part = backend(index, 3)
+        loaded = part.load()
+        part.close()
+        assert len(loaded) == counts[index]
+        for user_id, state in loaded.items():
+            assert owner_process(int(user_id), 3) == index
+            assert state == cafes[user_id]
+
+    with pytest.raises(RuntimeError, match="already holds"):
+        split_states(kind, paths["data.json"], paths["data.db"], paths["data.pack"], 3, BASE_STATE)
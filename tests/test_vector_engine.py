@@ -0,0 +1,82 @@
+import random
+from copy import deepcopy
+
+import pytest
+
+import game
+from bench import synthetic_cafes
+
+np = pytest.importorskip("numpy")
+import vector_engine  # noqa: E402
+
+HOURS = 12
+
+
+class FixedRolls:
+    """Stands in for a NumPy generator whose every roll is ``value``."""
+
+    def __init__(self, value: float):
+        self.value = value
+
+    def random(self, shape):
+        return np.full(shape, self.value)
+
+
+def assert_same(expected, actual, path="state"):
+    if isinstance(expected, dict):
+        assert expected.keys() == actual.keys(), path
+        for key in expected:
+            assert_same(expected[key], actual[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert len(expected) == len(actual), path
+        for index, (left, right) in enumerate(zip(expected, actual)):
+            assert_same(left, right, f"{path}[{index}]")
+    elif isinstance(expected, float) or isinstance(actual, float):
+        assert actual == pytest.approx(expected), path
+    else:
+        assert actual == expected, path
+
+
+@pytest.mark.parametrize("roll", [0.0, 0.13, 0.99])
+def test_step_matches_apply_hour_roll_for_roll(monkeypatch, roll):
+    # With every roll pinned, both paths take the same branches, so the
+    # resulting cafes must agree field for field.
+    cafes = list(synthetic_cafes(300, seed=7).values())
+    expected, actual = deepcopy(cafes), deepcopy(cafes)
+    monkeypatch.setattr(game.random, "random", lambda: roll)
+    for state in expected:
+        for _ in range(HOURS):
+            game.apply_hour(state)
+    vector_engine.advance(actual, [HOURS] * len(actual), rng=FixedRolls(roll))
+    for left, right in zip(expected, actual):
+        assert_same(left, right)
+
+
+def test_uneven_hours_leave_idle_cafes_alone():
+    cafes = list(synthetic_cafes(50, seed=3).values())
+    states = deepcopy(cafes)
+    hours = [index % 3 for index in range(len(states))]
+    vector_engine.advance(states, hours, rng=np.random.default_rng(0))
+    for before, after, count in zip(cafes, states, hours):
+        assert after["last_tick"] == pytest.approx(before["last_tick"] + count * game.HOUR_SECONDS)
+        if count == 0:
+            assert after == before
+
+
+def test_seeded_runs_match_apply_hour_in_distribution():
+    runs = 4000
+    cafes = list(synthetic_cafes(20, seed=11).values())
+    batch = [deepcopy(state) for state in cafes for _ in range(runs // len(cafes))]
+    stepped = deepcopy(batch)
+    random.seed(5)
+    for state in stepped:
+        for _ in range(HOURS):
+            game.apply_hour(state)
+    vector_engine.advance(batch, [HOURS] * len(batch), rng=np.random.default_rng(5))
+
+    for field in ("cash", "broken_pcs", "overheating", "reputation"):
+        expected = np.array([state[field] for state in stepped], dtype=float)
+        actual = np.array([state[field] for state in batch], dtype=float)
+        spread = max(expected.std(), 1e-9)
+        assert abs(actual.mean() - expected.mean()) < 4 * spread / np.sqrt(len(batch)), field
+        assert actual.var() == pytest.approx(expected.var(), rel=0.15, abs=1e-6), field
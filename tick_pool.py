@@ -0,0 +1,185 @@
+import asyncio
+import multiprocessing
+import random
+import zlib
+from copy import deepcopy
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from game import HOUR_SECONDS, tick_state
+
+
+def shard_of(user_id: str, shard_count: int) -> int:
+    return zlib.crc32(user_id.encode("utf-8")) % shard_count
+
+
+def render_delta(before: dict, after: dict) -> dict:
+    """Top-level fields of ``after`` that differ from ``before``."""
+    return {key: value for key, value in after.items() if before.get(key) != value}
+
+
+def balanced_owners(owners: List[int], workers: int) -> List[int]:
+    """Spread shards evenly over ``workers`` while moving as few as possible."""
+    shard_count = len(owners)
+    quota = [shard_count // workers + (1 if index < shard_count % workers else 0) for index in range(workers)]
+    load = [0] * workers
+    result = [-1] * shard_count
+    for shard, owner in enumerate(owners):
+        if owner < workers and load[owner] < quota[owner]:
+            result[shard] = owner
+            load[owner] += 1
+    for shard in range(shard_count):
+        if result[shard] < 0:
+            owner = min(range(workers), key=lambda index: load[index] - quota[index])
+            result[shard] = owner
+            load[owner] += 1
+    return result
+
+
+# --------------- WORKER ---------------
+def run_worker(conn) -> None:
+    """Own one partition of cafes and tick it on request from the bot process."""
+    random.seed()
+    states: Dict[str, dict] = {}
+    while True:
+        message = conn.recv()
+        kind = message[0]
+        if kind == "tick":
+            _, now, updates, due = message
+            states.update(updates)
+            deltas = {}
+            for user_id in due:
+                state = states.get(user_id)
+                if state is None:
+                    continue
+                elapsed = int((now - state.get("last_tick", now)) // HOUR_SECONDS)
+                if elapsed <= 0:
+                    continue
+                before = deepcopy(state)
+                tick_state(user_id, state, elapsed)
+                deltas[user_id] = render_delta(before, state)
+            conn.send(deltas)
+        elif kind == "adopt":
+            states.update(message[1])
+        elif kind == "release":
+            _, shards, shard_count = message
+            released = [user_id for user_id in states if shard_of(user_id, shard_count) in shards]
+            conn.send({user_id: states.pop(user_id) for user_id in released})
+        elif kind == "stop":
+            break
+    conn.close()
+
+
+# --------------- POOL ---------------
+class ShardedTickPool:
+    """Ticks cafes in worker processes, each owning a set of hash shards.
+
+    Users hash into ``shard_count`` fixed shards and shards are assigned to
+    workers, so growing the pool moves whole shards rather than rehashing
+    every user. Workers keep their cafes between ticks; the bot process only
+    ships states changed by handlers (``update``) and receives the changed
+    fields of every cafe that ticked.
+    """
+
+    def __init__(self, workers: int, shard_count: int = 64):
+        self.shard_count = shard_count
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: List[multiprocessing.Process] = []
+        self.conns: list = []
+        self.pending: List[Dict[str, dict]] = []
+        self.owners = [shard % workers for shard in range(shard_count)]
+        self.touched: Set[str] = set()
+        self._ticking = False
+        self._lock = asyncio.Lock()
+        for _ in range(workers):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        parent, child = self.context.Pipe()
+        process = self.context.Process(target=run_worker, args=(child,), name=f"tick-worker-{len(self.processes)}", daemon=True)
+        process.start()
+        child.close()
+        self.processes.append(process)
+        self.conns.append(parent)
+        self.pending.append({})
+
+    def owner_of(self, user_id: str) -> int:
+        return self.owners[shard_of(user_id, self.shard_count)]
+
+    def start(self, states: Dict[str, dict]) -> None:
+        partitions: List[Dict[str, dict]] = [{} for _ in self.conns]
+        for user_id, state in states.items():
+            partitions[self.owner_of(user_id)][user_id] = state
+        for conn, partition in zip(self.conns, partitions):
+            conn.send(("adopt", partition))
+
+    def update(self, user_id: str, state: dict) -> None:
+        """Queue a state changed outside the tick for its owning worker."""
+        self.pending[self.owner_of(user_id)][user_id] = state
+        if self._ticking:
+            self.touched.add(user_id)
+
+    async def tick(self, now: float, due: Iterable[str]) -> Dict[str, dict]:
+        """Tick the ``due`` users on their shards in parallel and return the changed fields per user."""
+        async with self._lock:
+            partitions: List[List[str]] = [[] for _ in self.conns]
+            for user_id in due:
+                partitions[self.owner_of(user_id)].append(user_id)
+            self._ticking = True
+            self.touched.clear()
+            try:
+                for index, conn in enumerate(self.conns):
+                    conn.send(("tick", now, self.pending[index], partitions[index]))
+                    self.pending[index] = {}
+                replies = await asyncio.gather(*(asyncio.to_thread(conn.recv) for conn in self.conns))
+            finally:
+                self._ticking = False
+        deltas: Dict[str, dict] = {}
+        for reply in replies:
+            deltas.update(reply)
+        # A handler saved these users mid-tick. Their fresher state is already
+        # queued for the worker and the skipped hours are picked up next tick.
+        for user_id in self.touched:
+            deltas.pop(user_id, None)
+        return deltas
+
+    async def resize(self, workers: int) -> None:
+        """Grow or shrink the pool, handing whole shards to their new owners."""
+        async with self._lock:
+            while len(self.conns) < workers:
+                self._spawn()
+            owners = balanced_owners(self.owners, workers)
+            moves: Dict[int, Set[int]] = {}
+            for shard, (old, new) in enumerate(zip(self.owners, owners)):
+                if old != new:
+                    moves.setdefault(old, set()).add(shard)
+            released: Dict[str, dict] = {}
+            for old, shards in moves.items():
+                self.conns[old].send(("release", shards, self.shard_count))
+                released.update(await asyncio.to_thread(self.conns[old].recv))
+
+            pending = {user_id: state for partition in self.pending for user_id, state in partition.items()}
+            self.owners = owners
+            retired = [self._retire(index) for index in reversed(range(workers, len(self.conns)))]
+            self.pending = [{} for _ in self.conns]
+            self.start(released)
+            for user_id, state in pending.items():
+                self.update(user_id, state)
+        # The pool no longer knows the retired workers, so ticks can go on
+        # while they exit; waiting for them would stall the event loop.
+        await asyncio.to_thread(self._join, retired)
+
+    def _retire(self, index: int) -> Tuple[multiprocessing.Process, Any]:
+        """Tell worker ``index`` to stop and drop it from the pool; pass the result to ``_join``."""
+        self.conns[index].send(("stop",))
+        del self.pending[index]
+        return self.processes.pop(index), self.conns.pop(index)
+
+    @staticmethod
+    def _join(retired: List[Tuple[multiprocessing.Process, Any]]) -> None:
+        for process, conn in retired:
+            process.join()
+            conn.close()
+
+    def close(self) -> None:
+        """Stop every worker, all at once; blocks, so call it once the event loop has finished."""
+        self._join([self._retire(index) for index in reversed(range(len(self.conns)))])
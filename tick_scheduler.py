@@ -0,0 +1,63 @@
+import heapq
+import zlib
+from typing import Dict, Iterable, List, Tuple
+
+
+class TickScheduler:
+    """Min-heap of cafes keyed on the time they next owe an hour.
+
+    ``pop_due`` only touches cafes whose time has come, so a wakeup costs
+    O(due · log n) instead of a scan over every cafe. Rescheduling pushes a
+    new entry and leaves the old one in the heap; stale entries are skipped
+    when they surface.
+
+    Cafes that are already overdue (after a restart, say) get a stable
+    per-user offset inside one ``period`` so they do not all land on the same
+    wakeup.
+    """
+
+    def __init__(self, period: float):
+        self.period = period
+        self._heap: List[Tuple[float, str]] = []
+        self._due_at: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._due_at)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._due_at
+
+    def jitter(self, user_id: str) -> float:
+        return (zlib.crc32(user_id.encode("utf-8")) % 1000) / 1000 * self.period
+
+    def schedule(self, user_id: str, last_tick: float, now: float) -> None:
+        due_at = last_tick + self.period
+        if due_at <= now:
+            due_at = now + self.jitter(user_id)
+        self._due_at[user_id] = due_at
+        heapq.heappush(self._heap, (due_at, user_id))
+
+    def unschedule(self, user_id: str) -> None:
+        self._due_at.pop(user_id, None)
+
+    def rebuild(self, states: Iterable[Tuple[str, dict]], now: float) -> None:
+        self._heap = []
+        self._due_at = {}
+        for user_id, state in states:
+            due_at = state.get("last_tick", now) + self.period
+            if due_at <= now:
+                due_at = now + self.jitter(user_id)
+            self._due_at[user_id] = due_at
+            self._heap.append((due_at, user_id))
+        heapq.heapify(self._heap)
+
+    def pop_due(self, now: float) -> List[str]:
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            due_at, user_id = heapq.heappop(heap)
+            if self._due_at.get(user_id) != due_at:
+                continue
+            del self._due_at[user_id]
+            due.append(user_id)
+        return due
@@ -0,0 +1,244 @@
+import time
+from typing import List, Optional, Sequence
+
+from game import (
+    ANGRY,
+    BREAK_CHANCE,
+    BREAK_CHANCE_PER_HEAT,
+    HARDCORE,
+    HOUR_SECONDS,
+    OVERHEAT_CHANCE,
+    SUSPICIOUS,
+    VIRUS_BREAK_CHANCE,
+    VIRUS_CHANCE,
+    VIRUS_OUTBREAK_LEVEL,
+    add_profit,
+    compute_daily_profit,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+# Review texts apply_hour can leave behind, indexed by the codes in ``VectorEngine.review``.
+REVIEWS = (
+    "They never cleaned the PCs.",
+    "Decent rigs for marathon gaming.",
+    "Another station died mid-match.",
+    "Rumors of bribery float around.",
+    "Bills piled up. Doors locked until you pay.",
+)
+ANGRY_LEFT, HARDCORE_LEFT, PC_DIED, BRIBERY, BILLS_PILED = range(len(REVIEWS))
+
+STAFF_FIELDS = ("total", "lazy", "corrupt", "skilled", "technicians")
+
+
+# --------------- ENGINE ---------------
+class VectorEngine:
+    """Struct-of-arrays copy of many cafes, advanced an hour at a time with NumPy.
+
+    Every scalar a tick reads or writes becomes one column indexed by cafe.
+    Customer buckets are packed into flat columns sorted by ``c_owner`` so
+    per-cafe sums are a single ``bincount``. ``step`` follows ``apply_hour`` operation
+    for operation, drawing its four rolls per cafe as one ``(4, n)`` batch.
+    """
+
+    def __init__(self, states: Sequence[dict], rng: Optional["np.random.Generator"] = None):
+        if np is None:
+            raise RuntimeError("TICK_ENGINE=numpy needs NumPy. Install it with `pip install numpy`.")
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.n = n = len(states)
+
+        self.cash = np.array([s["cash"] for s in states], dtype=np.float64)
+        self.pcs = np.array([s["pcs"] for s in states], dtype=np.int64)
+        self.broken = np.array([s["broken_pcs"] for s in states], dtype=np.int64)
+        self.overheating = np.array([s["overheating"] for s in states], dtype=np.int64)
+        self.internet = np.array([s["internet_level"] for s in states], dtype=np.int64)
+        self.electricity = np.array([s["electricity_level"] for s in states], dtype=np.int64)
+        self.bills = np.array([s["bills"] for s in states], dtype=np.float64)
+        self.reputation = np.array([s["reputation"] for s in states], dtype=np.float64)
+        self.is_open = np.array([s["is_open"] for s in states], dtype=bool)
+        self.last_tick = np.array([s["last_tick"] for s in states], dtype=np.float64)
+        self.viruses = np.array([s["alerts"]["viruses"] for s in states], dtype=np.int64)
+        self.fire = np.array([s["alerts"]["fire"] for s in states], dtype=np.int64)
+        self.police = np.array([s["alerts"].get("police", 0) for s in states], dtype=np.float64)
+        self.staff = {
+            key: np.array([s["staff"].get(key, 0) for s in states], dtype=np.int64) for key in STAFF_FIELDS
+        }
+        self.review = np.full(n, -1, dtype=np.int64)
+        self.earnings: List["np.ndarray"] = []
+        self.open_hours: List["np.ndarray"] = []
+
+        counts = [len(s.get("customers", [])) for s in states]
+        buckets = np.array(
+            [bucket for s in states for bucket in s.get("customers", [])], dtype=np.float64
+        ).reshape(-1, 4)
+        flags = buckets[:, 0].astype(np.int64)
+        self.c_owner = np.repeat(np.arange(n), counts)
+        self.c_hardcore = (flags & HARDCORE) > 0
+        self.c_suspicious = (flags & SUSPICIOUS) > 0
+        self.c_angry = (flags & ANGRY) > 0
+        self.c_hours = buckets[:, 1].astype(np.int64)
+        self.c_rate = buckets[:, 2]
+        self.c_count = buckets[:, 3].astype(np.int64)
+        self.customers_touched = np.zeros(n, dtype=bool)
+
+    def _review(self, mask: "np.ndarray", code: int, delta) -> None:
+        if np.any(delta):
+            self.reputation = np.where(mask, np.clip(self.reputation + delta, 0.5, 5.0), self.reputation)
+        self.review[mask] = code
+
+    def _customer_reviews(self, finished: "np.ndarray") -> None:
+        # apply_hour reviews departing buckets one by one and clamps the
+        # reputation after each, so replay them in slots: every cafe's first
+        # departure, then every cafe's second, and so on.
+        reviewing = finished & (self.c_angry | self.c_hardcore)
+        index = np.flatnonzero(reviewing)
+        if not index.size:
+            return
+        owners = self.c_owner[index]
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        slot = np.arange(index.size) - np.repeat(starts, np.diff(np.r_[starts, index.size]))
+        angry = self.c_angry[index]
+        count = self.c_count[index]
+        for rank in range(int(slot.max()) + 1):
+            pick = slot == rank
+            for is_angry, code, delta in ((True, ANGRY_LEFT, -0.1), (False, HARDCORE_LEFT, 0.05)):
+                chosen = pick & (angry == is_angry)
+                mask = np.zeros(self.n, dtype=bool)
+                mask[owners[chosen]] = True
+                deltas = np.zeros(self.n)
+                deltas[owners[chosen]] = delta * count[chosen]
+                self._review(mask, code, deltas)
+
+    def step(self, active: "np.ndarray") -> None:
+        """Apply one hour to every cafe where ``active`` is set."""
+        n = self.n
+        unset = active & (self.last_tick == 0)
+        self.last_tick[unset] = time.time()
+        pc_stress = np.maximum(0, self.pcs - self.broken)
+        staff = self.staff
+        fixes = np.maximum(0, staff["technicians"] + staff["skilled"] - staff["lazy"])
+        mischief = np.maximum(0, staff["corrupt"] - staff["skilled"])
+
+        open_now = active & self.is_open
+        c_active = active[self.c_owner]
+        c_open = c_active & open_now[self.c_owner]
+        earnings = np.bincount(
+            self.c_owner[c_open], weights=self.c_rate[c_open] * self.c_count[c_open], minlength=n
+        )
+        self.c_hours[c_open] -= 1
+        self._customer_reviews(c_open & (self.c_hours <= 0))
+        keep = ~c_active | (c_open & (self.c_hours > 0))
+        self.customers_touched |= active
+        self._keep_customers(keep)
+        self.cash += earnings
+        self.earnings.append(earnings)
+        self.open_hours.append(open_now)
+
+        rolls = self.rng.random((4, n))
+        has_customers = np.bincount(self.c_owner, minlength=n) > 0
+        heat = active & has_customers & (rolls[0] < OVERHEAT_CHANCE)
+        self.overheating = np.where(heat, np.minimum(self.pcs, self.overheating + 1), self.overheating)
+
+        chance = BREAK_CHANCE + np.maximum(0, self.overheating - fixes) * BREAK_CHANCE_PER_HEAT
+        died = active & ((pc_stress <= 0) | (rolls[1] < chance)) & (self.broken < self.pcs)
+        self.broken += died
+        self._review(died, PC_DIED, -0.15)
+
+        self.broken = np.where(active, np.minimum(self.pcs, np.maximum(0, self.broken - fixes)), self.broken)
+        cooled = active & (fixes > 0)
+        self.overheating = np.where(cooled, np.maximum(0, self.overheating - fixes), self.overheating)
+
+        bribed = active & (mischief > 0)
+        self.cash = np.where(bribed, np.maximum(0, self.cash - mischief * 6), self.cash)
+        self.police = np.where(bribed, np.minimum(20, self.police + mischief), self.police)
+        self._review(bribed, BRIBERY, -0.05)
+
+        load = np.clip(40 + self.pcs * 8 - self.electricity * 6, 10, 100)
+        self.bills += active * (np.maximum(3, load // 6) + staff["total"] * 2)
+        locked = active & (self.bills > self.cash + 80)
+        self.is_open &= ~locked
+        self.review[locked] = BILLS_PILED
+
+        infected = active & (rolls[2] < VIRUS_CHANCE)
+        self.viruses = np.where(infected, np.minimum(10, self.viruses + 1), self.viruses)
+        outbreak = active & (self.viruses >= VIRUS_OUTBREAK_LEVEL) & (rolls[3] < VIRUS_BREAK_CHANCE)
+        self.broken = np.where(outbreak, np.minimum(self.pcs, self.broken + 1), self.broken)
+
+        self.fire = np.where(active, np.clip(load + self.overheating * 4, 5, 100), self.fire)
+        self.police = np.where(active, np.clip(self.police, 0, 100), self.police)
+        self.last_tick += active * HOUR_SECONDS
+
+    def _keep_customers(self, keep: "np.ndarray") -> None:
+        self.c_owner = self.c_owner[keep]
+        self.c_hardcore = self.c_hardcore[keep]
+        self.c_suspicious = self.c_suspicious[keep]
+        self.c_angry = self.c_angry[keep]
+        self.c_hours = self.c_hours[keep]
+        self.c_rate = self.c_rate[keep]
+        self.c_count = self.c_count[keep]
+
+    def run(self, hours: Sequence[int]) -> None:
+        """Advance cafe ``i`` by ``hours[i]`` hours."""
+        remaining = np.asarray(hours, dtype=np.int64).copy()
+        while True:
+            active = remaining > 0
+            if not active.any():
+                break
+            self.step(active)
+            remaining -= 1
+
+    def store(self, states: Sequence[dict]) -> None:
+        """Write the columns back into the per-user dicts the panels read."""
+        bounds = np.searchsorted(self.c_owner, np.arange(self.n + 1))
+        earnings = np.array(self.earnings) if self.earnings else np.zeros((0, self.n))
+        open_hours = np.array(self.open_hours) if self.open_hours else np.zeros((0, self.n), dtype=bool)
+        for i, state in enumerate(states):
+            state["cash"] = _scalar(self.cash[i])
+            state["broken_pcs"] = int(self.broken[i])
+            state["overheating"] = int(self.overheating[i])
+            state["bills"] = _scalar(self.bills[i])
+            state["reputation"] = float(self.reputation[i])
+            state["is_open"] = bool(self.is_open[i])
+            state["last_tick"] = float(self.last_tick[i])
+            state["alerts"]["viruses"] = int(self.viruses[i])
+            state["alerts"]["fire"] = int(self.fire[i])
+            state["alerts"]["police"] = _scalar(self.police[i])
+            if self.review[i] >= 0:
+                state["latest_review"] = REVIEWS[self.review[i]]
+            if self.customers_touched[i]:
+                lo, hi = bounds[i], bounds[i + 1]
+                state["customers"] = [
+                    [
+                        HARDCORE * bool(self.c_hardcore[j])
+                        | SUSPICIOUS * bool(self.c_suspicious[j])
+                        | ANGRY * bool(self.c_angry[j]),
+                        int(self.c_hours[j]),
+                        _scalar(self.c_rate[j]),
+                        int(self.c_count[j]),
+                    ]
+                    for j in range(lo, hi)
+                ]
+            opened = open_hours[:, i]
+            if opened.any():
+                for amount in earnings[opened, i]:
+                    add_profit(state, _scalar(amount))
+                state["daily_profit"] = compute_daily_profit(state)
+
+
+def _scalar(value: float):
+    # Keep whole numbers as ints so data.json looks the same as with apply_hour.
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def advance(states: Sequence[dict], hours: Sequence[int], rng: Optional["np.random.Generator"] = None) -> None:
+    """Advance ``states[i]`` by ``hours[i]`` hours in place."""
+    if not states:
+        return
+    engine = VectorEngine(states, rng=rng)
+    engine.run(hours)
+    engine.store(states)